@@ -0,0 +1,79 @@
+"""
+Per-save cost of diffing the geometry of a large polygon
+
+    PYTHONPATH=tests python benchmarks/geometry.py
+
+Compares writing both geometries as WKT to compare them (the former
+update_diff) with the WKB check done first, for an unchanged and for a
+modified 5000 vertex polygon, and with geom_format = 'wkb'.
+"""
+import datetime
+import math
+import os
+import sys
+import timeit
+
+import django
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.path.pardir))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+django.setup()
+
+from django.contrib.gis.geos import (GEOSGeometry, Polygon,  # noqa: E402
+                                     WKTWriter)
+
+from core.models import PersonGeoModel  # noqa: E402
+from modeldiff import codec  # noqa: E402
+from modeldiff.models import (HexWKBWriter, get_values,  # noqa: E402
+                              update_diff)
+
+
+def polygon(vertices=5000, radius=1.0):
+    coords = [(radius * math.cos(2 * math.pi * i / vertices),
+               radius * math.sin(2 * math.pi * i / vertices))
+              for i in range(vertices)]
+    coords.append(coords[0])
+    return Polygon(coords, srid=4326)
+
+
+def former_geom_diff(old_geom, instance, wkt_w):
+    # what update_diff did before: write both, compare the strings
+    old_values = get_values(instance)
+    old_values['the_geom'] = wkt_w.write(old_geom).decode()
+    new_value = wkt_w.write(instance.the_geom).decode()
+    new_values = {}
+    if new_value != old_values['the_geom']:
+        new_values['the_geom'] = new_value
+    return codec.dumps(old_values), codec.dumps(new_values)
+
+
+def main(number=200):
+    # the_geom is a PointField, let it hold polygons here
+    PersonGeoModel.the_geom._klass = GEOSGeometry
+    person = PersonGeoModel(
+        pk=1, name='Foo',
+        updated_at=datetime.datetime(2015, 1, 7, tzinfo=datetime.timezone.utc))
+    old_geom = polygon()
+    wkt_w = WKTWriter(precision=8)
+    wkb_w = HexWKBWriter()
+
+    for case, new_geom in (('unchanged', polygon()),
+                           ('changed', polygon(radius=2.0))):
+        person.the_geom = new_geom
+
+        def diff(writer):
+            old_values = get_values(person)
+            old_values['the_geom'] = old_geom
+            return update_diff(old_values, person, writer)
+
+        for name, func in (('wkt strings', lambda: former_geom_diff(
+                               old_geom, person, wkt_w)),
+                           ('wkb check', lambda: diff(wkt_w)),
+                           ('wkb format', lambda: diff(wkb_w))):
+            seconds = min(timeit.repeat(func, number=number, repeat=5))
+            print('%-10s %-12s %8.1f us/save' % (case, name,
+                                                 seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
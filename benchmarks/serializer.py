@@ -0,0 +1,57 @@
+"""
+Per-save cost of reading the tracked values of an instance
+
+    PYTHONPATH=tests python benchmarks/serializer.py
+
+Compares the former model_to_dict() + isinstance ladder with the
+serializer compiled once per model (modeldiff.serializers).
+"""
+import datetime
+import os
+import sys
+import timeit
+
+import django
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.path.pardir))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+django.setup()
+
+from django.forms.models import model_to_dict  # noqa: E402
+
+from core.models import PersonModel  # noqa: E402
+from modeldiff.serializers import get_serializer  # noqa: E402
+
+
+def model_to_dict_values(instance):
+    fields = instance.Modeldiff.fields
+    values_temp = model_to_dict(instance, fields=fields)
+    values = {}
+    for k in fields:
+        value = values_temp[k]
+        if isinstance(value, datetime.datetime):
+            value = value.strftime("%Y-%m-%d %H:%M:%S.%f%z")
+        else:
+            if isinstance(value, datetime.date):
+                value = value.strftime("%Y-%m-%d")
+        values[k] = value
+    return values
+
+
+def main(number=100000):
+    person = PersonModel(
+        pk=1, name='Foo', surname='Doe', birthdate=datetime.date(2007, 12, 5),
+        updated_at=datetime.datetime(2015, 1, 7, 22, 0, 10, 292032,
+                                     datetime.timezone.utc))
+    serializer = get_serializer(PersonModel)
+    assert serializer(person) == model_to_dict_values(person)
+
+    for name, func in (('model_to_dict', model_to_dict_values),
+                       ('compiled', serializer)):
+        seconds = min(timeit.repeat(lambda: func(person), number=number,
+                                    repeat=5))
+        print('%-14s %6.2f us/save' % (name, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Spatial queries on a large Geomodeldiff table
+
+    PYTHONPATH=tests python benchmarks/spatial.py [count]
+
+Needs a spatial database (SpatiaLite or PostGIS, see tests/settings.py), a
+test database is created and destroyed. Inserts count (2 million by
+default) diffs of synthetic points and small polygons spread over a year,
+then times changes_in_bbox() for a small bounding box, with and without a
+since filter, against the same envelope__intersects filter without the
+SpatiaLite index subquery (the same query on PostGIS).
+"""
+import datetime
+import os
+import random
+import sys
+import time
+
+import django
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.path.pardir))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+django.setup()
+
+from django.contrib.gis.geos import Point, Polygon  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from modeldiff.models import Geomodeldiff, get_envelope  # noqa: E402
+
+
+def random_geom():
+    x = random.uniform(-180, 179)
+    y = random.uniform(-90, 89)
+    if random.random() < 0.5:
+        return Point(x, y, srid=4326)
+    size = random.uniform(0.001, 0.1)
+    return Polygon.from_bbox((x, y, x + size, y + size))
+
+
+def insert_diffs(count, chunk_size=10000):
+    start = timezone.now() - datetime.timedelta(days=365)
+    step = datetime.timedelta(days=365) / count
+    for offset in range(0, count, chunk_size):
+        diffs = []
+        for i in range(offset, min(offset + chunk_size, count)):
+            geom = random_geom()
+            geom.srid = 4326
+            diffs.append(Geomodeldiff(
+                date_created=start + step * i, model_name='bench.Feature',
+                model_id=i, action='update', old_data='{}',
+                new_data='{}', the_geom=geom, envelope=get_envelope(geom)))
+        with transaction.atomic():
+            Geomodeldiff.objects.bulk_create(diffs)
+
+
+def timed(queryset, number=5):
+    best = None
+    for i in range(number):
+        start = time.perf_counter()
+        count = len(list(queryset.values_list('id', flat=True)))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count, best
+
+
+def main(count=2000000):
+    random.seed(0)
+    name = connection.creation.create_test_db(verbosity=0)
+    try:
+        start = time.perf_counter()
+        insert_diffs(count)
+        print('%d diffs inserted in %.1f s on %s' % (
+            count, time.perf_counter() - start, name))
+
+        bbox = (2.0, 41.0, 3.0, 42.0)
+        since = timezone.now() - datetime.timedelta(days=30)
+        polygon = Polygon.from_bbox(bbox)
+        polygon.srid = 4326
+        cases = (
+            ('changes_in_bbox', Geomodeldiff.objects.changes_in_bbox(bbox)),
+            ('changes_in_bbox since', Geomodeldiff.objects.changes_in_bbox(
+                bbox, since=since)),
+            ('envelope__intersects', Geomodeldiff.objects.filter(
+                envelope__intersects=polygon)),
+        )
+        for case, queryset in cases:
+            found, seconds = timed(queryset)
+            print('%-24s %6d diffs %10.2f ms' % (case, found, seconds * 1e3))
+    finally:
+        connection.creation.destroy_test_db(name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -3,7 +3,7 @@ from django.contrib import admin
 from modeldiff.models import Modeldiff, Geomodeldiff
 from leaflet.admin import LeafletGeoAdmin
 
-from django.apps import apps
+from modeldiff.registry import registry
 
 
 class ModeldiffAdminListFilter(admin.SimpleListFilter):
@@ -11,15 +11,7 @@ class ModeldiffAdminListFilter(admin.SimpleListFilter):
     parameter_name = 'model_name'
 
     def lookups(self, request, model_admin):
-        models_name = ()
-
-        for model in apps.get_models():
-            if hasattr(model, 'Modeldiff') and not hasattr(model.Modeldiff,
-                                                           'geom_field'):
-                models_name = models_name + ((model.Modeldiff.model_name,
-                                              model.Modeldiff.model_name,),)
-
-        return models_name
+        return registry.model_names(geo=False)
 
     def queryset(self, request, queryset):
         if self.value() is None:
@@ -31,15 +23,7 @@ class ModeldiffAdminListFilter(admin.SimpleListFilter):
 class GeomodeldiffAdminListFilter(ModeldiffAdminListFilter):
 
     def lookups(self, request, model_admin):
-        models_name = ()
-
-        for model in apps.get_models():
-            if hasattr(model, 'Modeldiff') and hasattr(model.Modeldiff,
-                                                       'geom_field'):
-                models_name = models_name + ((model.Modeldiff.model_name,
-                                              model.Modeldiff.model_name,),)
-
-        return models_name
+        return registry.model_names(geo=True)
 
 
 class ModeldiffAdmin(gis_admin.ModelAdmin):
@@ -0,0 +1,407 @@
+import heapq
+import multiprocessing
+import queue
+import time
+import zlib
+
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import connections, router, transaction
+
+from modeldiff.compact import get_object_key, squash_diffs
+from modeldiff.geodelta import apply_delta, is_delta
+from modeldiff.models import Geomodeldiff, Modeldiff, ignore_diffs
+from modeldiff.registry import registry
+
+
+class ApplyError(Exception):
+    pass
+
+
+def set_values(obj, values):
+    """
+    Set the values stored in old_data/new_data on obj, return the names of
+    the fields set
+    """
+    names = []
+    for name, value in values.items():
+        field = obj._meta.get_field(name)
+        if isinstance(field, GeometryField):
+            if is_delta(value):
+                geom = getattr(obj, field.attname)
+                if geom is None:
+                    raise ApplyError('Geometry delta without a geometry')
+                value = apply_delta(geom, value)
+            elif value:
+                value = GEOSGeometry(value, srid=field.srid)
+            else:
+                value = None
+        elif value is not None:
+            value = field.to_python(value)
+        setattr(obj, field.attname, value)
+        names.append(field.name)
+    return names
+
+
+def get_lookup(model, diff):
+    """
+    Return the (field name, value) used to find the object of diff
+    """
+    unique_field = registry.get(model).unique_field
+    if unique_field and diff.unique_id:
+        # unique_id is stored as text
+        field = model._meta.get_field(unique_field)
+        return unique_field, field.to_python(diff.unique_id)
+    return 'pk', diff.model_id
+
+
+class DiffApplier(object):
+    """
+    Applies diffs to the database using, without generating new diffs
+    """
+    def __init__(self, using=None):
+        self.using = using
+        self.stats = {'add': 0, 'update': 0, 'delete': 0, 'missing': 0}
+
+    def apply_batch(self, diffs):
+        objects = self.load_objects(diffs)
+        for diff in diffs:
+            model = registry.get_model(diff.model_name)
+            if model is None:
+                raise ApplyError('Diff %d: unknown model_name %s' %
+                                 (diff.pk, diff.model_name))
+            key = (model,) + get_lookup(model, diff)
+            try:
+                objects[key] = self.apply(model, diff, objects.get(key))
+            except Exception as e:
+                raise ApplyError('Diff %d: %s' % (diff.pk, e)) from e
+
+    def apply_and_mark(self, diffs, compact=False):
+        """
+        Apply diffs in a transaction and mark them as applied, in the same
+        transaction when the diffs live in the target database, right after
+        it commits otherwise. With compact the diffs of each object are
+        squashed before applying them
+        """
+        target_db = self.using or router.db_for_write(Modeldiff)
+        same_db = router.db_for_write(Modeldiff) == target_db
+        with transaction.atomic(using=target_db):
+            self.apply_batch(squash_diffs(diffs) if compact else diffs)
+            if same_db:
+                mark_applied(diffs)
+        if not same_db:
+            mark_applied(diffs)
+
+    def load_objects(self, diffs):
+        """
+        Fetch the objects of diffs with one query per model and lookup field
+        """
+        lookups = {}
+        for diff in diffs:
+            model = registry.get_model(diff.model_name)
+            if model is not None:
+                field_name, value = get_lookup(model, diff)
+                lookups.setdefault((model, field_name), set()).add(value)
+
+        objects = {}
+        for (model, field_name), values in lookups.items():
+            manager = model._base_manager.db_manager(self.db_for(model))
+            values.discard(None)
+            found = manager.in_bulk(values, field_name=field_name)
+            for value, obj in found.items():
+                objects[(model, field_name, value)] = obj
+        return objects
+
+    def db_for(self, model):
+        return self.using or router.db_for_write(model)
+
+    def apply(self, model, diff, obj):
+        """
+        Apply diff to obj (None if it does not exist), return the object
+        """
+        if diff.action == 'delete':
+            if obj is None:
+                self.stats['missing'] += 1
+                return None
+            # no diffs for obj nor for the objects deleted in cascade
+            with ignore_diffs(self.db_for(model)):
+                obj.delete(using=self.db_for(model))
+            self.stats['delete'] += 1
+            return None
+
+        if obj is None and diff.action == 'update':
+            self.stats['missing'] += 1
+            return None
+
+        kwargs = {'modeldiff_ignore': True, 'using': self.db_for(model)}
+        if obj is None:
+            obj = model()
+            field_name, value = get_lookup(model, diff)
+            if field_name == 'pk':
+                obj.pk = value
+            kwargs['force_insert'] = True
+            set_values(obj, diff.new_values)
+        else:
+            kwargs['update_fields'] = set_values(obj, diff.new_values)
+            if not kwargs['update_fields']:
+                self.stats[diff.action] += 1
+                return obj
+
+        obj.save(**kwargs)
+        self.stats[diff.action] += 1
+        return obj
+
+
+def iter_diffs(querysets, batch_size):
+    """
+    Stream the diffs of querysets, merged by date_created, reading each one
+    in id order with keyset pagination
+    """
+    def stream(queryset):
+        last_id = 0
+        while True:
+            diffs = list(queryset.filter(id__gt=last_id).order_by('id')
+                         [:batch_size])
+            if not diffs:
+                return
+            for diff in diffs:
+                yield diff
+            last_id = diffs[-1].id
+
+    return heapq.merge(*[stream(queryset) for queryset in querysets],
+                       key=lambda diff: diff.date_created)
+
+
+def iter_batches(diffs, batch_size):
+    batch = []
+    for diff in diffs:
+        batch.append(diff)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def mark_applied(diffs):
+    ids = {}
+    for diff in diffs:
+        ids.setdefault(diff.__class__, []).append(diff.pk)
+    for diff_class, class_ids in ids.items():
+        diff_class.objects.filter(pk__in=class_ids).update(applied=True)
+
+
+def pending_querysets(key=None):
+    querysets = []
+    for diff_class in (Modeldiff, Geomodeldiff):
+        if key is None:
+            querysets.append(diff_class.objects.filter(applied=False))
+        else:
+            querysets.append(diff_class.objects.pending(key))
+    return querysets
+
+
+def apply_diffs(querysets=None, using=None, batch_size=1000, compact=False):
+    """
+    Apply the unapplied diffs of querysets (by default all the pending
+    Modeldiff and Geomodeldiff) to the database using, in batches of
+    batch_size diffs, each one in a transaction. Objects are found by
+    Modeldiff.unique_field if set, by model_id otherwise. With compact the
+    diffs of each object in a batch are squashed into one before applying
+    them (see modeldiff.compact).
+
+    Return the number of objects added, updated, deleted and missing
+    """
+    if querysets is None:
+        querysets = pending_querysets()
+    querysets = [queryset.filter(applied=False) for queryset in querysets]
+
+    applier = DiffApplier(using)
+    diffs = iter_diffs(querysets, batch_size)
+    for batch in iter_batches(diffs, batch_size):
+        applier.apply_and_mark(batch, compact)
+    return applier.stats
+
+
+DIFF_CLASSES = (Modeldiff, Geomodeldiff)
+
+# seconds between the checks that the worker processes are alive
+POLL_INTERVAL = 1
+
+
+def get_partition(diff, partitions):
+    """
+    Return the partition of the object of diff, stable across processes so
+    all the diffs of an object go to the same worker
+    """
+    key = ('%s:%s' % get_object_key(diff)).encode('utf8')
+    return zlib.crc32(key) % partitions
+
+
+def partition_batches(diffs, partitions, batch_size):
+    """
+    Split the ordered diffs in partitions, yield (partition, batch) with
+    batches of (diff class index, diff id) keeping the order of diffs
+    """
+    batches = [[] for i in range(partitions)]
+    for diff in diffs:
+        partition = get_partition(diff, partitions)
+        batch = batches[partition]
+        batch.append((DIFF_CLASSES.index(diff.__class__), diff.pk))
+        if len(batch) == batch_size:
+            yield partition, batch
+            batches[partition] = []
+    for partition, batch in enumerate(batches):
+        if batch:
+            yield partition, batch
+
+
+def load_batch(batch):
+    """
+    Load the diffs of a (diff class index, diff id) batch, in batch order
+    """
+    ids = {}
+    for index, pk in batch:
+        ids.setdefault(index, []).append(pk)
+    diffs = {}
+    for index, class_ids in ids.items():
+        for pk, diff in DIFF_CLASSES[index].objects.in_bulk(
+                class_ids).items():
+            diffs[(index, pk)] = diff
+    return [diffs[item] for item in batch if item in diffs]
+
+
+def run_worker(tasks, results, using=None, compact=False):
+    """
+    Apply the batches read from tasks until None, each one in a
+    transaction. After an error the remaining batches are skipped, so the
+    diffs of an object are never applied out of order. The stats (and the
+    error, if any) are put in results
+    """
+    applier = DiffApplier(using)
+    error = None
+    while True:
+        batch = tasks.get()
+        if batch is None:
+            break
+        if error is not None:
+            continue
+        try:
+            applier.apply_and_mark(load_batch(batch), compact)
+        except Exception as e:
+            error = str(e)
+    results.put((applier.stats, error))
+
+
+def _worker_main(tasks, results, using, compact):
+    # never reuse the connections inherited from the parent process
+    connections.close_all()
+    try:
+        run_worker(tasks, results, using, compact)
+    finally:
+        connections.close_all()
+
+
+def put_task(tasks, process, batch):
+    """
+    Put batch in the tasks of the worker process, return False if the
+    worker died and its queue is full
+    """
+    while True:
+        try:
+            tasks.put(batch, timeout=POLL_INTERVAL)
+            return True
+        except queue.Full:
+            if not process.is_alive():
+                return False
+
+
+def get_result(results, process):
+    """
+    Return the (stats, error) put in results by the worker process, an
+    error if it died without putting them
+    """
+    while process.is_alive():
+        try:
+            return results.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            pass
+    # it may have exited right after putting them
+    try:
+        return results.get(timeout=POLL_INTERVAL)
+    except queue.Empty:
+        return {}, 'Worker %s exited with code %s' % (
+            process.name, process.exitcode)
+
+
+def collect_results(results, processes):
+    """
+    Wait for the workers, return their summed stats and errors
+    """
+    stats = {'add': 0, 'update': 0, 'delete': 0, 'missing': 0}
+    errors = []
+    for worker_results, process in zip(results, processes):
+        worker_stats, error = get_result(worker_results, process)
+        for action, value in worker_stats.items():
+            stats[action] += value
+        if error is not None:
+            errors.append(error)
+    for process in processes:
+        process.join()
+    return stats, errors
+
+
+def apply_diffs_parallel(querysets=None, using=None, workers=None,
+                         batch_size=1000, compact=False):
+    """
+    Apply the unapplied diffs of querysets like apply_diffs() with workers
+    processes (by default one per CPU), each one with its own database
+    connection.
+
+    Diffs are partitioned by object, so the diffs of an object are applied
+    by the same worker in date_created order, but the diffs of different
+    objects are applied in any order. Workers are forked, so this is only
+    available on POSIX systems. The errors of the workers, and the workers
+    that die without reporting (killed, out of memory), raise ApplyError.
+
+    Return the stats of apply_diffs() plus the number of diffs applied and
+    the elapsed seconds
+    """
+    if querysets is None:
+        querysets = pending_querysets()
+    querysets = [queryset.filter(applied=False).only(
+        'id', 'date_created', 'model_name', 'model_id', 'unique_id')
+        for queryset in querysets]
+    workers = workers or multiprocessing.cpu_count()
+
+    start = time.monotonic()
+    context = multiprocessing.get_context('fork')
+    connections.close_all()
+    queues = [context.Queue(maxsize=4) for i in range(workers)]
+    results = [context.Queue() for i in range(workers)]
+    processes = [context.Process(target=_worker_main,
+                                 args=(tasks, worker_results, using, compact))
+                 for tasks, worker_results in zip(queues, results)]
+    for process in processes:
+        process.start()
+
+    count = 0
+    try:
+        diffs = iter_diffs(querysets, batch_size)
+        for partition, batch in partition_batches(diffs, workers,
+                                                  batch_size):
+            if not put_task(queues[partition], processes[partition], batch):
+                # get_result() reports the error
+                break
+            count += len(batch)
+    finally:
+        for tasks, process in zip(queues, processes):
+            put_task(tasks, process, None)
+
+    stats, errors = collect_results(results, processes)
+    if errors:
+        raise ApplyError('; '.join(errors))
+
+    stats['diffs'] = count
+    stats['elapsed'] = time.monotonic() - start
+    return stats
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ModeldiffConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'modeldiff'
+
+    def ready(self):
+        from modeldiff.registry import registry
+        registry.populate(self.apps.get_models())
@@ -0,0 +1,203 @@
+from contextlib import ContextDecorator
+
+from django.db import connections, router, transaction
+
+
+class DiffBuffer(object):
+    """
+    Diffs produced inside a buffer_diffs() block, kept in memory until the
+    block ends
+    """
+    def __init__(self, using):
+        self.using = using
+        self.entries = []
+        self.parents = []
+
+    def mark(self):
+        # Django discards the on_commit callbacks registered inside a rolled
+        # back savepoint, use one as a marker to discard the entries too
+        marker = _Marker()
+        transaction.on_commit(marker, using=self.using)
+        return marker
+
+    def alive(self, entries):
+        """
+        Return the values of the (marker, value) entries not rolled back
+        """
+        connection = connections[self.using]
+        alive = set(id(callback[1]) for callback in connection.run_on_commit)
+        return [value for marker, value in entries if id(marker) in alive]
+
+    def add(self, diffs):
+        self.entries.append((self.mark(), diffs))
+
+    def touch(self, parent_model, parent_ids):
+        """
+        Mark the parents (Modeldiff.parent_field) with parent_ids to be
+        saved once at the end of the block
+        """
+        self.parents.append((self.mark(), (parent_model, set(parent_ids))))
+
+    def pop_diffs(self):
+        """
+        Return the buffered diffs that were not rolled back, and empty the
+        buffer
+        """
+        diffs = []
+        for entry_diffs in self.alive(self.entries):
+            diffs.extend(entry_diffs)
+        self.entries = []
+        return diffs
+
+    def save_parents(self):
+        """
+        Save once each parent touched inside the block and each of their
+        ancestors (multi-level parent chains), children before parents.
+        The objects of each model and level are loaded with one query. The
+        buffer must still be active, so the diffs of these saves are
+        buffered after the diffs of the children
+        """
+        from modeldiff.models import touch
+
+        saved = set()
+        while self.parents:
+            touched = {}
+            for parent_model, parent_ids in self.alive(self.parents):
+                touched.setdefault(parent_model, set()).update(parent_ids)
+            self.parents = []
+
+            # these saves touch the ancestors again, they are skipped in the
+            # next round as already saved
+            ancestors = self.get_ancestors(touched, saved)
+            for level, parent_model, parent_id, obj in sorted(
+                    ancestors, key=lambda item: (
+                        item[0], item[1]._meta.label, item[2])):
+                saved.add((parent_model, parent_id))
+                touch(obj)
+
+    def get_ancestors(self, touched, saved):
+        """
+        Return (level, model, pk, obj) for the objects touched (ids by
+        model) and their ancestors not saved yet, an object reached at
+        several levels keeps the highest one so it is saved after all its
+        descendants
+        """
+        from modeldiff.models import get_parent_ids
+
+        objs = {}
+        levels = {}
+        level = 0
+        while touched and level <= len(levels):
+            level += 1
+            parents = {}
+            for model, ids in touched.items():
+                ids = set(pk for pk in ids if (model, pk) not in saved)
+                missing = [pk for pk in ids if (model, pk) not in objs]
+                for pk, obj in model._base_manager.db_manager(
+                        self.using).in_bulk(missing).items():
+                    objs[(model, pk)] = obj
+                found = [objs[(model, pk)] for pk in ids
+                         if (model, pk) in objs]
+                for obj in found:
+                    levels[(model, obj.pk)] = level
+                if found and hasattr(model, 'Modeldiff'):
+                    parent_model, parent_ids = get_parent_ids(model, found)
+                    if parent_ids:
+                        parents.setdefault(parent_model, set()).update(
+                            parent_ids)
+            touched = parents
+        return [(level, model, pk, objs[(model, pk)])
+                for (model, pk), level in levels.items()]
+
+
+class _Marker(object):
+    def __call__(self):
+        pass
+
+
+def get_buffer(diff_class):
+    """
+    Return the active DiffBuffer for the database of diff_class, if any
+    """
+    using = router.db_for_write(diff_class)
+    return getattr(connections[using], 'modeldiff_buffer', None)
+
+
+class buffer_diffs(ContextDecorator):
+    """
+    Context manager (or decorator) that opens an atomic block where all the
+    diffs are buffered in memory and written with one bulk_create per diff
+    model at the end of the block.
+
+    By default the diffs are written just before the transaction commits,
+    with on_commit=True they are written after it commits. Diffs are
+    discarded on rollback, including the ones made inside a rolled back
+    inner atomic block.
+
+    The parents (Modeldiff.parent_field) of the objects saved or deleted
+    inside the block are not saved each time, they are saved once at the
+    end of the block, with a single diff.
+
+        with buffer_diffs():
+            for pizza in pizzas:
+                pizza.save()
+    """
+    def __init__(self, using=None, on_commit=False):
+        self.using = using
+        self.on_commit = on_commit
+
+    def __enter__(self):
+        from modeldiff.models import Modeldiff
+
+        self.db = self.using or router.db_for_write(Modeldiff)
+        connection = connections[self.db]
+        self.atomic = transaction.atomic(using=self.db)
+        self.atomic.__enter__()
+
+        # nested blocks use the outermost buffer
+        self.buffer = None
+        if getattr(connection, 'modeldiff_buffer', None) is None:
+            self.buffer = connection.modeldiff_buffer = DiffBuffer(self.db)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        from modeldiff.models import save_diffs
+
+        if self.buffer is None:
+            return self.atomic.__exit__(exc_type, exc_value, traceback)
+
+        connection = connections[self.db]
+        if exc_type is not None:
+            connection.modeldiff_buffer = None
+            return self.atomic.__exit__(exc_type, exc_value, traceback)
+
+        try:
+            try:
+                # the parent saves are buffered too
+                self.buffer.save_parents()
+            finally:
+                connection.modeldiff_buffer = None
+            diffs = self.buffer.pop_diffs()
+            if self.on_commit:
+                transaction.on_commit(lambda: save_diffs(diffs),
+                                      using=self.db)
+            else:
+                save_diffs(diffs)
+        except Exception as e:
+            self.atomic.__exit__(type(e), e, e.__traceback__)
+            raise
+        return self.atomic.__exit__(None, None, None)
+
+
+class BufferDiffsMiddleware(object):
+    """
+    Middleware running each request inside buffer_diffs(), so its diffs
+    are written with one bulk_create per diff model and each parent is
+    saved once. The request runs in a single transaction
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with buffer_diffs():
+            return self.get_response(request)
@@ -0,0 +1,215 @@
+"""
+JSON codec for the old_data and new_data of the diffs, selected with the
+MODELDIFF_JSON_CODEC setting: 'json' (default), 'orjson' or 'ujson'.
+
+All the codecs keep the key order and produce standard JSON, so the data
+written by any of them can be read by the others (or by json.loads). Only
+the whitespace differs: orjson and ujson write compact JSON, and orjson
+writes non ASCII characters as UTF-8 instead of escaping them.
+
+With the MODELDIFF_COMPRESSION setting, 'zlib' or 'zstd' (needs the
+zstandard package), the JSON of at least MODELDIFF_COMPRESSION_MIN_SIZE
+characters (256 by default) is stored compressed, as base64 after a prefix
+naming the compression, when that is shorter. loads() reads both, whatever
+the current setting. MODELDIFF_COMPRESSION_DICTIONARIES maps a model_name
+to a trained zstd dictionary file (see the modeldiff_train_dictionary
+command), or to a list of them: the first one compresses, all of them
+decompress.
+"""
+import base64
+import json
+import threading
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+
+def _json_codec():
+    return json.dumps, json.loads
+
+
+def _orjson_codec():
+    import orjson
+
+    def dumps(value):
+        return orjson.dumps(value).decode('utf8')
+    return dumps, orjson.loads
+
+
+def _ujson_codec():
+    import ujson
+
+    def dumps(value):
+        return ujson.dumps(value, escape_forward_slashes=False)
+    return dumps, ujson.loads
+
+
+CODECS = {
+    'json': _json_codec,
+    'orjson': _orjson_codec,
+    'ujson': _ujson_codec,
+}
+
+_codecs = {}
+
+
+def get_codec(name=None):
+    """
+    Return the (dumps, loads) functions of the codec name, by default the
+    one in MODELDIFF_JSON_CODEC. name may also be the dotted path of a
+    function returning them
+    """
+    if name is None:
+        name = getattr(settings, 'MODELDIFF_JSON_CODEC', 'json')
+
+    try:
+        return _codecs[name]
+    except KeyError:
+        pass
+
+    try:
+        factory = CODECS[name] if name in CODECS else import_string(name)
+        _codecs[name] = factory()
+    except ImportError as e:
+        raise ImproperlyConfigured(
+            'Cannot load the MODELDIFF_JSON_CODEC %r: %s' % (name, e))
+    return _codecs[name]
+
+
+class ZlibCompression(object):
+    prefix = 'z:'
+
+    def compress(self, data, model_name=None):
+        return zlib.compress(data)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class ZstdCompression(object):
+    """
+    zstd, with the dictionary of model_name if any. The id of the
+    dictionary is written in the frame, so decompress() finds it
+    """
+    prefix = 's:'
+    level = 3
+
+    def __init__(self):
+        import zstandard
+
+        self.zstandard = zstandard
+        self.dictionaries = {}
+        self.by_id = {0: None}
+        setting = getattr(settings, 'MODELDIFF_COMPRESSION_DICTIONARIES', {})
+        for model_name, paths in setting.items():
+            if isinstance(paths, str):
+                paths = [paths]
+            for i, path in enumerate(paths):
+                with open(path, 'rb') as f:
+                    dictionary = zstandard.ZstdCompressionDict(f.read())
+                dictionary.precompute_compress(level=self.level)
+                if i == 0:
+                    self.dictionaries[model_name] = dictionary
+                self.by_id[dictionary.dict_id()] = dictionary
+        # compressors and decompressors are not thread safe
+        self.local = threading.local()
+
+    def get(self, kind, dictionary):
+        cache = self.local.__dict__.setdefault(kind, {})
+        key = id(dictionary)
+        if key not in cache:
+            factory = (self.zstandard.ZstdCompressor if kind == 'compress'
+                       else self.zstandard.ZstdDecompressor)
+            kwargs = {'level': self.level} if kind == 'compress' else {}
+            cache[key] = factory(dict_data=dictionary, **kwargs)
+        return cache[key]
+
+    def compress(self, data, model_name=None):
+        dictionary = self.dictionaries.get(model_name)
+        return self.get('compress', dictionary).compress(data)
+
+    def decompress(self, data):
+        dict_id = self.zstandard.get_frame_parameters(data).dict_id
+        try:
+            dictionary = self.by_id[dict_id]
+        except KeyError:
+            raise ImproperlyConfigured(
+                'The zstd dictionary %d is not in '
+                'MODELDIFF_COMPRESSION_DICTIONARIES' % dict_id)
+        return self.get('decompress', dictionary).decompress(data)
+
+
+COMPRESSIONS = {
+    'zlib': ZlibCompression,
+    'zstd': ZstdCompression,
+}
+
+PREFIXES = dict((compression.prefix, name)
+                for name, compression in COMPRESSIONS.items())
+
+_compressions = {}
+
+
+def get_compression(name):
+    try:
+        return _compressions[name]
+    except KeyError:
+        pass
+
+    if name not in COMPRESSIONS:
+        raise ImproperlyConfigured(
+            'Unknown MODELDIFF_COMPRESSION %r, use zlib or zstd' % name)
+    try:
+        _compressions[name] = COMPRESSIONS[name]()
+    except ImportError as e:
+        raise ImproperlyConfigured(
+            'Cannot load the MODELDIFF_COMPRESSION %r: %s' % (name, e))
+    return _compressions[name]
+
+
+def compress(text, model_name=None):
+    """
+    Return the JSON text compressed with MODELDIFF_COMPRESSION if set and
+    shorter, text otherwise
+    """
+    name = getattr(settings, 'MODELDIFF_COMPRESSION', None)
+    if (not name or len(text) <
+            getattr(settings, 'MODELDIFF_COMPRESSION_MIN_SIZE', 256)):
+        return text
+
+    compression = get_compression(name)
+    data = base64.b64encode(compression.compress(text.encode('utf8'),
+                                                 model_name))
+    if len(data) + len(compression.prefix) >= len(text):
+        return text
+    return compression.prefix + data.decode('ascii')
+
+
+def decompress(data):
+    """
+    Return the JSON text of old_data or new_data, compressed or not
+    """
+    name = PREFIXES.get(data[:2])
+    if name is None:
+        return data
+    compression = get_compression(name)
+    return compression.decompress(base64.b64decode(data[2:])).decode('utf8')
+
+
+def dumps(value, model_name=None):
+    """
+    Encode old_data or new_data, compressed with MODELDIFF_COMPRESSION (and
+    the dictionary of model_name) if set
+    """
+    return compress(get_codec()[0](value), model_name)
+
+
+def loads(data):
+    """
+    Decode old_data or new_data, an empty string is an empty dict
+    """
+    if not data:
+        return {}
+    return get_codec()[1](decompress(data))
@@ -0,0 +1,147 @@
+"""
+Compaction of the diffs of an object: a run of successive diffs is squashed
+into one equivalent diff.
+
+    add + update...          -> add
+    update + update...       -> update
+    update... + delete       -> delete
+    add + update... + delete -> nothing
+
+Diffs from different keys, or with a different applied flag, are never
+squashed together, and neither are diffs storing a geometry delta (see
+modeldiff.geodelta).
+"""
+import copy
+
+from django.db import transaction
+from django.db.models import Count
+
+from modeldiff import codec
+from modeldiff.geodelta import is_delta
+from modeldiff.models import Geomodeldiff, get_envelope
+
+
+def get_object_key(diff):
+    """
+    Return the key identifying the object of diff
+    """
+    return diff.model_name, diff.unique_id or diff.model_id
+
+
+def set_data(diff, old_values, new_values):
+    diff.old_data = (codec.dumps(old_values, diff.model_name)
+                     if old_values else '')
+    diff.new_data = (codec.dumps(new_values, diff.model_name)
+                     if new_values else '')
+    if diff.action == 'delete':
+        diff.changed_fields = list(old_values)
+    else:
+        diff.changed_fields = list(new_values)
+
+
+def combine(first, second):
+    """
+    Return the diffs equivalent to first followed by second, two diffs of
+    the same object: [] if they cancel out, [first, second] if they cannot
+    be squashed. The squashed diff is a copy of second, so it keeps its id,
+    date_created and geometry, with the envelope of both
+    """
+    if (first.key != second.key or first.applied != second.applied or
+            first.action == 'delete' or second.action == 'add'):
+        return [first, second]
+    if any(is_delta(value) for value in second.new_values.values()):
+        # geometry deltas only apply to the previous version
+        return [first, second]
+
+    if second.action == 'delete':
+        if first.action == 'add':
+            return []
+        new_values = {}
+    else:
+        new_values = first.new_values
+        new_values.update(second.new_values)
+
+    if first.action == 'add':
+        old_values = {}
+    else:
+        # the oldest value of each field wins
+        old_values = second.old_values
+        old_values.update(first.old_values)
+
+    diff = copy.copy(second)
+    diff.action = second.action if second.action == 'delete' else first.action
+    set_data(diff, old_values, new_values)
+    if isinstance(diff, Geomodeldiff):
+        diff.envelope = get_envelope(first.envelope, second.envelope)
+    return [diff]
+
+
+def squash(diffs):
+    """
+    Squash diffs, the ordered diffs of one object
+    """
+    result = []
+    for diff in diffs:
+        if result:
+            result[-1:] = combine(result[-1], diff)
+        else:
+            result.append(diff)
+    return result
+
+
+def squash_diffs(diffs):
+    """
+    Squash the diffs of each object in diffs (ordered, of any objects), return
+    the resulting diffs in the order of the last diff squashed in each one
+    """
+    groups = {}
+    positions = {}
+    for position, diff in enumerate(diffs):
+        groups.setdefault(get_object_key(diff), []).append(diff)
+        positions[(diff.__class__, diff.pk)] = position
+
+    result = []
+    for group in groups.values():
+        result.extend(squash(group))
+    result.sort(key=lambda diff: positions[(diff.__class__, diff.pk)])
+    return result
+
+
+def compact_history(queryset):
+    """
+    Squash the stored diffs of queryset, object by object. The squashed diff
+    replaces the last diff of its run, the other diffs of the run are
+    deleted.
+
+    Only compact diffs below a watermark every consumer has already read
+    (e.g. queryset.filter(id__lt=watermark)): a consumer positioned inside
+    the compacted range could miss the deletion of an object.
+
+    Return the number of objects compacted and of diffs deleted
+    """
+    diff_class = queryset.model
+    objects = queryset.values('model_name', 'model_id', 'unique_id').annotate(
+        count=Count('id')).filter(count__gt=1).order_by()
+
+    stats = {'objects': 0, 'deleted': 0}
+    for values in objects.iterator():
+        diffs = list(queryset.filter(
+            model_name=values['model_name'], model_id=values['model_id'],
+            unique_id=values['unique_id']).order_by('date_created', 'id'))
+        squashed = squash(diffs)
+        keep = set(diff.pk for diff in squashed)
+        delete_ids = [diff.pk for diff in diffs if diff.pk not in keep]
+        if not delete_ids:
+            continue
+
+        with transaction.atomic(using=queryset.db):
+            diff_class.objects.using(queryset.db).filter(
+                pk__in=delete_ids).delete()
+            fields = ['action', 'old_data', 'new_data', 'changed_fields']
+            if diff_class is Geomodeldiff:
+                fields.append('envelope')
+            diff_class.objects.using(queryset.db).bulk_update(squashed,
+                                                              fields)
+        stats['objects'] += 1
+        stats['deleted'] += len(delete_ids)
+    return stats
@@ -0,0 +1,126 @@
+"""
+Streaming export of the diffs as JSON lines or CSV, read with a server side
+cursor (where the database supports it) so memory stays flat whatever the
+size of the table. Exports resume from the last exported id, that can be
+kept in a state file between runs.
+"""
+import csv
+import datetime
+import json
+import os
+import tempfile
+
+from django.contrib.gis.geos import GEOSGeometry
+
+from modeldiff import codec
+
+FORMATS = ('jsonl', 'csv')
+GEOM_FORMATS = ('wkt', 'wkb')
+
+
+def get_columns(diff_class):
+    return [field.attname for field in diff_class._meta.concrete_fields]
+
+
+def diff_to_row(diff, columns, geom_format='wkt'):
+    """
+    Return the values of columns of diff as JSON serializable values, the
+    geometries as WKT or hex WKB and old_data/new_data as JSON even if
+    stored compressed
+    """
+    row = {}
+    for column in columns:
+        value = getattr(diff, column)
+        if column in ('old_data', 'new_data') and value:
+            value = codec.decompress(value)
+        elif isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        elif isinstance(value, GEOSGeometry):
+            value = value.wkt if geom_format == 'wkt' else value.hex.decode()
+        row[column] = value
+    return row
+
+
+class JSONLinesWriter(object):
+
+    def __init__(self, out, columns):
+        self.out = out
+
+    def write(self, row):
+        self.out.write(json.dumps(row))
+        self.out.write('\n')
+
+
+class CSVWriter(object):
+
+    def __init__(self, out, columns, header=True):
+        self.writer = csv.DictWriter(out, columns)
+        if header:
+            self.writer.writeheader()
+
+    def write(self, row):
+        if row.get('changed_fields') is not None:
+            row['changed_fields'] = json.dumps(row['changed_fields'])
+        self.writer.writerow(row)
+
+
+def export_diffs(queryset, out, format='jsonl', geom_format='wkt',
+                 after_id=0, chunk_size=2000, checkpoint=None, header=True):
+    """
+    Write the diffs of queryset with id greater than after_id to the text
+    file out, in id order. Every chunk_size diffs out is flushed and
+    checkpoint(last_id) is called, if given, so an interrupted export can
+    resume from there.
+
+    Return the number of diffs exported and the last exported id
+    """
+    columns = get_columns(queryset.model)
+    if format == 'csv':
+        writer = CSVWriter(out, columns, header)
+    else:
+        writer = JSONLinesWriter(out, columns)
+
+    diffs = queryset.filter(id__gt=after_id).order_by('id').iterator(
+        chunk_size=chunk_size)
+    count = 0
+    last_id = after_id
+    for diff in diffs:
+        writer.write(diff_to_row(diff, columns, geom_format))
+        count += 1
+        last_id = diff.id
+        if count % chunk_size == 0:
+            out.flush()
+            if checkpoint is not None:
+                checkpoint(last_id)
+
+    out.flush()
+    if checkpoint is not None and count % chunk_size:
+        checkpoint(last_id)
+    return count, last_id
+
+
+class ExportState(object):
+    """
+    Last exported id of each diff table, persisted in a JSON file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+
+    def get(self, name):
+        return self.state.get(name, 0)
+
+    def set(self, name, last_id):
+        self.state[name] = last_id
+        self.save()
+
+    def save(self):
+        # write and rename, the state is never left half written
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
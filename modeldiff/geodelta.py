@@ -0,0 +1,246 @@
+"""
+Geometry deltas. With geom_delta = True in the Modeldiff class, an update
+diff stores the geometry in new_data as the vertices changed since the
+previous version instead of the whole geometry:
+
+    {"ops": [[token, start, end, [[x, y], ...]], ...]}
+
+each op replaces the vertices start:end of a coordinate sequence (a
+linestring or a polygon ring) of the previous geometry, token being its
+position in the parsed WKB (see parse_wkb). The whole geometry
+(a keyframe) is stored instead, and also kept in the_geom, when the
+structure of the geometry changes, when the delta would not be smaller and
+every geom_keyframe diffs of the object (20 by default), so rebuilding a
+version never reads more than that many diffs.
+
+Update diffs of these models don't store the old geometry in old_data, it
+is the geometry of the previous version.
+"""
+import struct
+
+from django.contrib.gis.geos import GEOSGeometry
+from django.db.models import BooleanField, ExpressionWrapper, Q
+
+
+class Sequence(bytes):
+    """
+    The little endian doubles of a coordinate sequence in a WKB
+    """
+
+
+def _read_sequence(wkb, offset, count, dims, tokens):
+    end = offset + count * dims * 8
+    tokens.append(Sequence(wkb[offset:end]))
+    return end
+
+
+def _parse(wkb, offset, tokens):
+    if wkb[offset] != 1:
+        raise ValueError('Only little endian WKB is supported')
+    geom_type, = struct.unpack_from('<I', wkb, offset + 1)
+    # extended WKB as written by GEOS, the Z flag is the high bit
+    dims = 3 if geom_type & 0x80000000 else 2
+    geom_type &= 0xff
+    offset += 5
+
+    if geom_type == 1:
+        # points are never patched, kept as they are
+        end = offset + dims * 8
+        tokens.append(wkb[offset - 5:end])
+        return end, dims
+
+    count, = struct.unpack_from('<I', wkb, offset)
+    if geom_type == 2:
+        tokens.append(wkb[offset - 5:offset])
+        return _read_sequence(wkb, offset + 4, count, dims, tokens), dims
+
+    tokens.append(wkb[offset - 5:offset + 4])
+    offset += 4
+    for i in range(count):
+        if geom_type == 3:
+            ring_count, = struct.unpack_from('<I', wkb, offset)
+            offset = _read_sequence(wkb, offset + 4, ring_count, dims,
+                                    tokens)
+        else:
+            offset, dims = _parse(wkb, offset, tokens)
+    return offset, dims
+
+
+def parse_wkb(wkb):
+    """
+    Split a WKB in tokens: bytes kept as they are and coordinate sequences
+    (Sequence). Return the tokens and the number of dimensions
+    """
+    tokens = []
+    dims = _parse(bytes(wkb), 0, tokens)[1]
+    return tokens, dims
+
+
+def build_wkb(tokens, dims):
+    parts = []
+    for token in tokens:
+        if isinstance(token, Sequence):
+            parts.append(struct.pack('<I', len(token) // (dims * 8)))
+        parts.append(token)
+    return b''.join(parts)
+
+
+def _common_prefix(a, b, size, limit):
+    # binary search, the slices are compared with memcmp
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle * size] == b[:middle * size]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix(a, b, size, limit):
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle * size:] == b[len(b) - middle * size:]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _round(sequence, precision):
+    values = struct.unpack('<%dd' % (len(sequence) // 8), sequence)
+    # + 0.0 turns -0.0 into 0.0, they differ as bytes
+    values = [round(value, precision) + 0.0 for value in values]
+    return Sequence(struct.pack('<%dd' % len(values), *values))
+
+
+def _coords(data, dims, precision):
+    values = struct.unpack('<%dd' % (len(data) // 8), data)
+    if precision is not None:
+        values = [round(value, precision) for value in values]
+    return [list(values[i:i + dims]) for i in range(0, len(values), dims)]
+
+
+def _changed(old, new, size):
+    """
+    Return the start of the vertices changed between the sequences old and
+    new, and their ends in old and new
+    """
+    limit = min(len(old), len(new)) // size
+    start = _common_prefix(old, new, size, limit)
+    suffix = _common_suffix(old, new, size, limit - start)
+    return start, len(old) // size - suffix, len(new) // size - suffix
+
+
+def make_delta(old_geom, new_geom, precision=None):
+    """
+    Return the delta turning old_geom into new_geom, with the coordinates
+    rounded to precision decimals. None if the geometries don't have the
+    same structure or the delta would not be smaller than new_geom
+    """
+    if old_geom is None or new_geom is None:
+        return None
+    old_tokens, dims = parse_wkb(old_geom.wkb)
+    new_tokens, new_dims = parse_wkb(new_geom.wkb)
+    if dims != new_dims or len(old_tokens) != len(new_tokens):
+        return None
+
+    size = dims * 8
+    ops = []
+    total = changed = 0
+    for index, (old, new) in enumerate(zip(old_tokens, new_tokens)):
+        if not isinstance(old, Sequence) or not isinstance(new, Sequence):
+            if old != new:
+                return None
+            continue
+        total += len(new)
+        if old == new:
+            continue
+
+        start, old_end, new_end = _changed(old, new, size)
+        if precision is not None and (new_end - start) * size * 2 > len(new):
+            # the geometry went through a lossy format (WKT), compare the
+            # rounded coordinates
+            old, new = _round(old, precision), _round(new, precision)
+            start, old_end, new_end = _changed(old, new, size)
+        coords = _coords(new[start * size:new_end * size], dims, precision)
+        if coords == _coords(old[start * size:old_end * size], dims,
+                             precision):
+            # changes below the precision
+            continue
+        ops.append([index, start, old_end, coords])
+        changed += new_end - start
+
+    if changed * size * 2 > total:
+        return None
+    return {'ops': ops}
+
+
+def apply_delta(geom, delta):
+    """
+    Return geom with the delta applied
+    """
+    tokens, dims = parse_wkb(geom.wkb)
+    size = dims * 8
+    for index, start, end, coords in delta['ops']:
+        sequence = tokens[index]
+        values = [value for coord in coords for value in coord]
+        patch = struct.pack('<%dd' % len(values), *values)
+        tokens[index] = Sequence(sequence[:start * size] + patch +
+                                 sequence[end * size:])
+    return GEOSGeometry(memoryview(build_wkb(tokens, dims)), srid=geom.srid)
+
+
+def is_delta(value):
+    return isinstance(value, dict)
+
+
+def keyframe_due(instance, diff_class):
+    """
+    Return True if none of the last geom_keyframe - 1 diffs of instance is
+    a keyframe (has the_geom)
+    """
+    interval = getattr(instance.Modeldiff, 'geom_keyframe', 20)
+    keyframes = diff_class.objects.filter(
+        model_name=instance.Modeldiff.model_name,
+        model_id=instance.pk).order_by('-date_created', '-id').annotate(
+        keyframe=ExpressionWrapper(Q(the_geom__isnull=False),
+                                   output_field=BooleanField())).values_list(
+        'keyframe', flat=True)[:interval - 1]
+    keyframes = list(keyframes)
+    return len(keyframes) == interval - 1 and not any(keyframes)
+
+
+def rebuild_geometry(diff, geom_field, srid=None):
+    """
+    Return the geometry of the object right after diff, applying the deltas
+    stored since the previous keyframe
+    """
+    history = diff.__class__.objects.filter(
+        model_name=diff.model_name, model_id=diff.model_id).filter(
+        Q(date_created__lt=diff.date_created) |
+        Q(date_created=diff.date_created, id__lte=diff.id)).order_by(
+        '-date_created', '-id')
+
+    deltas = []
+    for past in history.iterator():
+        if past.action == 'delete':
+            return None
+        new_values = past.new_values
+        if geom_field not in new_values:
+            if past.action == 'add':
+                return None
+            continue
+        value = new_values[geom_field]
+        if is_delta(value):
+            deltas.append(value)
+            continue
+        geom = GEOSGeometry(value, srid=srid) if value else None
+        break
+    else:
+        return None
+
+    for delta in reversed(deltas):
+        geom = apply_delta(geom, delta)
+    return geom
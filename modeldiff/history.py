@@ -0,0 +1,305 @@
+"""
+Point in time reconstruction of tracked objects from their diffs.
+
+    parcel = as_of(ParcelModel, 123, datetime(2024, 3, 1, tzinfo=utc))
+
+replays the diffs of the object from the closest ModeldiffSnapshot (the
+tracked values of the object after one of its diffs) instead of from the
+first diff. Snapshots are stored while replaying, every
+Modeldiff.checkpoint_interval diffs (50 by default), so reconstructing an
+object never replays more than that many diffs once its history has been
+read (see also the modeldiff_checkpoint command).
+
+A snapshot stays valid when older diffs are pruned, so objects keep a
+history from their oldest snapshot on.
+
+model_as_of() rebuilds all the objects of a model in one pass over its
+diffs, ordered by object, keeping a single object in memory.
+
+get_full_old_values() returns the whole state of an object before an update
+diff stored with Modeldiff.minimal_old_data.
+"""
+from django.apps.registry import Apps
+from django.contrib.gis.db import models
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from modeldiff import codec
+from modeldiff.apply import set_values
+from modeldiff.export import CSVWriter, JSONLinesWriter
+from modeldiff.geodelta import is_delta, rebuild_geometry
+from modeldiff.models import (HexWKBWriter, ModeldiffSnapshot,
+                              get_diff_class, get_values, write_geom)
+
+
+def get_checkpoint_interval(model):
+    return getattr(model.Modeldiff, 'checkpoint_interval', 50)
+
+
+def after(diffs, date_created, diff_id):
+    """
+    Filter the diffs after the diff diff_id created at date_created, diffs
+    being ordered by date_created then id
+    """
+    return diffs.filter(Q(date_created__gt=date_created) |
+                        Q(date_created=date_created, id__gt=diff_id))
+
+
+def before(queryset, date_created, diff_id, id_field='id'):
+    """
+    Filter the diffs (or snapshots, with id_field='diff_id') before the
+    diff diff_id created at date_created
+    """
+    return queryset.filter(Q(date_created__lt=date_created) |
+                           Q(date_created=date_created,
+                             **{id_field + '__lt': diff_id}))
+
+
+def get_snapshot_data(obj):
+    """
+    Return the tracked values of obj as stored in a snapshot, the geometry
+    as (lossless) hex WKB
+    """
+    values = get_values(obj)
+    geom_field = getattr(obj.Modeldiff, 'geom_field', None)
+    if geom_field is not None:
+        geom = getattr(obj, geom_field)
+        values[geom_field] = (HexWKBWriter().write(geom).decode()
+                              if geom else None)
+    return codec.dumps(values)
+
+
+def load_snapshot(model, snapshot):
+    """
+    Return the object stored in snapshot, None if it did not exist
+    """
+    if snapshot.data is None:
+        return None
+    obj = model(pk=snapshot.model_id)
+    set_values(obj, codec.loads(snapshot.data))
+    return obj
+
+
+def replay(model, obj, diff):
+    """
+    Return obj (None if it does not exist) with diff applied
+    """
+    if diff.action == 'delete':
+        return None
+
+    new_values = diff.new_values
+    if diff.action == 'add':
+        obj = model(pk=diff.model_id)
+    elif obj is None:
+        # first diff stored after the object was created: the old values
+        # of an update are all the tracked values
+        obj = model(pk=diff.model_id)
+        set_values(obj, diff.old_values)
+        geom_field = getattr(model.Modeldiff, 'geom_field', None)
+        if is_delta(new_values.get(geom_field)):
+            srid = model._meta.get_field(geom_field).srid
+            setattr(obj, geom_field,
+                    rebuild_geometry(diff, geom_field, srid))
+            del new_values[geom_field]
+    set_values(obj, new_values)
+    return obj
+
+
+def as_of(model, pk, timestamp=None, save_snapshots=True):
+    """
+    Return the object pk of model as it was at timestamp (by default now),
+    an unsaved instance with only the tracked fields set, None if it did
+    not exist then.
+
+    With save_snapshots, a ModeldiffSnapshot is stored every
+    checkpoint_interval diffs replayed
+    """
+    timestamp = timestamp or timezone.now()
+    snapshots, diffs = get_history(model, pk)
+    return replay_history(model, pk,
+                          snapshots.filter(date_created__lte=timestamp),
+                          diffs.filter(date_created__lte=timestamp),
+                          save_snapshots)
+
+
+def get_history(model, pk):
+    """
+    Return the snapshots (newest first) and the diffs (oldest first) of
+    the object pk of model
+    """
+    model_name = model.Modeldiff.model_name
+    snapshots = ModeldiffSnapshot.objects.filter(
+        model_name=model_name, model_id=pk).order_by('-date_created',
+                                                     '-diff_id')
+    diffs = get_diff_class(model).objects.filter(
+        model_name=model_name, model_id=pk).order_by('date_created', 'id')
+    return snapshots, diffs
+
+
+def replay_history(model, pk, snapshots, diffs, save_snapshots=True):
+    """
+    Return the object pk of model after diffs, replayed from the newest of
+    snapshots (see get_history)
+    """
+    model_name = model.Modeldiff.model_name
+    snapshot = snapshots.first()
+    obj = None
+    if snapshot is not None:
+        obj = load_snapshot(model, snapshot)
+        diffs = after(diffs, snapshot.date_created, snapshot.diff_id)
+
+    interval = get_checkpoint_interval(model)
+    new_snapshots = []
+    for count, diff in enumerate(diffs.iterator(), 1):
+        obj = replay(model, obj, diff)
+        if save_snapshots and count % interval == 0:
+            new_snapshots.append(ModeldiffSnapshot(
+                model_name=model_name, model_id=pk, diff_id=diff.id,
+                date_created=diff.date_created,
+                data=get_snapshot_data(obj) if obj is not None else None))
+
+    if new_snapshots:
+        ModeldiffSnapshot.objects.bulk_create(new_snapshots,
+                                              ignore_conflicts=True)
+    return obj
+
+
+def get_full_old_values(model, diff):
+    """
+    Return all the tracked values of the object of an update diff before
+    it, for the diffs stored with Modeldiff.minimal_old_data: the old values
+    stored in the diff completed with the object replayed from the previous
+    diffs, the geometry written as in the diffs. Without previous diffs
+    only the stored old values are known
+    """
+    snapshots, diffs = get_history(model, diff.model_id)
+    obj = replay_history(
+        model, diff.model_id,
+        before(snapshots, diff.date_created, diff.id, 'diff_id'),
+        before(diffs, diff.date_created, diff.id))
+
+    values = {}
+    if obj is not None:
+        values = get_values(obj)
+        geom_field = getattr(model.Modeldiff, 'geom_field', None)
+        if geom_field is not None:
+            values[geom_field] = write_geom(model, getattr(obj, geom_field))
+    values.update(diff.old_values)
+    return values
+
+
+def model_as_of(model, timestamp=None, chunk_size=2000):
+    """
+    Yield the objects of model that existed at timestamp (by default now),
+    as as_of() returns them, in pk order. The diffs are read once, ordered
+    by object, with a server side cursor where the database supports it
+    """
+    timestamp = timestamp or timezone.now()
+    diffs = get_diff_class(model).objects.filter(
+        model_name=model.Modeldiff.model_name, model_id__isnull=False,
+        date_created__lte=timestamp).order_by('model_id', 'date_created',
+                                              'id')
+    obj = None
+    model_id = None
+    for diff in diffs.iterator(chunk_size=chunk_size):
+        if diff.model_id != model_id:
+            if obj is not None:
+                yield obj
+            obj = None
+            model_id = diff.model_id
+        obj = replay(model, obj, diff)
+    if obj is not None:
+        yield obj
+
+
+def get_columns(model):
+    return ['id'] + list(model.Modeldiff.fields) + (
+        [model.Modeldiff.geom_field]
+        if hasattr(model.Modeldiff, 'geom_field') else [])
+
+
+def object_to_row(obj, geom_format='wkt'):
+    """
+    Return the pk and the tracked values of obj as JSON serializable
+    values, the geometry as WKT or hex WKB
+    """
+    row = {'id': obj.pk}
+    row.update(get_values(obj))
+    geom_field = getattr(obj.Modeldiff, 'geom_field', None)
+    if geom_field is not None:
+        geom = getattr(obj, geom_field)
+        if geom is not None:
+            geom = geom.wkt if geom_format == 'wkt' else geom.hex.decode()
+        row[geom_field] = geom
+    return row
+
+
+def write_objects(objects, model, out, format='jsonl', geom_format='wkt'):
+    """
+    Write objects (of model) to the text file out as JSON lines or CSV,
+    return their number
+    """
+    columns = get_columns(model)
+    if format == 'csv':
+        writer = CSVWriter(out, columns)
+    else:
+        writer = JSONLinesWriter(out, columns)
+    count = 0
+    for obj in objects:
+        writer.write(object_to_row(obj, geom_format))
+        count += 1
+    return count
+
+
+def as_of_model(model, table):
+    """
+    Return an unmanaged model for the table table with the pk and the
+    tracked fields of model, foreign keys as plain integer columns
+    """
+    attrs = {
+        '__module__': model.__module__,
+        'Meta': type('Meta', (), {
+            'app_label': model._meta.app_label, 'db_table': table,
+            'managed': False, 'apps': Apps()}),
+    }
+    for name in get_columns(model)[1:]:
+        field = model._meta.get_field(name)
+        if field.is_relation:
+            attrs[field.attname] = models.IntegerField(null=True)
+        else:
+            attrs[name] = field.clone()
+            attrs[name].null = True
+    attrs['id'] = models.IntegerField(primary_key=True)
+    return type('%sAsOf' % model.__name__, (models.Model,), attrs)
+
+
+def write_table(objects, model, table, using=None, chunk_size=2000):
+    """
+    Create the table table (see as_of_model) and insert objects (of model)
+    in chunks of chunk_size, return their number
+    """
+    table_model = as_of_model(model, table)
+    using = using or router.db_for_write(model)
+    with connections[using].schema_editor() as schema_editor:
+        schema_editor.create_model(table_model)
+
+    names = [field.attname for field in table_model._meta.concrete_fields
+             if field.attname != 'id']
+    count = 0
+    rows = []
+    for obj in objects:
+        row = table_model(id=obj.pk)
+        for name in names:
+            setattr(row, name, getattr(obj, name))
+        rows.append(row)
+        if len(rows) == chunk_size:
+            count += insert_rows(table_model, rows, using)
+            rows = []
+    return count + insert_rows(table_model, rows, using)
+
+
+def insert_rows(table_model, rows, using):
+    with transaction.atomic(using=using):
+        table_model.objects.using(using).bulk_create(rows)
+    return len(rows)
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from modeldiff.apply import (apply_diffs, apply_diffs_parallel,
+                             pending_querysets)
+
+
+class Command(BaseCommand):
+    help = ('Apply the pending (unapplied) Modeldiff and Geomodeldiff, in '
+            'order, without generating new diffs')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--key', help='only apply diffs from this key')
+        parser.add_argument('--database',
+                            help='database to apply the diffs to')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='diffs applied in each transaction')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='worker processes, 0 for one per CPU')
+        parser.add_argument('--compact', action='store_true',
+                            help='squash the diffs of each object in a batch')
+
+    def handle(self, *args, **options):
+        querysets = pending_querysets(options['key'])
+        if options['workers'] == 1:
+            stats = apply_diffs(querysets, using=options['database'],
+                                batch_size=options['batch_size'],
+                                compact=options['compact'])
+        else:
+            stats = apply_diffs_parallel(querysets,
+                                         using=options['database'],
+                                         workers=options['workers'] or None,
+                                         batch_size=options['batch_size'],
+                                         compact=options['compact'])
+        self.stdout.write('added: %(add)d, updated: %(update)d, '
+                          'deleted: %(delete)d, missing: %(missing)d' % stats)
+        if 'elapsed' in stats:
+            rate = stats['diffs'] / stats['elapsed'] if stats['elapsed'] else 0
+            self.stdout.write('%d diffs in %.1f s (%.0f diffs/s)' % (
+                stats['diffs'], stats['elapsed'], rate))
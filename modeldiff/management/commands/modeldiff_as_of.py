@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from modeldiff.export import FORMATS, GEOM_FORMATS
+from modeldiff.history import model_as_of, write_objects, write_table
+from modeldiff.registry import registry
+
+
+class Command(BaseCommand):
+    help = ('Rebuild all the objects of a tracked model as they were at a '
+            'date from the diffs, to a file or a new table')
+
+    def add_arguments(self, parser):
+        parser.add_argument('model_name')
+        parser.add_argument('timestamp',
+                            help='ISO date and time, in the current time '
+                                 'zone if naive')
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+        parser.add_argument('--geom-format', choices=GEOM_FORMATS,
+                            default='wkt')
+        parser.add_argument('--output', help='file to write, stdout by '
+                                             'default')
+        parser.add_argument('--table',
+                            help='create this table and insert the objects '
+                                 'instead')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        model = registry.get_model(options['model_name'])
+        if model is None:
+            raise CommandError('Unknown model_name %s' %
+                               options['model_name'])
+        timestamp = parse_datetime(options['timestamp'])
+        if timestamp is None:
+            raise CommandError('Invalid timestamp %s' % options['timestamp'])
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp)
+
+        objects = model_as_of(model, timestamp, options['chunk_size'])
+        if options['table']:
+            count = write_table(objects, model, options['table'],
+                                chunk_size=options['chunk_size'])
+        elif options['output']:
+            with open(options['output'], 'w', newline='') as out:
+                count = write_objects(objects, model, out, options['format'],
+                                      options['geom_format'])
+        else:
+            self.stdout.ending = ''
+            count = write_objects(objects, model, self.stdout,
+                                  options['format'], options['geom_format'])
+        self.stderr.write('%s: %d objects' % (options['model_name'], count))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from modeldiff.models import Geomodeldiff, Modeldiff
+
+
+class Command(BaseCommand):
+    help = ('Fill changed_fields for the diffs stored before it existed, '
+            'in small chunks so the tables are never locked for long')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='seconds to wait between chunks')
+
+    def handle(self, *args, **options):
+        for diff_class in (Modeldiff, Geomodeldiff):
+            count = self.backfill(diff_class, options['chunk_size'],
+                                  options['sleep'])
+            self.stdout.write('%s: %d diffs updated' % (diff_class.__name__,
+                                                        count))
+
+    def backfill(self, diff_class, chunk_size, sleep):
+        queryset = diff_class.objects.filter(
+            changed_fields__isnull=True).only('action', 'old_data',
+                                              'new_data').order_by('id')
+        count = 0
+        last_id = 0
+        while True:
+            with transaction.atomic(using=queryset.db):
+                diffs = list(queryset.filter(id__gt=last_id)[:chunk_size])
+                if not diffs:
+                    return count
+                for diff in diffs:
+                    if diff.action == 'delete':
+                        diff.changed_fields = list(diff.old_values)
+                    else:
+                        diff.changed_fields = list(diff.new_values)
+                diff_class.objects.bulk_update(diffs, ['changed_fields'])
+
+            count += len(diffs)
+            last_id = diffs[-1].id
+            if sleep:
+                time.sleep(sleep)
@@ -0,0 +1,59 @@
+import time
+
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from modeldiff.geodelta import is_delta
+from modeldiff.models import Geomodeldiff, get_envelope
+from modeldiff.registry import registry
+
+
+def get_old_geom(diff, srid):
+    """
+    Return the old geometry stored in old_data of an update diff, None if
+    unknown
+    """
+    model = registry.get_model(diff.model_name)
+    if diff.action != 'update' or model is None:
+        return None
+    value = diff.old_values.get(registry.get(model).geom_field)
+    if not value or is_delta(value):
+        return None
+    return GEOSGeometry(value, srid=srid)
+
+
+class Command(BaseCommand):
+    help = ('Fill the envelope of the geometry diffs stored before it '
+            'existed, in small chunks so the table is never locked for long')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='seconds to wait between chunks')
+
+    def handle(self, *args, **options):
+        count = self.backfill(options['chunk_size'], options['sleep'])
+        self.stdout.write('Geomodeldiff: %d diffs updated' % count)
+
+    def backfill(self, chunk_size, sleep):
+        queryset = Geomodeldiff.objects.filter(
+            envelope__isnull=True, the_geom__isnull=False).only(
+            'model_name', 'action', 'old_data', 'the_geom').order_by('id')
+        srid = Geomodeldiff._meta.get_field('the_geom').srid
+        count = 0
+        last_id = 0
+        while True:
+            with transaction.atomic(using=queryset.db):
+                diffs = list(queryset.filter(id__gt=last_id)[:chunk_size])
+                if not diffs:
+                    return count
+                for diff in diffs:
+                    diff.envelope = get_envelope(get_old_geom(diff, srid),
+                                                 diff.the_geom)
+                Geomodeldiff.objects.bulk_update(diffs, ['envelope'])
+
+            count += len(diffs)
+            last_id = diffs[-1].id
+            if sleep:
+                time.sleep(sleep)
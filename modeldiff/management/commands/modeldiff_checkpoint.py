@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from modeldiff.history import as_of
+from modeldiff.models import Geomodeldiff, Modeldiff, ModeldiffSnapshot
+from modeldiff.registry import registry
+
+
+class Command(BaseCommand):
+    help = ('Store the snapshots of the tracked objects every '
+            'checkpoint_interval diffs, so as_of() replays few diffs')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-name',
+                            help='only the objects of this model_name')
+
+    def handle(self, *args, **options):
+        for diff_class in (Modeldiff, Geomodeldiff):
+            queryset = diff_class.objects.all()
+            if options['model_name'] is not None:
+                queryset = queryset.filter(model_name=options['model_name'])
+            objects = queryset.values_list(
+                'model_name', 'model_id').distinct().order_by()
+
+            count = 0
+            snapshots = ModeldiffSnapshot.objects.count()
+            for model_name, model_id in objects.iterator():
+                model = registry.get_model(model_name)
+                if model is None or model_id is None:
+                    continue
+                as_of(model, model_id)
+                count += 1
+            self.stdout.write('%s: %d objects, %d snapshots stored' % (
+                diff_class.__name__, count,
+                ModeldiffSnapshot.objects.count() - snapshots))
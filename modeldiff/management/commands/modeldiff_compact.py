@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from modeldiff.compact import compact_history
+from modeldiff.models import Geomodeldiff, Modeldiff
+
+
+class Command(BaseCommand):
+    help = ('Squash the stored diffs of each object below a watermark into '
+            'one equivalent diff')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before-id', type=int,
+                            help='only compact diffs with a lower id, every '
+                                 'consumer must have read them')
+        parser.add_argument('--key', help='only compact diffs from this key')
+
+    def handle(self, *args, **options):
+        for diff_class in (Modeldiff, Geomodeldiff):
+            queryset = diff_class.objects.all()
+            if options['before_id'] is not None:
+                queryset = queryset.filter(id__lt=options['before_id'])
+            if options['key'] is not None:
+                queryset = queryset.filter(key=options['key'])
+            stats = compact_history(queryset)
+            self.stdout.write('%s: %d objects compacted, %d diffs deleted' % (
+                diff_class.__name__, stats['objects'], stats['deleted']))
@@ -0,0 +1,64 @@
+from functools import partial
+
+from django.core.management.base import BaseCommand
+
+from modeldiff.export import FORMATS, GEOM_FORMATS, ExportState, export_diffs
+from modeldiff.models import Geomodeldiff, Modeldiff
+
+DIFF_CLASSES = {
+    'modeldiff': Modeldiff,
+    'geomodeldiff': Geomodeldiff,
+}
+
+
+class Command(BaseCommand):
+    help = ('Stream the diffs as JSON lines or CSV, resuming from the last '
+            'exported id kept in a state file')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', choices=sorted(DIFF_CLASSES),
+                            default='modeldiff')
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+        parser.add_argument('--geom-format', choices=GEOM_FORMATS,
+                            default='wkt')
+        parser.add_argument('--output',
+                            help='file to append to, stdout by default')
+        parser.add_argument('--state-file',
+                            help='JSON file keeping the last exported id')
+        parser.add_argument('--after-id', type=int,
+                            help='export the diffs after this id, overrides '
+                                 'the state file')
+        parser.add_argument('--key', help='only export diffs from this key')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        diff_class = DIFF_CLASSES[options['table']]
+        queryset = diff_class.objects.all()
+        if options['key'] is not None:
+            queryset = queryset.filter(key=options['key'])
+
+        state = None
+        after_id = options['after_id'] or 0
+        checkpoint = None
+        if options['state_file']:
+            state = ExportState(options['state_file'])
+            if options['after_id'] is None:
+                after_id = state.get(options['table'])
+            checkpoint = partial(state.set, options['table'])
+
+        if options['output']:
+            out = open(options['output'], 'a', newline='')
+        else:
+            out = self.stdout
+            out.ending = ''
+        try:
+            # header only at the start of a CSV file
+            header = not options['output'] or out.tell() == 0
+            count, last_id = export_diffs(
+                queryset, out, options['format'], options['geom_format'],
+                after_id, options['chunk_size'], checkpoint, header)
+        finally:
+            if out is not self.stdout:
+                out.close()
+        self.stderr.write('%s: %d diffs exported, last id %d' % (
+            diff_class.__name__, count, last_id))
@@ -0,0 +1,92 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from modeldiff import codec
+from modeldiff.models import (Geomodeldiff, Modeldiff, get_diff_class,
+                              minimal_old_values)
+from modeldiff.registry import registry
+
+
+def get_model_names(model_name=None):
+    """
+    Return the model_name of the models with Modeldiff.minimal_old_data, or
+    model_name
+    """
+    if model_name is not None:
+        if registry.get_model(model_name) is None:
+            raise CommandError('Unknown model_name %s' % model_name)
+        return [model_name]
+    return [name for geo in (False, True)
+            for name, label in registry.model_names(geo=geo)
+            if getattr(registry.get_model(name).Modeldiff,
+                       'minimal_old_data', False)]
+
+
+class Command(BaseCommand):
+    help = ('Rewrite the old_data of the update diffs of the models with '
+            'minimal_old_data to only the old values of the changed fields, '
+            'in small chunks so the tables are never locked for long. The '
+            'other old values are lost, replaying an object then needs its '
+            'add diff or a snapshot')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-name',
+                            help='this model_name, even without '
+                                 'minimal_old_data')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='seconds to wait between chunks')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only report the bytes that would be saved')
+
+    def handle(self, *args, **options):
+        model_names = get_model_names(options['model_name'])
+        for diff_class in (Modeldiff, Geomodeldiff):
+            names = [name for name in model_names
+                     if get_diff_class(registry.get_model(name)) is
+                     diff_class]
+            count, saved = self.minimize(diff_class, names,
+                                         options['chunk_size'],
+                                         options['sleep'],
+                                         options['dry_run'])
+            self.stdout.write('%s: %d diffs updated, %d bytes saved' % (
+                diff_class.__name__, count, saved))
+
+    def minimize(self, diff_class, model_names, chunk_size, sleep, dry_run):
+        """
+        Return the number of diffs rewritten and the bytes saved
+        """
+        if not model_names:
+            return 0, 0
+        queryset = diff_class.objects.filter(
+            model_name__in=model_names, action='update').only(
+            'model_name', 'old_data', 'new_data').order_by('id')
+        count = 0
+        saved = 0
+        last_id = 0
+        while True:
+            with transaction.atomic(using=queryset.db):
+                diffs = list(queryset.filter(id__gt=last_id)[:chunk_size])
+                if not diffs:
+                    return count, saved
+                last_id = diffs[-1].id
+
+                updated = []
+                for diff in diffs:
+                    old_values = diff.old_values
+                    minimal = minimal_old_values(old_values, diff.new_values)
+                    if len(minimal) == len(old_values):
+                        continue
+                    old_data = codec.dumps(minimal, diff.model_name)
+                    saved += (len(diff.old_data.encode('utf8')) -
+                              len(old_data.encode('utf8')))
+                    diff.old_data = old_data
+                    updated.append(diff)
+                if updated and not dry_run:
+                    diff_class.objects.bulk_update(updated, ['old_data'])
+
+            count += len(updated)
+            if sleep:
+                time.sleep(sleep)
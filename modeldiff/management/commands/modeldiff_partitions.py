@@ -0,0 +1,43 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from modeldiff.models import Geomodeldiff, Modeldiff
+from modeldiff.partitions import (convert_to_partitioned, create_partitions,
+                                  detach_partitions, is_partitioned)
+
+
+class Command(BaseCommand):
+    help = ('Manage the monthly date_created partitions of the diff tables '
+            '(PostgreSQL only)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=('convert', 'create', 'detach'))
+        parser.add_argument('--months', type=int, default=3,
+                            help='months to create in advance')
+        parser.add_argument('--before', type=datetime.date.fromisoformat,
+                            help='detach the partitions older than this date '
+                                 '(YYYY-MM-DD)')
+        parser.add_argument('--drop', action='store_true',
+                            help='drop the detached partitions')
+
+    def handle(self, *args, **options):
+        if options['action'] == 'detach' and options['before'] is None:
+            raise CommandError('detach needs --before')
+        for diff_class in (Modeldiff, Geomodeldiff):
+            name = diff_class.__name__
+            if options['action'] == 'convert':
+                if is_partitioned(diff_class):
+                    self.stdout.write('%s: already partitioned' % name)
+                    continue
+                convert_to_partitioned(diff_class, options['months'])
+                self.stdout.write('%s: partitioned' % name)
+            elif options['action'] == 'create':
+                created = create_partitions(diff_class, options['months'])
+                self.stdout.write('%s: %d partitions created' % (
+                    name, len(created)))
+            else:
+                detached = detach_partitions(diff_class, options['before'],
+                                             options['drop'])
+                self.stdout.write('%s: detached %s' % (
+                    name, ', '.join(detached) or 'nothing'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from modeldiff.models import Geomodeldiff, Modeldiff
+from modeldiff.retention import (DiffArchive, expired_querysets,
+                                 get_archive_path, prune)
+
+
+class Command(BaseCommand):
+    help = ('Delete the diffs past their MODELDIFF_RETENTION, in small '
+            'chunks so the tables are never locked for long')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='seconds to wait between chunks')
+        parser.add_argument('--archive-dir',
+                            help='write the diffs to a gzipped JSON lines '
+                                 'file in this directory before deleting '
+                                 'them')
+
+    def handle(self, *args, **options):
+        for diff_class in (Modeldiff, Geomodeldiff):
+            archive = None
+            if options['archive_dir']:
+                archive = DiffArchive(get_archive_path(
+                    options['archive_dir'], diff_class))
+            try:
+                count = 0
+                for queryset in expired_querysets(diff_class):
+                    count += prune(queryset, options['chunk_size'], archive,
+                                   options['sleep'])
+            finally:
+                if archive is not None:
+                    archive.close()
+            self.stdout.write('%s: %d diffs deleted' % (diff_class.__name__,
+                                                        count))
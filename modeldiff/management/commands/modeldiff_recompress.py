@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from modeldiff import codec
+from modeldiff.models import Geomodeldiff, Modeldiff
+
+
+def recompress_diff(diff):
+    """
+    Rewrite old_data and new_data of diff with the current compression,
+    return the bytes saved or None if both are unchanged
+    """
+    saved = None
+    for name in ('old_data', 'new_data'):
+        data = getattr(diff, name)
+        if not data:
+            continue
+        new_data = codec.compress(codec.decompress(data), diff.model_name)
+        if new_data != data:
+            saved = (saved or 0) + (len(data.encode('utf8')) -
+                                    len(new_data.encode('utf8')))
+            setattr(diff, name, new_data)
+    return saved
+
+
+class Command(BaseCommand):
+    help = ('Rewrite old_data and new_data of the stored diffs with the '
+            'current MODELDIFF_COMPRESSION (or uncompressed without it) and '
+            'dictionaries, in small chunks so the tables are never locked '
+            'for long')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-name',
+                            help='only the diffs of this model_name')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='seconds to wait between chunks')
+
+    def handle(self, *args, **options):
+        for diff_class in (Modeldiff, Geomodeldiff):
+            count, saved = self.recompress(diff_class, options['model_name'],
+                                           options['chunk_size'],
+                                           options['sleep'])
+            self.stdout.write('%s: %d diffs updated, %d bytes saved' % (
+                diff_class.__name__, count, saved))
+
+    def recompress(self, diff_class, model_name, chunk_size, sleep):
+        """
+        Return the number of diffs rewritten and the bytes saved
+        """
+        queryset = diff_class.objects.only(
+            'model_name', 'old_data', 'new_data').order_by('id')
+        if model_name is not None:
+            queryset = queryset.filter(model_name=model_name)
+        count = 0
+        saved = 0
+        last_id = 0
+        while True:
+            with transaction.atomic(using=queryset.db):
+                diffs = list(queryset.filter(id__gt=last_id)[:chunk_size])
+                if not diffs:
+                    return count, saved
+                last_id = diffs[-1].id
+
+                updated = []
+                for diff in diffs:
+                    diff_saved = recompress_diff(diff)
+                    if diff_saved is not None:
+                        saved += diff_saved
+                        updated.append(diff)
+                if updated:
+                    diff_class.objects.bulk_update(updated,
+                                                   ['old_data', 'new_data'])
+
+            count += len(updated)
+            if sleep:
+                time.sleep(sleep)
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from modeldiff import codec
+from modeldiff.models import get_diff_class
+from modeldiff.registry import registry
+
+
+class Command(BaseCommand):
+    help = ('Train a zstd dictionary on the old_data and new_data of the '
+            'latest diffs of a model_name, to be listed in '
+            'MODELDIFF_COMPRESSION_DICTIONARIES (needs zstandard)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('model_name')
+        parser.add_argument('output', help='dictionary file to write')
+        parser.add_argument('--samples', type=int, default=10000,
+                            help='number of diffs read')
+        parser.add_argument('--size', type=int, default=16384,
+                            help='size of the dictionary in bytes')
+
+    def handle(self, *args, **options):
+        try:
+            import zstandard
+        except ImportError:
+            raise CommandError('zstandard is not installed')
+
+        model = registry.get_model(options['model_name'])
+        if model is None:
+            raise CommandError('Unknown model_name %s' %
+                               options['model_name'])
+
+        diffs = get_diff_class(model).objects.filter(
+            model_name=options['model_name']).order_by('-id').values_list(
+            'old_data', 'new_data')[:options['samples']]
+        samples = [codec.decompress(data).encode('utf8')
+                   for row in diffs.iterator() for data in row if data]
+        if not samples:
+            raise CommandError('No diffs of %s' % options['model_name'])
+
+        dictionary = zstandard.train_dictionary(options['size'], samples)
+        with open(options['output'], 'wb') as f:
+            f.write(dictionary.as_bytes())
+        self.stdout.write('%s: dictionary %d trained on %d samples' % (
+            options['model_name'], dictionary.dict_id(), len(samples)))
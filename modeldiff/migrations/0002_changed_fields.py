@@ -0,0 +1,49 @@
+from django.db import migrations, models
+
+DIFF_MODELS = ('Modeldiff', 'Geomodeldiff')
+
+
+def create_gin_indexes(apps, schema_editor):
+    # jsonb_path_ops indexes speed up ModeldiffQuerySet.touching()
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model_name in DIFF_MODELS:
+        table = apps.get_model('modeldiff', model_name)._meta.db_table
+        schema_editor.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS "%s_changed_fields_gin" '
+            'ON "%s" USING gin ("changed_fields" jsonb_path_ops)'
+            % (table, table))
+
+
+def drop_gin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model_name in DIFF_MODELS:
+        table = apps.get_model('modeldiff', model_name)._meta.db_table
+        schema_editor.execute(
+            'DROP INDEX CONCURRENTLY IF EXISTS "%s_changed_fields_gin"'
+            % table)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('modeldiff', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geomodeldiff',
+            name='changed_fields',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='modeldiff',
+            name='changed_fields',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(create_gin_indexes, drop_gin_indexes),
+    ]
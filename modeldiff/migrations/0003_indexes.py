@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('modeldiff', '0002_changed_fields'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='geomodeldiff',
+            index=models.Index(fields=['model_name', 'model_id', 'date_created'], name='modeldiff_geomodeldiff_history'),
+        ),
+        migrations.AddIndex(
+            model_name='geomodeldiff',
+            index=models.Index(fields=['key', 'id'], name='modeldiff_geomodeldiff_key_id'),
+        ),
+        migrations.AddIndex(
+            model_name='geomodeldiff',
+            index=models.Index(condition=models.Q(('applied', False)), fields=['key', 'id'], name='modeldiff_geomodeldiff_pending'),
+        ),
+        migrations.AddIndex(
+            model_name='modeldiff',
+            index=models.Index(fields=['model_name', 'model_id', 'date_created'], name='modeldiff_modeldiff_history'),
+        ),
+        migrations.AddIndex(
+            model_name='modeldiff',
+            index=models.Index(fields=['key', 'id'], name='modeldiff_modeldiff_key_id'),
+        ),
+        migrations.AddIndex(
+            model_name='modeldiff',
+            index=models.Index(condition=models.Q(('applied', False)), fields=['key', 'id'], name='modeldiff_modeldiff_pending'),
+        ),
+    ]
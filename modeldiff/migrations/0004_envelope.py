@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:34
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('modeldiff', '0003_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geomodeldiff',
+            name='envelope',
+            field=django.contrib.gis.db.models.fields.GeometryField(blank=True, null=True, srid=4326),
+        ),
+        migrations.AddIndex(
+            model_name='geomodeldiff',
+            index=models.Index(fields=['date_created'], name='modeldiff_geomodeldiff_date'),
+        ),
+    ]
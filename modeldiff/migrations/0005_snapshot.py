@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('modeldiff', '0004_envelope'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModeldiffSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=50)),
+                ('model_id', models.IntegerField()),
+                ('diff_id', models.IntegerField()),
+                ('date_created', models.DateTimeField()),
+                ('data', models.TextField(null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model_name', 'model_id', 'date_created'], name='modeldiff_snapshot_history')],
+                'constraints': [models.UniqueConstraint(fields=('model_name', 'model_id', 'diff_id'), name='modeldiff_snapshot_unique')],
+            },
+        ),
+    ]
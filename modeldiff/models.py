@@ -1,13 +1,86 @@
-import datetime
-import json
+from functools import partial
 
 from django.conf import settings
 from django.contrib.gis.db import models
-from django.contrib.gis.geos import WKTWriter
-from django.forms.models import model_to_dict
+from django.contrib.gis.geos import (GEOSGeometry, LineString, Point,
+                                     Polygon, WKBWriter, WKTWriter)
+from django.db import connections, router, transaction
+from django.db.models.deletion import Collector
+from django.db.models.expressions import RawSQL
 from django.utils import timezone
 
+from modeldiff import codec
+from modeldiff.buffer import get_buffer
+from modeldiff.geodelta import keyframe_due, make_delta
+from modeldiff.registry import registry
 from modeldiff.request import GlobalRequest
+from modeldiff.serializers import get_serializer
+from modeldiff.writer import get_writer
+
+
+class ModeldiffQuerySet(models.QuerySet):
+    def history_for(self, instance):
+        """
+        Diffs of a tracked object, oldest first
+        """
+        return self.filter(model_name=instance.Modeldiff.model_name,
+                           model_id=instance.pk).order_by('date_created',
+                                                          'id')
+
+    def pending(self, key):
+        """
+        Diffs from source key not applied yet, in the order to apply them
+        """
+        return self.filter(key=key, applied=False).order_by('id')
+
+    def changes_since(self, diff_id, key=None):
+        """
+        Diffs after diff_id (optionally only from source key), oldest first
+        """
+        queryset = self.filter(id__gt=diff_id)
+        if key is not None:
+            queryset = queryset.filter(key=key)
+        return queryset.order_by('id')
+
+    def touching(self, field):
+        """
+        Diffs that changed field (deletions touch all the fields)
+        """
+        if connections[self.db].vendor == 'postgresql':
+            # can use a GIN index, see migration 0002
+            return self.filter(changed_fields__contains=[field])
+        return self.filter(changed_fields__icontains='"%s"' % field)
+
+
+class GeomodeldiffQuerySet(ModeldiffQuerySet):
+    def changes_intersecting(self, geom, since=None):
+        """
+        Diffs whose envelope (see get_envelope) intersects geom, optionally
+        only the ones created since the datetime since, oldest first
+        """
+        queryset = self
+        if since is not None:
+            queryset = queryset.filter(date_created__gte=since)
+        connection = connections[self.db]
+        if getattr(connection.ops, 'spatialite', False):
+            # SpatiaLite only uses the spatial index through its virtual
+            # table, the id of a diff is its rowid
+            queryset = queryset.filter(id__in=RawSQL(
+                "SELECT ROWID FROM SpatialIndex WHERE f_table_name = %s "
+                "AND f_geometry_column = 'envelope' "
+                "AND search_frame = GeomFromText(%s, %s)",
+                [self.model._meta.db_table, geom.wkt, geom.srid]))
+        return queryset.filter(envelope__intersects=geom).order_by(
+            'date_created', 'id')
+
+    def changes_in_bbox(self, bbox, since=None):
+        """
+        Diffs whose envelope intersects bbox (xmin, ymin, xmax, ymax in the
+        SRID of the_geom), see changes_intersecting
+        """
+        polygon = Polygon.from_bbox(bbox)
+        polygon.srid = self.model._meta.get_field('the_geom').srid
+        return self.changes_intersecting(polygon, since)
 
 
 class ModeldiffMixin(models.Model):
@@ -28,9 +101,39 @@ class ModeldiffMixin(models.Model):
     old_data = models.TextField()
     new_data = models.TextField()
     applied = models.BooleanField(default=False, db_index=True)
+    # names of the fields in new_data (old_data for deletions)
+    changed_fields = models.JSONField(null=True, blank=True)
+
+    objects = ModeldiffQuerySet.as_manager()
 
     class Meta:
         abstract = True
+        indexes = [
+            # ModeldiffQuerySet.history_for
+            models.Index(fields=['model_name', 'model_id', 'date_created'],
+                         name='%(app_label)s_%(class)s_history'),
+            # ModeldiffQuerySet.changes_since with a key
+            models.Index(fields=['key', 'id'],
+                         name='%(app_label)s_%(class)s_key_id'),
+            # ModeldiffQuerySet.pending
+            models.Index(fields=['key', 'id'],
+                         condition=models.Q(applied=False),
+                         name='%(app_label)s_%(class)s_pending'),
+        ]
+
+    @property
+    def old_values(self):
+        """
+        old_data decoded with the MODELDIFF_JSON_CODEC
+        """
+        return codec.loads(self.old_data)
+
+    @property
+    def new_values(self):
+        """
+        new_data decoded with the MODELDIFF_JSON_CODEC
+        """
+        return codec.loads(self.new_data)
 
 
 class Modeldiff(ModeldiffMixin, models.Model):
@@ -38,110 +141,829 @@ class Modeldiff(ModeldiffMixin, models.Model):
 
 
 class Geomodeldiff(ModeldiffMixin, models.Model):
-    the_geom = models.GeometryField(srid=4326, null=True, blank=True)
+    the_geom = models.GeometryField(srid=4326, null=True, blank=True,
+                                    spatial_index=True)
+    # bounding box of the old and new geometry, set for every diff
+    envelope = models.GeometryField(srid=4326, null=True, blank=True,
+                                    spatial_index=True)
+
+    objects = GeomodeldiffQuerySet.as_manager()
 
+    class Meta(ModeldiffMixin.Meta):
+        indexes = ModeldiffMixin.Meta.indexes + [
+            # GeomodeldiffQuerySet.changes_intersecting with since
+            models.Index(fields=['date_created'],
+                         name='%(app_label)s_%(class)s_date'),
+        ]
 
-class SaveModeldiffMixin(models.Model):
+
+class ModeldiffSnapshot(models.Model):
     """
-    Use real=True to access the real save function
-    otherwise the Modeldiff logic will apply
+    Tracked values of an object right after one of its diffs, see
+    modeldiff.history
     """
-    def save(self, *args, **kwargs):
-        # see if we need to save the object (real = True)
-        # or should generate a Modeldiff (real = False)
-        ignore = kwargs.get('modeldiff_ignore', False)
+    model_name = models.CharField(max_length=50)
+    model_id = models.IntegerField()
+    # the diff (in the diff table of the model) and its date
+    diff_id = models.IntegerField()
+    date_created = models.DateTimeField()
+    # codec JSON, the geometry as hex WKB, null if the object was deleted
+    data = models.TextField(null=True)
+
+    class Meta:
+        indexes = [
+            # modeldiff.history.as_of
+            models.Index(fields=['model_name', 'model_id', 'date_created'],
+                         name='modeldiff_snapshot_history'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['model_name', 'model_id',
+                                            'diff_id'],
+                                    name='modeldiff_snapshot_unique'),
+        ]
 
-        if ignore:
-            # call original handler
-            kwargs.pop('modeldiff_ignore')
-            super(SaveModeldiffMixin, self).save(*args, **kwargs)
-            return
 
-        fields = self.Modeldiff.fields
+# update saves where no tracked field changed, not tracked because of
+# Modeldiff.skip_unchanged: 'diffs' not written and 'saves' not done
+unchanged_stats = {'diffs': 0, 'saves': 0}
 
-        diff = Modeldiff()
-        diff.applied = True
-        diff.model_name = self.Modeldiff.model_name
-        diff.key = settings.MODELDIFF_KEY
-        if hasattr(self, 'username'):
-            diff.username = self.username
+
+def get_diff_class(model):
+    """
+    Return the diff model (Modeldiff or Geomodeldiff) used to track model
+    """
+    if registry.get(model).geom_field is not None:
+        return Geomodeldiff
+    return Modeldiff
+
+
+def get_username(instance):
+    if hasattr(instance, 'username'):
+        return instance.username
+    try:
+        return GlobalRequest().user.username
+    except Exception:
+        return ''
+
+
+def get_values(instance):
+    return get_serializer(instance.__class__)(instance)
+
+
+class HexWKBWriter(WKBWriter):
+    """
+    Writes the geometries as hex WKB, for geom_format = 'wkb'
+    """
+    def write(self, geom):
+        return self.write_hex(geom)
+
+
+def get_wkt_writer(model):
+    """
+    Return the geometry writer of a geo tracked model, None otherwise: WKT
+    with Modeldiff.geom_precision decimals or, with Modeldiff.geom_format =
+    'wkb', hex WKB (more compact and faster to write, but not rounded)
+    """
+    if get_diff_class(model) is not Geomodeldiff:
+        return None
+    if getattr(model.Modeldiff, 'geom_format', 'wkt') == 'wkb':
+        return HexWKBWriter()
+    return WKTWriter(precision=model.Modeldiff.geom_precision)
+
+
+def write_geom(model, geom, wkt_w=None):
+    if not geom:
+        return None
+    if wkt_w is None:
+        wkt_w = get_wkt_writer(model)
+    return wkt_w.write(geom).decode('utf8')
+
+
+def get_geom_value(instance, wkt_w=None):
+    geom = getattr(instance, instance.Modeldiff.geom_field)
+    return write_geom(instance.__class__, geom, wkt_w)
+
+
+def get_envelope(*geoms):
+    """
+    Return the bounding box of geoms (None and empty geometries are
+    ignored) as a polygon, or as a point or a line when it is degenerate
+    """
+    geoms = [geom for geom in geoms if geom is not None and not geom.empty]
+    if not geoms:
+        return None
+    extents = [geom.extent for geom in geoms]
+    xmin = min(extent[0] for extent in extents)
+    ymin = min(extent[1] for extent in extents)
+    xmax = max(extent[2] for extent in extents)
+    ymax = max(extent[3] for extent in extents)
+    if xmin == xmax and ymin == ymax:
+        envelope = Point(xmin, ymin)
+    elif xmin == xmax or ymin == ymax:
+        envelope = LineString((xmin, ymin), (xmax, ymax))
+    else:
+        envelope = Polygon.from_bbox((xmin, ymin, xmax, ymax))
+    envelope.srid = geoms[0].srid
+    return envelope
+
+
+def same_geom(old_geom, new_geom):
+    """
+    Cheap check for an unchanged geometry, without writing it: the same
+    object or the same WKB. False means it has to be compared as written
+    """
+    if old_geom is new_geom:
+        return True
+    if old_geom is None or new_geom is None:
+        return False
+    return old_geom.wkb == new_geom.wkb
+
+
+def get_old_values(original):
+    """
+    Return the tracked values of original, including the geometry as a
+    GEOSGeometry (update_diff writes it)
+    """
+    old_values = get_values(original)
+    if get_diff_class(original.__class__) is Geomodeldiff:
+        geom_field = original.Modeldiff.geom_field
+        old_values[geom_field] = getattr(original, geom_field)
+    return old_values
+
+
+def get_update_fields(model, update_fields):
+    """
+    Return the names of the tracked fields (geometry included) among the
+    update_fields of a save() (names or attnames), None without
+    update_fields
+    """
+    if update_fields is None:
+        return None
+    update_fields = set(update_fields)
+    tracked = registry.get(model)
+    names = list(tracked.fields)
+    if tracked.geom_field is not None:
+        names.append(tracked.geom_field)
+    return set(name for name in names if name in update_fields or
+               model._meta.get_field(name).attname in update_fields)
+
+
+def empty_update_fields(update_fields):
+    """
+    True for the update_fields of a save() that Django skips (an empty
+    list), no diff is written and the parent is not touched
+    """
+    return update_fields is not None and not update_fields
+
+
+def get_partial_old_values(instance, names):
+    """
+    Like get_old_values for a save(update_fields=...): only the values of
+    the tracked fields with names (see get_update_fields), read from the
+    database with one query (none without names)
+    """
+    if not names:
+        return {}
+    model = instance.__class__
+    tracked = registry.get(model)
+    names = [name for name in tracked.fields + (tracked.geom_field,)
+             if name in names]
+    attnames = [model._meta.get_field(name).attname for name in names]
+    row = model._base_manager.db_manager(instance._state.db).filter(
+        pk=instance.pk).values_list(*attnames).get()
+
+    serializer = get_serializer(model)
+    old_values = {}
+    for name, value in zip(names, row):
+        if name == tracked.geom_field:
+            old_values[name] = value
         else:
-            try:
-                diff.username = GlobalRequest().user.username
-            except Exception:
-                pass
+            old_values[name] = serializer.serialize(name, value)
+    return old_values
 
-        unique_field = getattr(self.Modeldiff, 'unique_field', None)
-        if unique_field:
-            diff.unique_id = getattr(self, unique_field)
 
-        if self.pk:
-            diff.model_id = self.pk
-            diff.action = 'update'
-            # get original object in database
-            original = self.__class__.objects.get(pk=self.pk)
+def untracked_changed(instance, update_fields=None):
+    """
+    Return True if a loaded concrete field that is not tracked (among the
+    update_fields of the save, if given) differs from the database
+    """
+    model = instance.__class__
+    skipped = get_tracked_attnames(model) | instance.get_deferred_fields()
+    attnames = [field.attname for field in model._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped and
+                (update_fields is None or field.name in update_fields or
+                 field.attname in update_fields)]
+    if not attnames:
+        return False
+    row = model._base_manager.db_manager(instance._state.db).filter(
+        pk=instance.pk).values_list(*attnames).first()
+    return row is None or any(getattr(instance, attname) != value
+                              for attname, value in zip(attnames, row))
+
+
+# bumped when rows of a model are changed without their loaded instances
+# (see invalidate_snapshots), the snapshots taken before are not used
+_snapshot_generations = {}
+
+
+def get_snapshot_generation(model):
+    return _snapshot_generations.get(model._meta.concrete_model, 0)
+
+
+def invalidate_snapshots(model):
+    """
+    Stop using the snapshots of the loaded objects of model, after its rows
+    were changed by a bulk operation (QuerySet.update, bulk_update)
+    """
+    model = model._meta.concrete_model
+    _snapshot_generations[model] = _snapshot_generations.get(model, 0) + 1
+
+
+def get_snapshot(instance):
+    """
+    Return a compact snapshot of the tracked values of instance, the
+    geometry is kept as EWKB so it is only written as WKT when needed
+    """
+    snapshot = {'pk': instance.pk, 'values': get_values(instance),
+                'generation': get_snapshot_generation(instance.__class__)}
+    if get_diff_class(instance.__class__) is Geomodeldiff:
+        geom = getattr(instance, instance.Modeldiff.geom_field)
+        snapshot['geom'] = bytes(geom.ewkb) if geom else None
+    return snapshot
+
+
+def update_snapshot(instance, snapshot, names):
+    """
+    Return a copy of snapshot with the values of the tracked fields names
+    (see get_update_fields) read from instance
+    """
+    values = get_values(instance)
+    snapshot = dict(snapshot, values=dict(snapshot['values']))
+    for name in names:
+        if name in values:
+            snapshot['values'][name] = values[name]
+    if 'geom' in snapshot and instance.Modeldiff.geom_field in names:
+        geom = getattr(instance, instance.Modeldiff.geom_field)
+        snapshot['geom'] = bytes(geom.ewkb) if geom else None
+    return snapshot
+
+
+def get_snapshot_values(model, snapshot):
+    """
+    Return the tracked values stored in a snapshot, like get_old_values
+    """
+    old_values = dict(snapshot['values'])
+    if 'geom' in snapshot:
+        geom = snapshot['geom']
+        if geom is not None:
+            geom = GEOSGeometry(memoryview(geom))
+        old_values[model.Modeldiff.geom_field] = geom
+    return old_values
+
+
+def new_diff(instance, action):
+    tracked = registry.get(instance.__class__)
+    diff = get_diff_class(instance.__class__)()
+    diff.applied = True
+    diff.model_name = tracked.model_name
+    diff.key = settings.MODELDIFF_KEY
+    diff.username = get_username(instance)
+    diff.model_id = instance.pk
+    diff.action = action
+
+    if tracked.unique_field:
+        diff.unique_id = getattr(instance, tracked.unique_field)
+
+    return diff
+
+
+def add_diff(instance, wkt_w=None):
+    """
+    Build (without saving) the diff for a new instance
+    """
+    diff = new_diff(instance, 'add')
+    new_values = get_values(instance)
+
+    if isinstance(diff, Geomodeldiff):
+        geom_field = instance.Modeldiff.geom_field
+        diff.the_geom = getattr(instance, geom_field)
+        diff.envelope = get_envelope(diff.the_geom)
+        new_geom_value = get_geom_value(instance, wkt_w)
+        if new_geom_value:
+            new_values[geom_field] = new_geom_value
+
+    diff.new_data = codec.dumps(new_values, diff.model_name)
+    diff.changed_fields = list(new_values)
+    return diff
+
+
+def geom_delta_value(instance, diff, old_geom, new_geom, wkt_w):
+    """
+    Return the new geometry value of an update diff of a geom_delta model:
+    a delta, the whole geometry for keyframes (also set in diff.the_geom)
+    or None if the change is below the precision
+    """
+    precision = getattr(instance.Modeldiff, 'geom_precision', None)
+    if getattr(instance.Modeldiff, 'geom_format', 'wkt') == 'wkb':
+        precision = None
+    delta = make_delta(old_geom, new_geom, precision)
+    if delta is not None:
+        if not delta['ops']:
+            return None
+        if not keyframe_due(instance, diff.__class__):
+            return delta
+    diff.the_geom = new_geom
+    return write_geom(instance.__class__, new_geom, wkt_w)
+
+
+def update_diff(old_values, instance, wkt_w=None, update_fields=None):
+    """
+    Build (without saving) the diff between the original values (see
+    get_old_values) and instance. The new geometry is only written if it
+    may have changed.
+
+    If update_fields is given, only changes to those fields are recorded
+    """
+    diff = new_diff(instance, 'update')
+
+    # compare original and current (instance)
+    new_values = {}
+    for k, new_value in get_values(instance).items():
+        if update_fields is not None and k not in update_fields:
+            continue
+        if old_values[k] != new_value:
+            new_values[k] = new_value
+
+    if isinstance(diff, Geomodeldiff):
+        update_geom_values(diff, instance, old_values, new_values,
+                           update_fields, wkt_w)
+
+    diff.old_data = codec.dumps(stored_old_values(instance, old_values,
+                                                  new_values),
+                                diff.model_name)
+    diff.new_data = codec.dumps(new_values, diff.model_name)
+    diff.changed_fields = list(new_values)
+    return diff
+
+
+def update_geom_values(diff, instance, old_values, new_values, update_fields,
+                       wkt_w=None):
+    """
+    Set the geometry of an update diff: the_geom, envelope and the old and
+    new values of the geometry in old_values/new_values
+    """
+    model = instance.__class__
+    geom_field = instance.Modeldiff.geom_field
+    if wkt_w is None:
+        wkt_w = get_wkt_writer(model)
+    new_geom = getattr(instance, geom_field)
+    diff.the_geom = new_geom
+    if update_fields is not None and geom_field not in update_fields:
+        # the geometry is not written by this save
+        old_values.pop(geom_field, None)
+        diff.envelope = get_envelope(new_geom)
+    elif getattr(instance.Modeldiff, 'geom_delta', False):
+        update_geom_delta(diff, instance, old_values, new_values, wkt_w)
+    else:
+        old_geom = old_values[geom_field]
+        diff.envelope = get_envelope(old_geom, new_geom)
+        old_values[geom_field] = write_geom(model, old_geom, wkt_w)
+        # compare original and new geometry, as written
+        if not same_geom(old_geom, new_geom):
+            new_geom_value = write_geom(model, new_geom, wkt_w)
+            if new_geom_value != old_values[geom_field]:
+                new_values[geom_field] = new_geom_value
+
+
+def update_geom_delta(diff, instance, old_values, new_values, wkt_w):
+    """
+    update_geom_values for geom_delta models (see modeldiff.geodelta): no
+    old geometry, the new one as a delta
+    """
+    geom_field = instance.Modeldiff.geom_field
+    old_geom = old_values.pop(geom_field)
+    new_geom = getattr(instance, geom_field)
+    diff.envelope = get_envelope(old_geom, new_geom)
+    diff.the_geom = None
+    if same_geom(old_geom, new_geom):
+        return
+    if new_geom is None:
+        # cleared, geom_delta_value returns None for it too
+        new_values[geom_field] = None
+        return
+    value = geom_delta_value(instance, diff, old_geom, new_geom, wkt_w)
+    if value is not None:
+        new_values[geom_field] = value
+
+
+def stored_old_values(instance, old_values, new_values):
+    """
+    Return the old values stored in an update diff: all of them, or only
+    the changed ones with Modeldiff.minimal_old_data
+    """
+    if getattr(instance.Modeldiff, 'minimal_old_data', False):
+        return minimal_old_values(old_values, new_values)
+    return old_values
+
+
+def minimal_old_values(old_values, new_values):
+    """
+    Return the old values of the fields in new_values, what an update diff
+    stores with Modeldiff.minimal_old_data (see
+    modeldiff.history.get_full_old_values for the whole previous state)
+    """
+    return dict((k, old_values[k]) for k in new_values if k in old_values)
+
+
+def delete_diff(instance, wkt_w=None):
+    """
+    Build (without saving) the diff for a deleted instance
+    """
+    diff = new_diff(instance, 'delete')
+    old_values = get_values(instance)
+
+    if isinstance(diff, Geomodeldiff):
+        # save geometry
+        geom = getattr(instance, instance.Modeldiff.geom_field)
+        diff.envelope = get_envelope(geom)
+        if getattr(instance.Modeldiff, 'delete_geom', True):
+            diff.the_geom = geom
+        old_values[instance.Modeldiff.geom_field] = get_geom_value(instance,
+                                                                   wkt_w)
+
+    diff.old_data = codec.dumps(old_values, diff.model_name)
+    diff.changed_fields = list(old_values)
+    return diff
+
+
+def skip_unchanged(instance, diff, update_fields=None):
+    """
+    Return what is skipped for the update diff of a save, following
+    Modeldiff.skip_unchanged when no tracked field changed: 'diff' (the
+    diff is not written), 'save' (the object is not saved either, only if
+    no other field changed) or None
+    """
+    option = getattr(instance.Modeldiff, 'skip_unchanged', False)
+    if not option or diff.changed_fields:
+        return None
+    unchanged_stats['diffs'] += 1
+    if option == 'save' and not untracked_changed(instance, update_fields):
+        unchanged_stats['saves'] += 1
+        return 'save'
+    return 'diff'
+
 
-            # compare original and current (self)
-            old_values = {}
-            new_values = {}
-            old_values_temp = model_to_dict(original,
-                                            fields=self.Modeldiff.fields)
-            new_values_temp = model_to_dict(self, fields=self.Modeldiff.fields)
-
-            for k in fields:
-                old_value = old_values_temp[k]
-                new_value = new_values_temp[k]
-
-                # Override DateField and DateTimeField
-                if isinstance(new_value, datetime.datetime):
-                    new_value = new_value.strftime("%Y-%m-%d %H:%M:%S.%f%z")
-                else:
-                    if isinstance(new_value, datetime.date):
-                        new_value = new_value.strftime("%Y-%m-%d")
-
-                if isinstance(old_value, datetime.datetime):
-                    old_value = old_value.strftime("%Y-%m-%d %H:%M:%S.%f%z")
-                else:
-                    if isinstance(old_value, datetime.date):
-                        old_value = old_value.strftime("%Y-%m-%d")
-
-                old_values[k] = old_value
-
-                if old_value != new_value:
-                    new_values[k] = new_value
-
-            diff.old_data = json.dumps(old_values)
-            diff.new_data = json.dumps(new_values)
-            diff.save()
+def group_diffs(diffs):
+    diffs_by_class = {}
+    for diff in diffs:
+        diffs_by_class.setdefault(diff.__class__, []).append(diff)
+    return diffs_by_class.items()
+
+
+def save_diffs(diffs):
+    """
+    Save diffs now, using one bulk_create per diff model
+    """
+    for diff_class, class_diffs in group_diffs(diffs):
+        diff_class.objects.bulk_create(class_diffs)
+
+
+def write_diffs(diffs):
+    """
+    Save diffs using one bulk_create per diff model, keep them in the
+    active buffer (see modeldiff.buffer.buffer_diffs) or queue them in the
+    asynchronous writer (see modeldiff.writer.get_writer)
+    """
+    writer = get_writer()
+
+    for diff_class, class_diffs in group_diffs(diffs):
+        diff_buffer = get_buffer(diff_class)
+        if diff_buffer is not None:
+            diff_buffer.add(class_diffs)
+        elif writer is not None:
+            # only queue them if the transaction commits
+            transaction.on_commit(partial(writer.put, class_diffs),
+                                  using=router.db_for_write(diff_class))
         else:
-            diff.action = 'add'
-            # save all new values
+            diff_class.objects.bulk_create(class_diffs)
+
+
+def get_parent_ids(model, objs):
+    """
+    Return the parent model (Modeldiff.parent_field) of model and the
+    distinct parent ids of objs, (None, set()) without parent_field
+    """
+    parent_field = registry.get(model).parent_field
+    if not parent_field:
+        return None, set()
+
+    field = model._meta.get_field(parent_field)
+    parent_ids = set(getattr(obj, field.attname) for obj in objs)
+    parent_ids.discard(None)
+    return field.related_model._meta.concrete_model, parent_ids
+
 
-            new_values_temp = model_to_dict(self, fields=self.Modeldiff.fields)
-            new_values = {}
+def save_parents(parent_model, parent_ids, using=None):
+    """
+    Save once each parent with parent_ids, at the end of the active buffer
+    if any (see modeldiff.buffer.buffer_diffs)
+    """
+    diff_buffer = get_buffer(Modeldiff)
+    if diff_buffer is not None:
+        diff_buffer.touch(parent_model, parent_ids)
+        return
 
-            for k in fields:
-                new_value = new_values_temp[k]
+    parents = parent_model._base_manager.db_manager(using).in_bulk(
+        parent_ids)
+    for parent_id in sorted(parents):
+        touch(parents[parent_id])
 
-                # Override DateField and DateTimeField
-                if isinstance(new_value, datetime.datetime):
-                    new_value = new_value.strftime("%Y-%m-%d %H:%M:%S.%f%z")
-                else:
-                    if isinstance(new_value, datetime.date):
-                        new_value = new_value.strftime("%Y-%m-%d")
 
-                new_values[k] = new_value
+def touch(parent):
+    """
+    Save parent because one of its children changed, its diff is written
+    even if none of its fields changed (see Modeldiff.skip_unchanged)
+    """
+    parent._modeldiff_touch = True
+    parent.save()
+
+
+def save_parent(obj):
+    """
+    Save the parent (Modeldiff.parent_field) of obj, at the end of the
+    active buffer if any
+    """
+    parent_field = registry.get(obj.__class__).parent_field
+    if not parent_field:
+        return
+
+    diff_buffer = get_buffer(Modeldiff)
+    if diff_buffer is None:
+        touch(getattr(obj, parent_field))
+        return
+
+    field = obj._meta.get_field(parent_field)
+    diff_buffer.touch(field.related_model._meta.concrete_model,
+                      [getattr(obj, field.attname)])
+
+
+def touch_parents(model, objs):
+    """
+    Save once each distinct parent (Modeldiff.parent_field) of objs
+    """
+    parent_model, parent_ids = get_parent_ids(model, objs)
+    if parent_ids:
+        save_parents(parent_model, parent_ids)
+
+
+class ignore_diffs(object):
+    """
+    No diffs are written for the deletions made on the database using
+    inside the block, including the objects deleted in cascade (see
+    DiffApplier, which must not track the diffs it applies)
+    """
+    def __init__(self, using=None):
+        self.using = using or router.db_for_write(Modeldiff)
+
+    def __enter__(self):
+        connection = connections[self.using]
+        self.previous = getattr(connection, 'modeldiff_ignore', False)
+        connection.modeldiff_ignore = True
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        connections[self.using].modeldiff_ignore = self.previous
+
+
+def diffs_ignored(using):
+    return getattr(connections[using], 'modeldiff_ignore', False)
+
+
+class ModeldiffCollector(Collector):
+    """
+    Deletion collector tracking all the objects it deletes at once (used by
+    delete() on the models and the SaveModeldiffQuerySet): the tracked
+    values of the objects of each model are read with one query, the
+    delete diffs are written with one bulk_create per diff model and each
+    parent (Modeldiff.parent_field) is saved once, unless it is deleted
+    too.
+
+    Objects marked with _modeldiff_ignore are not tracked, nor any object
+    inside ignore_diffs. The others are marked so the pre_delete receiver
+    (see modeldiff.signals), which tracks the deletions made by Django's
+    own collector, skips them
+    """
+    def delete(self):
+        with transaction.atomic(using=self.using, savepoint=False):
+            diffs, parents = self.get_diffs()
+            result = super(ModeldiffCollector, self).delete()
+            write_diffs(diffs)
+            for parent_model, parent_ids in parents.items():
+                if parent_ids:
+                    save_parents(parent_model, parent_ids, self.using)
+        return result
+
+    def get_diffs(self):
+        """
+        Return the delete diffs of the collected objects and the ids of the
+        parents to save, by model
+        """
+        if diffs_ignored(self.using):
+            return [], {}
+        deleted = {}
+        for model, instances in self.data.items():
+            deleted.setdefault(model._meta.concrete_model, set()).update(
+                obj.pk for obj in instances)
+
+        diffs = []
+        parents = {}
+        for model, instances in self.data.items():
+            if not hasattr(model, 'Modeldiff'):
+                continue
+            instances = sorted((obj for obj in instances
+                                if not hasattr(obj, '_modeldiff_ignore')),
+                               key=lambda obj: obj.pk)
+            if not instances:
+                continue
+
+            originals = self.get_originals(model, instances)
+            wkt_w = get_wkt_writer(model)
+            for obj in instances:
+                obj._modeldiff_ignore = True
+                if obj.pk in originals:
+                    diff = delete_diff(originals[obj.pk], wkt_w)
+                    diff.username = get_username(obj)
+                    diffs.append(diff)
+
+            parent_model, parent_ids = get_parent_ids(model,
+                                                      originals.values())
+            if parent_ids:
+                parent_ids -= deleted.get(parent_model, set())
+                parents.setdefault(parent_model, set()).update(parent_ids)
+        return diffs, parents
+
+    def get_originals(self, model, instances):
+        """
+        Return the objects of instances as stored in the database, by pk,
+        with only the fields read by delete_diff (and get_username)
+        """
+        tracked = registry.get(model)
+        names = set(tracked.fields)
+        names.update(name for name in (tracked.geom_field,
+                                       tracked.unique_field,
+                                       tracked.parent_field) if name)
+        names.update(field.name for field in model._meta.concrete_fields
+                     if field.name == 'username')
+        queryset = model._base_manager.using(self.using)
+        if names:
+            queryset = queryset.only(*names)
+        return queryset.in_bulk([obj.pk for obj in instances])
+
+
+def delete_instance(instance, using=None, keep_parents=False):
+    """
+    Model.delete() with a ModeldiffCollector
+    """
+    if instance.pk is None:
+        raise ValueError('%s object can\'t be deleted because its %s '
+                         'attribute is set to None.' % (
+                             instance._meta.object_name,
+                             instance._meta.pk.attname))
+    using = using or router.db_for_write(instance.__class__,
+                                         instance=instance)
+    collector = ModeldiffCollector(using=using, origin=instance)
+    collector.collect([instance], keep_parents=keep_parents)
+    return collector.delete()
+
+
+def get_tracked_attnames(model):
+    tracked = registry.get(model)
+    names = list(tracked.fields)
+    if tracked.geom_field is not None:
+        names.append(tracked.geom_field)
+    return set(model._meta.get_field(name).attname for name in names)
+
+
+class SnapshotModeldiffMixin(models.Model):
+    """
+    With snapshot = True in the Modeldiff class, keep a snapshot of the
+    tracked values when the object is loaded, so save() compares against it
+    instead of fetching the original object from the database
+    """
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(SnapshotModeldiffMixin, cls).from_db(db, field_names,
+                                                              values)
+        instance.take_modeldiff_snapshot()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super(SnapshotModeldiffMixin, self).refresh_from_db(using, fields,
+                                                            **kwargs)
+        if fields is None:
+            self.take_modeldiff_snapshot()
+        else:
+            # other fields may have been modified, use the database instead
+            self.__dict__.pop('_modeldiff_snapshot', None)
+
+    def take_modeldiff_snapshot(self, update_fields=None):
+        """
+        Keep the tracked values of the object. After a save(update_fields=)
+        only the tracked fields in update_fields (see get_update_fields)
+        were written, only they are refreshed in the current snapshot
+        """
+        snapshot = self.get_modeldiff_snapshot()
+        self.__dict__.pop('_modeldiff_snapshot', None)
+        if not getattr(self.Modeldiff, 'snapshot', False) or self.pk is None:
+            return
+        if update_fields is not None:
+            if snapshot is not None:
+                self._modeldiff_snapshot = update_snapshot(self, snapshot,
+                                                           update_fields)
+            return
+
+        # never load deferred fields, save() will fetch the original instead
+        deferred = self.get_deferred_fields()
+        if deferred and deferred & get_tracked_attnames(self.__class__):
+            return
 
-            diff.new_data = json.dumps(new_values)
-            diff.save()
+        self._modeldiff_snapshot = get_snapshot(self)
+
+    def get_modeldiff_snapshot(self):
+        """
+        Return the snapshot of the object, None if there is none or it is
+        outdated
+        """
+        snapshot = getattr(self, '_modeldiff_snapshot', None)
+        if (snapshot is not None and snapshot['pk'] == self.pk and
+                snapshot['generation'] ==
+                get_snapshot_generation(self.__class__)):
+            return snapshot
+        return None
+
+    def get_modeldiff_old_values(self, update_fields=None):
+        """
+        Return the tracked values of the object as stored in the database,
+        only the update_fields ones (see get_update_fields) if given
+        """
+        snapshot = self.get_modeldiff_snapshot()
+        if snapshot is not None:
+            old_values = get_snapshot_values(self.__class__, snapshot)
+            if update_fields is not None:
+                old_values = dict((name, value)
+                                  for name, value in old_values.items()
+                                  if name in update_fields)
+            return old_values
+        if update_fields is not None:
+            return get_partial_old_values(self, update_fields)
+
+        # get original object in database
+        original = self.__class__.objects.get(pk=self.pk)
+        return get_old_values(original)
+
+    class Meta:
+        abstract = True
+
+
+class SaveModeldiffMixin(SnapshotModeldiffMixin, models.Model):
+    """
+    Use real=True to access the real save function
+    otherwise the Modeldiff logic will apply
+    """
+    def save(self, *args, **kwargs):
+        # see if we need to save the object (real = True)
+        # or should generate a Modeldiff (real = False)
+        ignore = kwargs.get('modeldiff_ignore', False)
+
+        if ignore or empty_update_fields(kwargs.get('update_fields')):
+            # call original handler
+            kwargs.pop('modeldiff_ignore', None)
+            super(SaveModeldiffMixin, self).save(*args, **kwargs)
+            return
+
+        touched = self.__dict__.pop('_modeldiff_touch', False)
+        skip = None
+        update_fields = get_update_fields(self.__class__,
+                                          kwargs.get('update_fields'))
+        if self.pk:
+            diff = update_diff(self.get_modeldiff_old_values(update_fields),
+                               self, update_fields=update_fields)
+            if not touched:
+                skip = skip_unchanged(self, diff, kwargs.get('update_fields'))
+                if skip == 'save':
+                    return
+        else:
+            diff = add_diff(self)
 
         super(SaveModeldiffMixin, self).save(*args, **kwargs)
-        if diff.model_id is None and self.pk:
-            diff.model_id = self.pk
-            diff.save()
+        self.take_modeldiff_snapshot(update_fields)
+        if skip is None:
+            if diff.model_id is None:
+                diff.model_id = self.pk
+            write_diffs([diff])
+            save_parent(self)
 
-        if hasattr(self.Modeldiff, 'parent_field'):
-            getattr(self, self.Modeldiff.parent_field).save()
+    def delete(self, using=None, keep_parents=False):
+        return delete_instance(self, using, keep_parents)
 
     # this is best handled using signals
     def delete_deprecated(self, *args, **kwargs):  # pragma: no cover
@@ -153,43 +975,10 @@ class SaveModeldiffMixin(models.Model):
             super(SaveModeldiffMixin, self).delete(*args, **kwargs)
             return
 
-        fields = self.Modeldiff.fields
-
-        diff = Modeldiff()
-        diff.model_name = self.Modeldiff.model_name
-        if hasattr(self, 'username'):
-            diff.username = self.username
-        else:
-            try:
-                diff.username = GlobalRequest().user.username
-            except Exception:
-                pass
-
         if self.pk:
-            diff.model_id = self.pk
-            diff.action = 'delete'
             # get original object in database
             original = self.__class__.objects.get(pk=self.pk)
-
-            # save old values
-            old_values_temp = model_to_dict(original,
-                                            fields=self.Modeldiff.fields)
-            old_values = {}
-
-            for k in fields:
-                old_value = old_values_temp[k]
-
-                # Override DateField and DateTimeField
-                if isinstance(old_value, datetime.datetime):
-                    old_value = old_value.strftime("%Y-%m-%d %H:%M:%S.%f%z")
-                else:
-                    if isinstance(old_value, datetime.date):
-                        old_value = old_value.strftime("%Y-%m-%d")
-
-                old_values[k] = old_value
-
-            diff.old_data = json.dumps(old_values)
-            diff.save()
+            delete_diff(original).save()
 
         super(SaveModeldiffMixin, self).delete(*args, **kwargs)
 
@@ -200,7 +989,7 @@ class SaveModeldiffMixin(models.Model):
         abstract = True
 
 
-class SaveGeomodeldiffMixin(models.Model):
+class SaveGeomodeldiffMixin(SnapshotModeldiffMixin, models.Model):
     """
     Use real=True to access the real save function
     otherwise the Modeldiff logic will apply
@@ -210,126 +999,42 @@ class SaveGeomodeldiffMixin(models.Model):
         # or should generate a Modeldiff (real = False)
         ignore = kwargs.get('modeldiff_ignore', False)
 
-        if ignore:
+        if ignore or empty_update_fields(kwargs.get('update_fields')):
             # call original handler
-            kwargs.pop('modeldiff_ignore')
+            kwargs.pop('modeldiff_ignore', None)
             super(SaveGeomodeldiffMixin, self).save(*args, **kwargs)
             return
 
-        fields = self.Modeldiff.fields
-        geom_field = self.Modeldiff.geom_field
-        geom_precision = self.Modeldiff.geom_precision
-
-        diff = Geomodeldiff()
-        diff.applied = True
-        diff.model_name = self.Modeldiff.model_name
-        diff.key = settings.MODELDIFF_KEY
-        if hasattr(self, 'username'):
-            diff.username = self.username
-        else:
-            try:
-                diff.username = GlobalRequest().user.username
-            except Exception:
-                pass
-
-        unique_field = getattr(self.Modeldiff, 'unique_field', None)
-        if unique_field:
-            diff.unique_id = getattr(self, unique_field)
-
-        original = None
+        touched = self.__dict__.pop('_modeldiff_touch', False)
+        skip = None
+        old_values = None
+        update_fields = get_update_fields(self.__class__,
+                                          kwargs.get('update_fields'))
         if self.pk:
-            # get original object in database
             try:
-                original = self.__class__.objects.get(pk=self.pk)
+                old_values = self.get_modeldiff_old_values(update_fields)
             except Exception:
                 pass
-        wkt_w = WKTWriter(precision=geom_precision)
-        if original:
-            diff.model_id = self.pk
-            diff.action = 'update'
-
-            # compare original and current (self)
-            old_values = {}
-            new_values = {}
-            old_values_temp = model_to_dict(original,
-                                            fields=self.Modeldiff.fields)
-            new_values_temp = model_to_dict(self,
-                                            fields=self.Modeldiff.fields)
-
-            for k in fields:
-                old_value = old_values_temp[k]
-                new_value = new_values_temp[k]
-
-                # Override DateField and DateTimeField
-                if isinstance(new_value, datetime.datetime):
-                    new_value = new_value.strftime("%Y-%m-%d %H:%M:%S.%f%z")
-                else:
-                    if isinstance(new_value, datetime.date):
-                        new_value = new_value.strftime("%Y-%m-%d")
-
-                if isinstance(old_value, datetime.datetime):
-                    old_value = old_value.strftime("%Y-%m-%d %H:%M:%S.%f%z")
-                else:
-                    if isinstance(old_value, datetime.date):
-                        old_value = old_value.strftime("%Y-%m-%d")
-
-                old_values[k] = old_value
-
-                if old_value != new_value:
-                    new_values[k] = new_value
-
-            # save original geometry
-            geom = getattr(original, geom_field)
-            if geom:
-                old_values[geom_field] = wkt_w.write(geom).decode('utf8')
-            else:
-                old_values[geom_field] = None
-
-            # compare original and new geometry
-            new_geom = getattr(self, geom_field)
-            diff.the_geom = new_geom
-            if new_geom:
-                new_geom_value = wkt_w.write(new_geom).decode('utf8')
-            else:
-                new_geom_value = None
-
-            if not new_geom_value == old_values[geom_field]:
-                new_values[geom_field] = new_geom_value
 
-            diff.old_data = json.dumps(old_values)
-            diff.new_data = json.dumps(new_values)
-            diff.save()
+        if old_values is not None:
+            diff = update_diff(old_values, self, update_fields=update_fields)
+            if not touched:
+                skip = skip_unchanged(self, diff, kwargs.get('update_fields'))
+                if skip == 'save':
+                    return
         else:
-            diff.action = 'add'
-            # save all new values
-            new_values_temp = model_to_dict(self, fields=self.Modeldiff.fields)
-            new_values = {}
-
-            for k in fields:
-                new_value = new_values_temp[k]
-                # Override DateField and DateTimeField
-                if isinstance(new_value, datetime.datetime):
-                    new_value = new_value.strftime("%Y-%m-%d %H:%M:%S.%f%z")
-                else:
-                    if isinstance(new_value, datetime.date):
-                        new_value = new_value.strftime("%Y-%m-%d")
-
-                new_values[k] = new_value
-
-            new_geom = getattr(self, geom_field)
-            diff.the_geom = new_geom
-            if new_geom:
-                new_values[geom_field] = wkt_w.write(new_geom).decode('utf8')
-            diff.new_data = json.dumps(new_values)
-            diff.save()
+            diff = add_diff(self)
 
         super(SaveGeomodeldiffMixin, self).save(*args, **kwargs)
-        if diff.model_id is None and self.pk:
-            diff.model_id = self.pk
-            diff.save()
+        self.take_modeldiff_snapshot(update_fields)
+        if skip is None:
+            if diff.model_id is None:
+                diff.model_id = self.pk
+            write_diffs([diff])
+            save_parent(self)
 
-        if hasattr(self.Modeldiff, 'parent_field'):
-            getattr(self, self.Modeldiff.parent_field).save()
+    def delete(self, using=None, keep_parents=False):
+        return delete_instance(self, using, keep_parents)
 
     # this is best handled using signals
     def delete_deprecated(self, *args, **kwargs):  # pragma: no cover
@@ -341,54 +1046,10 @@ class SaveGeomodeldiffMixin(models.Model):
             super(SaveGeomodeldiffMixin, self).delete(*args, **kwargs)
             return
 
-        fields = self.Modeldiff.fields
-        geom_field = self.Modeldiff.geom_field
-        geom_precision = self.Modeldiff.geom_precision
-
-        diff = Geomodeldiff()
-        diff.model_name = self.Modeldiff.model_name
-        if hasattr(self, 'username'):
-            diff.username = self.username
-        else:
-            try:
-                diff.username = GlobalRequest().user.username
-            except Exception:
-                pass
-
         if self.pk:
-            diff.model_id = self.pk
-            diff.action = 'delete'
             # get original object in database
             original = self.__class__.objects.get(pk=self.pk)
-
-            # save old values
-            old_values_temp = model_to_dict(original,
-                                            fields=self.Modeldiff.fields)
-            old_values = {}
-
-            for k in fields:
-                old_value = old_values_temp[k]
-
-                # Override DateField and DateTimeField
-                if isinstance(old_value, datetime.datetime):
-                    old_value = old_value.strftime("%Y-%m-%d %H:%M:%S.%f%z")
-                else:
-                    if isinstance(old_value, datetime.date):
-                        old_value = old_value.strftime("%Y-%m-%d")
-
-                old_values[k] = old_value
-
-            # save geometry
-            geom = getattr(self, geom_field)
-            diff.the_geom = geom
-            wkt_w = WKTWriter(precision=geom_precision)
-            if geom:
-                old_values[geom_field] = wkt_w.write(geom).decode('utf8')
-            else:
-                old_values[geom_field] = None
-
-            diff.old_data = json.dumps(old_values)
-            diff.save()
+            delete_diff(original).save()
 
         super(SaveGeomodeldiffMixin, self).delete(*args, **kwargs)
 
@@ -0,0 +1,222 @@
+"""
+Declarative range partitioning of the diff tables by date_created, one
+partition per month (PostgreSQL only). Old months are detached, and dropped
+or kept as plain tables, instantly instead of deleting their rows.
+
+convert_to_partitioned() turns an existing table into a partitioned one:
+the current table becomes the partition of everything before the next
+month. The primary key becomes (id, date_created) as the partition key has
+to be part of it, and ids keep coming from a sequence.
+"""
+import datetime
+import re
+
+from django.db import NotSupportedError, connections, router, transaction
+from django.db.backends.utils import truncate_name
+from django.utils import timezone
+
+BOUND_RE = re.compile(r"FROM \((?:MINVALUE|'(\d{4}-\d{2}-\d{2})[^)]*)\) "
+                      r"TO \('(\d{4}-\d{2}-\d{2})")
+
+
+def month_start(date):
+    return datetime.date(date.year, date.month, 1)
+
+
+def add_months(date, months):
+    year, month = divmod(date.month - 1 + months, 12)
+    return datetime.date(date.year + year, month + 1, 1)
+
+
+def partition_name(table, start):
+    return truncate_name('%s_p%s' % (table, start.strftime('%Y%m')))
+
+
+def parse_bound(bound):
+    """
+    Return the (start, end) dates of a partition bound as shown by
+    pg_get_expr, start None from MINVALUE, None for the DEFAULT partition
+    """
+    match = BOUND_RE.search(bound)
+    if match is None:
+        return None
+    start, end = match.groups()
+    return (start and datetime.date.fromisoformat(start),
+            datetime.date.fromisoformat(end))
+
+
+def get_partitions(cursor, table):
+    """
+    Return the (name, start, end) of the range partitions of table
+    """
+    cursor.execute('SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) '
+                   'FROM pg_inherits i '
+                   'JOIN pg_class c ON c.oid = i.inhrelid '
+                   'WHERE i.inhparent = %s::regclass', [table])
+    partitions = []
+    for name, bound in cursor.fetchall():
+        dates = parse_bound(bound)
+        if dates is not None:
+            partitions.append((name,) + dates)
+    return partitions
+
+
+def get_connection(diff_class):
+    connection = connections[router.db_for_write(diff_class)]
+    if connection.vendor != 'postgresql':
+        raise NotSupportedError('Partitioning needs PostgreSQL')
+    return connection
+
+
+def is_partitioned(diff_class):
+    connection = get_connection(diff_class)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table '
+                       'WHERE partrelid = %s::regclass',
+                       [diff_class._meta.db_table])
+        return cursor.fetchone() is not None
+
+
+def convert_to_partitioned(diff_class, months=3):
+    """
+    Convert the table of diff_class into a table partitioned by month and
+    create the partitions of the next months. Not in a transaction: the
+    unique index of the new primary key is built concurrently and a CHECK
+    constraint matching the bound of the old table is validated first,
+    without blocking writes. The index then replaces the primary key of the
+    old table, so ATTACH PARTITION attaches it to the primary key of the
+    parent and uses the constraint instead of scanning the table while it
+    is locked
+    """
+    connection = get_connection(diff_class)
+    qn = connection.ops.quote_name
+    table = diff_class._meta.db_table
+    old = truncate_name('%s_pold' % table)
+    sequence = truncate_name('%s_id_part_seq' % table)
+    unique = truncate_name('%s_id_date_uniq' % table)
+    check = truncate_name('%s_pold_check' % table)
+    # the rows of the current month stay in the old table
+    end = add_months(month_start(timezone.now().date()), 1)
+
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS %s '
+                       'ON %s ("id", "date_created")' % (qn(unique),
+                                                         qn(table)))
+        cursor.execute('ALTER TABLE %s DROP CONSTRAINT IF EXISTS %s' % (
+            qn(table), qn(check)))
+        cursor.execute("ALTER TABLE %s ADD CONSTRAINT %s CHECK "
+                       "(\"date_created\" IS NOT NULL AND "
+                       "\"date_created\" < '%s') NOT VALID"
+                       % (qn(table), qn(check), end.isoformat()))
+        cursor.execute('ALTER TABLE %s VALIDATE CONSTRAINT %s' % (
+            qn(table), qn(check)))
+
+    with transaction.atomic(using=connection.alias), \
+            connection.cursor() as cursor:
+        # the unique index replaces the primary key (id), ATTACH PARTITION
+        # attaches it to the primary key of the parent
+        cursor.execute("SELECT conname FROM pg_constraint "
+                       "WHERE conrelid = %s::regclass AND contype = 'p'",
+                       [table])
+        drop_pkey = ''.join('DROP CONSTRAINT %s, ' % qn(name)
+                            for name, in cursor.fetchall())
+        cursor.execute('ALTER TABLE %s %sADD PRIMARY KEY USING INDEX %s' % (
+            qn(table), drop_pkey, qn(unique)))
+
+        cursor.execute('SELECT indexname, indexdef FROM pg_indexes '
+                       'WHERE tablename = %s', [table])
+        indexes = cursor.fetchall()
+
+        cursor.execute('ALTER TABLE %s RENAME TO %s' % (qn(table), qn(old)))
+        for name, indexdef in indexes:
+            cursor.execute('ALTER INDEX %s RENAME TO %s' % (
+                qn(name), qn(truncate_name('%s_old' % name))))
+        # ids come from the parent table from now on
+        cursor.execute('ALTER TABLE %s ALTER COLUMN "id" DROP IDENTITY '
+                       'IF EXISTS' % qn(old))
+        cursor.execute('ALTER TABLE %s ALTER COLUMN "id" DROP DEFAULT'
+                       % qn(old))
+
+        cursor.execute('CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS) '
+                       'PARTITION BY RANGE ("date_created")'
+                       % (qn(table), qn(old)))
+        cursor.execute('ALTER TABLE %s ADD PRIMARY KEY ("id", '
+                       '"date_created")' % qn(table))
+        cursor.execute('CREATE SEQUENCE %s OWNED BY %s."id"'
+                       % (qn(sequence), qn(table)))
+        cursor.execute("SELECT setval(%%s, COALESCE(MAX(id), 0) + 1, false) "
+                       "FROM %s" % qn(old), [sequence])
+        cursor.execute("ALTER TABLE %s ALTER COLUMN \"id\" SET DEFAULT "
+                       "nextval('%s')" % (qn(table), sequence))
+
+        # recreate the indexes on the parent, the ones of the old table are
+        # attached to them
+        for name, indexdef in indexes:
+            if not indexdef.startswith('CREATE UNIQUE'):
+                cursor.execute(indexdef)
+        cursor.execute("ALTER TABLE %s ATTACH PARTITION %s FOR VALUES FROM "
+                       "(MINVALUE) TO ('%s')"
+                       % (qn(table), qn(old), end.isoformat()))
+        # the partition bound replaces it
+        cursor.execute('ALTER TABLE %s DROP CONSTRAINT %s' % (qn(old),
+                                                              qn(check)))
+        cursor.execute('CREATE TABLE %s PARTITION OF %s DEFAULT' % (
+            qn(truncate_name('%s_pdefault' % table)), qn(table)))
+
+    create_partitions(diff_class, months)
+
+
+def create_partitions(diff_class, months=3):
+    """
+    Create the missing partitions of the current month and the next
+    months, skipping the months already covered (by the old table after
+    convert_to_partitioned)
+    """
+    connection = get_connection(diff_class)
+    qn = connection.ops.quote_name
+    table = diff_class._meta.db_table
+    first = month_start(timezone.now().date())
+
+    created = []
+    with connection.cursor() as cursor:
+        partitions = get_partitions(cursor, table)
+        for i in range(months + 1):
+            start = add_months(first, i)
+            end = add_months(start, 1)
+            if any((other_start is None or other_start < end) and
+                   other_end > start
+                   for other, other_start, other_end in partitions):
+                continue
+            name = partition_name(table, start)
+            cursor.execute('SELECT to_regclass(%s)', [name])
+            if cursor.fetchone()[0] is not None:
+                continue
+            cursor.execute("CREATE TABLE %s PARTITION OF %s FOR VALUES FROM "
+                           "('%s') TO ('%s')" % (
+                               qn(name), qn(table), start.isoformat(),
+                               end.isoformat()))
+            created.append(name)
+    return created
+
+
+def detach_partitions(diff_class, before, drop=False):
+    """
+    Detach the partitions with all their diffs older than the date before,
+    and drop them if drop. Detached partitions are plain tables that can be
+    archived with pg_dump. Return the names of the partitions
+    """
+    connection = get_connection(diff_class)
+    qn = connection.ops.quote_name
+    table = diff_class._meta.db_table
+
+    detached = []
+    with connection.cursor() as cursor:
+        for name, start, end in get_partitions(cursor, table):
+            if end > before:
+                continue
+            cursor.execute('ALTER TABLE %s DETACH PARTITION %s' % (
+                qn(table), qn(name)))
+            if drop:
+                cursor.execute('DROP TABLE %s' % qn(name))
+            detached.append(name)
+    return detached
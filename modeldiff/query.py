@@ -0,0 +1,112 @@
+from django.contrib.gis.db import models
+from django.db import transaction
+
+from modeldiff.models import (ModeldiffCollector, add_diff, get_old_values,
+                              get_update_fields, get_wkt_writer,
+                              invalidate_snapshots, touch_parents,
+                              update_diff, write_diffs)
+
+
+class SaveModeldiffQuerySet(models.QuerySet):
+    """
+    QuerySet for tracked models that also records the diffs of bulk
+    operations (bulk_create, bulk_update, update and delete), writing all
+    the Modeldiff/Geomodeldiff rows of a batch with a single bulk_create
+
+    Use it as the model manager:
+        objects = SaveModeldiffQuerySet.as_manager()
+    """
+    def bulk_create(self, objs, batch_size=None, ignore_conflicts=False,
+                    update_conflicts=False, **kwargs):
+        if ignore_conflicts or update_conflicts:
+            # the objects skipped or updated on conflict are not added, and
+            # are not known without their pk
+            raise ValueError('bulk_create() with ignore_conflicts or '
+                             'update_conflicts is not tracked, use '
+                             'untracked().bulk_create()')
+        objs = list(objs)
+        wkt_w = get_wkt_writer(self.model)
+
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = super(SaveModeldiffQuerySet, self).bulk_create(
+                objs, batch_size=batch_size, **kwargs)
+            # the values as inserted, with the pk set by the database
+            diffs = [add_diff(obj, wkt_w) for obj in objs
+                     if obj.pk is not None]
+            write_diffs(diffs)
+            touch_parents(self.model, objs)
+
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        wkt_w = get_wkt_writer(self.model)
+
+        with transaction.atomic(using=self.db, savepoint=False):
+            # get original objects in database with a single query
+            originals = self.in_bulk([obj.pk for obj in objs])
+            update_fields = get_update_fields(self.model, fields)
+            diffs = [update_diff(get_old_values(originals[obj.pk]),
+                                 obj, wkt_w, update_fields)
+                     for obj in objs if obj.pk in originals]
+            # bulk_update calls update(), skip tracking it again
+            rows = self.untracked().bulk_update(objs, fields, *args, **kwargs)
+            invalidate_snapshots(self.model)
+            write_diffs(diffs)
+            touch_parents(self.model, objs)
+
+        return rows
+
+    def delete(self):
+        # QuerySet.delete() with a ModeldiffCollector
+        self._not_support_combined_queries('delete')
+        if self.query.is_sliced:
+            raise TypeError("Cannot use 'limit' or 'offset' with delete().")
+        if self.query.distinct_fields:
+            raise TypeError('Cannot call delete() after .distinct(*fields).')
+        if self._fields is not None:
+            raise TypeError('Cannot call delete() after .values() or '
+                            '.values_list()')
+
+        del_query = self._chain()
+        del_query._for_write = True
+        # disable non-supported fields
+        del_query.query.select_for_update = False
+        del_query.query.select_related = False
+        del_query.query.clear_ordering(force=True)
+
+        collector = ModeldiffCollector(using=del_query.db, origin=self)
+        collector.collect(del_query)
+        deleted, _rows_count = collector.delete()
+
+        # clear the result cache, in case this QuerySet gets reused
+        self._result_cache = None
+        return deleted, _rows_count
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def untracked(self):
+        """
+        Return a plain QuerySet, bulk operations on it won't be tracked
+        """
+        return models.QuerySet(model=self.model, query=self.query.chain(),
+                               using=self._db, hints=self._hints)
+
+    def update(self, **kwargs):
+        wkt_w = get_wkt_writer(self.model)
+
+        with transaction.atomic(using=self.db, savepoint=False):
+            originals = list(self.all())
+            rows = super(SaveModeldiffQuerySet, self).update(**kwargs)
+            invalidate_snapshots(self.model)
+            # values may be expressions, read them back from the database
+            updated = self.model._base_manager.using(self.db).in_bulk(
+                [original.pk for original in originals])
+            diffs = [update_diff(get_old_values(original),
+                                 updated[original.pk], wkt_w)
+                     for original in originals if original.pk in updated]
+            write_diffs(diffs)
+            touch_parents(self.model, updated.values())
+
+        return rows
@@ -0,0 +1,138 @@
+"""
+Registry of the tracked models (the models with a Modeldiff class), built
+once when the app is ready (see modeldiff.apps). The Modeldiff options
+describing a model (model_name, fields, geom_field, unique_field and
+parent_field) are validated there, a misconfigured model raises
+ImproperlyConfigured at startup instead of failing at its first save.
+
+    registry.get(PersonModel).parent_field
+    registry.get_model('modeldiff.PersonModel')
+"""
+from django.contrib.gis.db.models import GeometryField
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+
+# max_length of ModeldiffMixin.model_name
+MODEL_NAME_MAX_LENGTH = 50
+
+
+class TrackedModel(object):
+    """
+    The Modeldiff options of a tracked model
+    """
+    def __init__(self, model):
+        options = model.Modeldiff
+        self.model = model
+        self.model_name = getattr(options, 'model_name', None)
+        self.fields = tuple(getattr(options, 'fields', ()))
+        self.geom_field = getattr(options, 'geom_field', None)
+        self.unique_field = getattr(options, 'unique_field', None)
+        self.parent_field = getattr(options, 'parent_field', None)
+        self.validate()
+
+    def error(self, message):
+        return ImproperlyConfigured('%s.Modeldiff: %s' % (
+            self.model._meta.label, message))
+
+    def get_field(self, name, option):
+        try:
+            return self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise self.error('%s %s is not a field of the model' % (
+                option, name))
+
+    def validate(self):
+        self.validate_model_name()
+        self.validate_fields()
+        if self.geom_field is not None:
+            self.validate_geom_field()
+        if self.unique_field is not None:
+            self.get_field(self.unique_field, 'unique_field')
+        if self.parent_field is not None:
+            self.validate_parent_field()
+
+    def validate_model_name(self):
+        if not self.model_name:
+            raise self.error('model_name is required')
+        if len(self.model_name) > MODEL_NAME_MAX_LENGTH:
+            raise self.error('model_name is longer than %d characters' %
+                             MODEL_NAME_MAX_LENGTH)
+
+    def validate_fields(self):
+        for name in self.fields:
+            field = self.get_field(name, 'fields:')
+            if field.many_to_many or field.one_to_many:
+                raise self.error('fields: %s is not a concrete field' % name)
+
+    def validate_geom_field(self):
+        field = self.get_field(self.geom_field, 'geom_field')
+        if not isinstance(field, GeometryField):
+            raise self.error('geom_field %s is not a geometry field' %
+                             self.geom_field)
+        if (getattr(self.model.Modeldiff, 'geom_format', 'wkt') == 'wkt'
+                and not hasattr(self.model.Modeldiff, 'geom_precision')):
+            raise self.error('geom_precision is required to store the '
+                             'geometry as WKT')
+
+    def validate_parent_field(self):
+        field = self.get_field(self.parent_field, 'parent_field')
+        if not (field.many_to_one or field.one_to_one):
+            raise self.error('parent_field %s is not a foreign key' %
+                             self.parent_field)
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.by_model = {}
+        self.by_name = {}
+        self.choices = {False: (), True: ()}
+
+    def populate(self, models):
+        """
+        Register the tracked models among models
+        """
+        for model in models:
+            if hasattr(model, 'Modeldiff'):
+                self.register(model)
+
+    def register(self, model):
+        tracked = TrackedModel(model)
+        other = self.by_name.get(tracked.model_name)
+        if other is None:
+            self.by_name[tracked.model_name] = tracked
+            geo = tracked.geom_field is not None
+            self.choices[geo] += ((tracked.model_name, tracked.model_name),)
+        elif not (issubclass(model, other.model) or
+                  issubclass(other.model, model)):
+            # proxies and subclasses inherit the Modeldiff class
+            raise tracked.error('model_name %s is already used by %s' % (
+                tracked.model_name, other.model._meta.label))
+        self.by_model[model] = tracked
+        return tracked
+
+    def get(self, model):
+        """
+        Return the TrackedModel of model, registering it if it was created
+        after the registry was populated
+        """
+        tracked = self.by_model.get(model)
+        if tracked is None:
+            tracked = self.register(model)
+        return tracked
+
+    def get_model(self, model_name):
+        """
+        Return the model with Modeldiff.model_name, None if not installed
+        """
+        tracked = self.by_name.get(model_name)
+        return tracked.model if tracked is not None else None
+
+    def model_names(self, geo=False):
+        """
+        Return the (model_name, model_name) choices of the models tracked
+        with Geomodeldiff if geo, with Modeldiff otherwise
+        """
+        return self.choices[geo]
+
+
+registry = Registry()
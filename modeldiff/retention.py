@@ -0,0 +1,118 @@
+"""
+Retention of the diff tables, configured per model_name in days with the
+MODELDIFF_RETENTION setting ('default' applies to the other model names, a
+None value keeps the diffs forever):
+
+    MODELDIFF_RETENTION = {
+        'default': 365,
+        'modeldiff.PersonModel': 30,
+    }
+
+Expired diffs are deleted in small id ranges, each one in its own
+transaction, optionally archived first to gzipped JSON lines files.
+"""
+import datetime
+import gzip
+import json
+import os
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from modeldiff.export import diff_to_row, get_columns
+
+
+def get_retention():
+    return getattr(settings, 'MODELDIFF_RETENTION', None) or {}
+
+
+def expired_querysets(diff_class, now=None):
+    """
+    Return the querysets of the diffs of diff_class past their retention
+    """
+    now = now or timezone.now()
+    retention = get_retention()
+    names = [name for name in retention if name != 'default']
+
+    querysets = []
+    for name in names:
+        if retention[name] is not None:
+            querysets.append(diff_class.objects.filter(
+                model_name=name,
+                date_created__lt=now - datetime.timedelta(retention[name])))
+    if retention.get('default') is not None:
+        querysets.append(diff_class.objects.exclude(
+            model_name__in=names).filter(
+            date_created__lt=now - datetime.timedelta(retention['default'])))
+    return querysets
+
+
+class DiffArchive(object):
+    """
+    Gzipped JSON lines file, one diff per line
+
+        with DiffArchive(path) as archive:
+            prune(queryset, archive=archive)
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path, 'at', encoding='utf8')
+
+    def write(self, diffs):
+        for diff in diffs:
+            row = diff_to_row(diff, get_columns(diff.__class__))
+            self.file.write(json.dumps(row))
+            self.file.write('\n')
+        # the diffs are deleted next, make sure they are on disk
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def get_archive_path(directory, diff_class, now=None):
+    now = now or timezone.now()
+    return os.path.join(directory, '%s-%s.jsonl.gz' % (
+        diff_class._meta.db_table, now.strftime('%Y%m%dT%H%M%S')))
+
+
+def prune(queryset, chunk_size=5000, archive=None, sleep=0):
+    """
+    Delete the diffs of queryset in chunks of chunk_size ids, each one in a
+    transaction, writing them to archive (a DiffArchive) first if given.
+    Wait sleep seconds between chunks.
+
+    Return the number of diffs deleted
+    """
+    diff_class = queryset.model
+    count = 0
+    last_id = 0
+    while True:
+        chunk = queryset.filter(id__gt=last_id).order_by('id')[:chunk_size]
+        if archive is not None:
+            diffs = list(chunk)
+            ids = [diff.id for diff in diffs]
+        else:
+            ids = list(chunk.values_list('id', flat=True))
+        if not ids:
+            return count
+
+        if archive is not None:
+            archive.write(diffs)
+        with transaction.atomic(using=queryset.db):
+            deleted, _ = diff_class.objects.using(queryset.db).filter(
+                id__in=ids).delete()
+
+        count += deleted
+        last_id = ids[-1]
+        if sleep:
+            time.sleep(sleep)
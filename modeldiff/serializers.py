@@ -0,0 +1,96 @@
+import datetime
+from operator import attrgetter
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f%z"
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def serialize_value(value):
+    # Override DateField and DateTimeField
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DATETIME_FORMAT)
+    if isinstance(value, datetime.date):
+        return value.strftime(DATE_FORMAT)
+    return value
+
+
+def serialize_date(value):
+    # isoformat() is much faster than strftime(), both agree from year 1000
+    if type(value) is datetime.date and value.year >= 1000:
+        return value.isoformat()
+    return serialize_value(value)
+
+
+def serialize_datetime(value):
+    if type(value) is datetime.datetime and value.year >= 1000:
+        text = value.isoformat(' ', 'microseconds')
+        # strftime's %z has no colons: +00:00 -> +0000
+        return text[:26] + text[26:].replace(':', '')
+    return serialize_value(value)
+
+
+CONVERTERS = {
+    'DateField': serialize_date,
+    'DateTimeField': serialize_datetime,
+}
+
+
+class FieldSerializer(object):
+    """
+    Reads the Modeldiff.fields of an instance as JSON serializable values.
+
+    Built once per model: the attributes are read directly (foreign keys by
+    their attname) and only date and datetime fields get a converter
+    """
+    def __init__(self, model):
+        self.names = tuple(model.Modeldiff.fields)
+        attnames = []
+        self.converters = []
+        for i, name in enumerate(self.names):
+            field = model._meta.get_field(name)
+            attnames.append(field.attname)
+            converter = CONVERTERS.get(field.get_internal_type())
+            if converter is not None:
+                self.converters.append((i, converter))
+
+        self.converters_by_name = dict((self.names[i], converter)
+                                       for i, converter in self.converters)
+
+        if not attnames:
+            self.getter = lambda instance: ()
+        elif len(attnames) == 1:
+            attname = attnames[0]
+            self.getter = lambda instance: (getattr(instance, attname),)
+        else:
+            self.getter = attrgetter(*attnames)
+
+    def serialize(self, name, value):
+        """
+        Return the JSON serializable value of the field name, value as read
+        from the database
+        """
+        converter = self.converters_by_name.get(name)
+        return converter(value) if converter is not None else value
+
+    def __call__(self, instance):
+        values = self.getter(instance)
+        if self.converters:
+            values = list(values)
+            for i, converter in self.converters:
+                values[i] = converter(values[i])
+        return dict(zip(self.names, values))
+
+
+_serializers = {}
+
+
+def compile_serializer(model):
+    _serializers[model] = FieldSerializer(model)
+    return _serializers[model]
+
+
+def get_serializer(model):
+    try:
+        return _serializers[model]
+    except KeyError:
+        return compile_serializer(model)
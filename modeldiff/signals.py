@@ -1,20 +1,18 @@
-import datetime
-import json
-
-from django.conf import settings
-from django.contrib.gis.geos import WKTWriter
 from django.db.models.signals import pre_delete
-from django.forms.models import model_to_dict
 
-from modeldiff.models import Geomodeldiff, Modeldiff
-from modeldiff.request import GlobalRequest
+from modeldiff.models import (Geomodeldiff, Modeldiff, delete_diff,
+                              diffs_ignored, get_username, save_parent,
+                              write_diffs)
+from modeldiff.serializers import compile_serializer
 
 
 class ModeldiffManager(object):
     def register_modeldiff(self, model):
+        compile_serializer(model)
         pre_delete.connect(self.modeldiff_pre_delete, model)
 
     def register_geomodeldiff(self, model):
+        compile_serializer(model)
         pre_delete.connect(self.geomodeldiff_pre_delete, model)
 
     def modeldiff_pre_delete(self, sender, **kwargs):
@@ -30,68 +28,19 @@ class ModeldiffManager(object):
         if hasattr(instance, '_modeldiff_ignore'):
             del instance._modeldiff_ignore
             return
-
-        fields = sender.Modeldiff.fields
-
-        diff = modeldiff_class()
-        diff.applied = True
-        diff.model_name = sender.Modeldiff.model_name
-        diff.key = settings.MODELDIFF_KEY
-        diff.username = self._get_username(instance)
-
-        diff.model_id = instance.pk
-        diff.action = 'delete'
-
-        unique_field = getattr(sender.Modeldiff, 'unique_field', None)
-        if unique_field:
-            diff.unique_id = getattr(instance, unique_field)
+        if diffs_ignored(kwargs['using']):
+            return
 
         # get original object in database
         original = sender.objects.get(pk=instance.pk)
 
-        # save old values
-        old_values_temp = model_to_dict(original,
-                                        fields=sender.Modeldiff.fields)
-        old_values = {}
-
-        for k in fields:
-            old_value = old_values_temp[k]
-
-            # Override DateField and DateTimeField
-            if isinstance(old_value, datetime.datetime):
-                old_value = old_value.strftime("%Y-%m-%d %H:%M:%S.%f%z")
-            else:
-                if isinstance(old_value, datetime.date):
-                    old_value = old_value.strftime("%Y-%m-%d")
-
-            old_values[k] = old_value
-
-        if modeldiff_class == Geomodeldiff:
-            geom_field = sender.Modeldiff.geom_field
-            geom_precision = sender.Modeldiff.geom_precision
-            wkt_w = WKTWriter(precision=geom_precision)
-            # save geometry
-            geom = getattr(instance, geom_field)
-            diff.the_geom = geom
-            if geom:
-                old_values[geom_field] = wkt_w.write(geom).decode('utf8')
-            else:
-                old_values[geom_field] = None
-
-        diff.old_data = json.dumps(old_values)
-        diff.save()
-
-        if hasattr(sender.Modeldiff, 'parent_field'):
-            getattr(instance, sender.Modeldiff.parent_field).save()
+        diff = delete_diff(original)
+        diff.username = self._get_username(instance)
+        write_diffs([diff])
+        save_parent(instance)
 
     def _get_username(self, instance):
-        if hasattr(instance, 'username'):
-            return instance.username
-        else:
-            try:
-                return GlobalRequest().user.username
-            except Exception:
-                return ''
+        return get_username(instance)
 
 
 modeldiff_manager = ModeldiffManager()
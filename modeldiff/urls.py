@@ -0,0 +1,14 @@
+from django.urls import path
+
+from modeldiff.models import Geomodeldiff
+from modeldiff.views import ChangesView
+
+app_name = 'modeldiff'
+
+urlpatterns = [
+    path('changes/', ChangesView.as_view(), name='changes'),
+    path('geochanges/', ChangesView.as_view(
+        diff_class=Geomodeldiff,
+        permission_required='modeldiff.view_geomodeldiff'),
+        name='geochanges'),
+]
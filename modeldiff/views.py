@@ -0,0 +1,92 @@
+import hashlib
+import json
+
+from django.contrib.auth.mixins import PermissionRequiredMixin
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import Length
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.text import compress_sequence
+from django.views import View
+
+from modeldiff.export import GEOM_FORMATS, diff_to_row, get_columns
+from modeldiff.models import Modeldiff
+
+
+class ChangesView(PermissionRequiredMixin, View):
+    """
+    Change feed of the diffs with id greater than ?since=, optionally from
+    one ?key=, as JSON lines in id order. At most ?limit= diffs are
+    returned, the next page starts after the id of the last line and an
+    empty response means there are no more changes.
+
+    Pages are read with keyset pagination and streamed. Responses have an
+    ETag, so a poll with If-None-Match and an unchanged page gets a 304
+    after one aggregate query. With gzip the body is compressed for the
+    clients that accept it.
+    """
+    diff_class = Modeldiff
+    permission_required = 'modeldiff.view_modeldiff'
+    raise_exception = True
+    default_limit = 1000
+    max_limit = 10000
+    chunk_size = 500
+    gzip = True
+
+    def get(self, request):
+        try:
+            since = int(request.GET.get('since', 0))
+            limit = min(int(request.GET.get('limit', self.default_limit)),
+                        self.max_limit)
+        except ValueError:
+            return HttpResponseBadRequest('since and limit must be integers')
+        if since < 0 or limit < 1:
+            return HttpResponseBadRequest('since must not be negative and '
+                                          'limit at least 1')
+        geom_format = request.GET.get('geom', 'wkt')
+        if geom_format not in GEOM_FORMATS:
+            return HttpResponseBadRequest('geom must be wkt or wkb')
+
+        queryset = self.diff_class.objects.all()
+        if 'key' in request.GET:
+            queryset = queryset.filter(key=request.GET['key'])
+
+        diffs = queryset.filter(id__gt=since).order_by('id')[:limit]
+        etag = self.get_etag(diffs, request.GET.urlencode())
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
+
+        content = self.stream(diffs, geom_format)
+        response = StreamingHttpResponse(content,
+                                         content_type='application/x-ndjson')
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if self.gzip and 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response.streaming_content = compress_sequence(
+                response.streaming_content)
+            response['Content-Encoding'] = 'gzip'
+        return response
+
+    def get_etag(self, diffs, query):
+        """
+        Diffs are appended, but also marked as applied, rewritten (compacted,
+        recompressed, minimized, backfilled) or deleted later: the query and
+        the ids, applied flags, set values and data size of the diffs of the
+        page identify the response
+        """
+        aggregates = {'count': Count('id'), 'last_id': Max('id'),
+                      'applied': Count('id', filter=Q(applied=True)),
+                      'size': Sum(Length('old_data') + Length('new_data'))}
+        for field in self.diff_class._meta.concrete_fields:
+            if field.null:
+                aggregates[field.name] = Count(field.name)
+        state = sorted(diffs.aggregate(**aggregates).items())
+        digest = hashlib.md5(('%s|%s|%s' % (
+            self.diff_class.__name__, query, state)).encode('utf8'))
+        return '"%s"' % digest.hexdigest()
+
+    def stream(self, diffs, geom_format):
+        columns = get_columns(self.diff_class)
+        for diff in diffs.iterator(chunk_size=self.chunk_size):
+            yield json.dumps(diff_to_row(diff, columns, geom_format)) + '\n'
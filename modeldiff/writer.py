@@ -0,0 +1,167 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class AsyncDiffWriter(object):
+    """
+    Writes diffs from a background thread, so the INSERT is not done in the
+    request path. Diffs are queued in a bounded queue and the worker writes
+    them in batches with one bulk_create per diff model.
+
+    When the queue is full put() blocks up to block_timeout seconds (None
+    blocks until there is room) and then drops the diffs. A failed
+    bulk_create is retried up to retries times, retry_delay seconds apart
+    (growing with each attempt), before its diffs are counted as failed.
+    """
+    def __init__(self, max_queue_size=10000, batch_size=500,
+                 block_timeout=None, retries=3, retry_delay=1):
+        self.queue = queue.Queue(max_queue_size)
+        self.batch_size = batch_size
+        self.block_timeout = block_timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.thread = None
+        self.lock = threading.Lock()
+        # updated by the callers of put() and by the worker
+        self.stats_lock = threading.Lock()
+        self.stats = {'queued': 0, 'written': 0, 'blocked': 0,
+                      'dropped': 0, 'retried': 0, 'failed': 0}
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run,
+                                               name='modeldiff-writer',
+                                               daemon=True)
+                self.thread.start()
+
+    def put(self, diffs):
+        self.start()
+        for diff in diffs:
+            try:
+                self.queue.put_nowait(diff)
+            except queue.Full:
+                self.count('blocked')
+                try:
+                    self.queue.put(diff, timeout=self.block_timeout)
+                except queue.Full:
+                    self.count('dropped')
+                    continue
+            self.count('queued')
+
+    def count(self, name, value=1):
+        with self.stats_lock:
+            self.stats[name] += value
+
+    def run(self):
+        try:
+            while True:
+                batch = [self.queue.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                stop = _STOP in batch
+                # like a request, do not reuse a broken or expired connection
+                close_old_connections()
+                self.write([diff for diff in batch if diff is not _STOP])
+                for diff in batch:
+                    self.queue.task_done()
+                if stop:
+                    return
+        finally:
+            connections.close_all()
+
+    def write(self, diffs):
+        from modeldiff.models import group_diffs
+
+        for diff_class, class_diffs in group_diffs(diffs):
+            self.write_class(diff_class, class_diffs)
+
+    def write_class(self, diff_class, diffs):
+        """
+        Save diffs with one bulk_create, retrying it on errors
+        """
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.count('retried', len(diffs))
+                time.sleep(self.retry_delay * attempt)
+                close_old_connections()
+                for diff in diffs:
+                    diff.pk = None
+            try:
+                diff_class.objects.bulk_create(diffs)
+            except Exception:
+                logger.warning('Error writing %d diffs (attempt %d)',
+                               len(diffs), attempt + 1, exc_info=True)
+                continue
+            self.count('written', len(diffs))
+            return
+        self.count('failed', len(diffs))
+        logger.error('Dropped %d diffs after %d attempts', len(diffs),
+                     self.retries + 1)
+
+    def flush(self):
+        """
+        Wait until all the queued diffs are written
+        """
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.join()
+
+    def stop(self):
+        """
+        Write the queued diffs and stop the worker thread
+        """
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join()
+
+    def get_metrics(self):
+        with self.stats_lock:
+            metrics = dict(self.stats)
+        metrics['queue_depth'] = self.queue.qsize()
+        return metrics
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """
+    Return the AsyncDiffWriter configured in MODELDIFF_ASYNC_WRITER, or None
+
+        MODELDIFF_ASYNC_WRITER = {
+            'max_queue_size': 10000,
+            'batch_size': 500,
+            'block_timeout': None,
+            'retries': 3,
+            'retry_delay': 1,
+        }
+    """
+    global _writer
+
+    options = getattr(settings, 'MODELDIFF_ASYNC_WRITER', None)
+    if not options:
+        return None
+
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                if options is True:
+                    options = {}
+                _writer = AsyncDiffWriter(**options)
+                atexit.register(_writer.stop)
+    return _writer
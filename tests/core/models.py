@@ -1,6 +1,8 @@
 from django.contrib.gis.db import models
 
-from modeldiff.models import SaveGeomodeldiffMixin, SaveModeldiffMixin
+from modeldiff.models import (ModeldiffMixin, SaveGeomodeldiffMixin,
+                              SaveModeldiffMixin)
+from modeldiff.query import SaveModeldiffQuerySet
 from modeldiff.signals import modeldiff_manager
 
 
@@ -10,6 +12,8 @@ class PersonModel(SaveModeldiffMixin, models.Model):
     birthdate = models.DateField(null=True, blank=True)
     updated_at = models.DateTimeField(null=False, blank=False)
 
+    objects = SaveModeldiffQuerySet.as_manager()
+
     class Modeldiff:
         model_name = 'modeldiff.PersonModel'
         fields = ('name', 'surname', 'birthdate', 'updated_at')
@@ -22,6 +26,8 @@ class PersonGeoModel(SaveGeomodeldiffMixin, models.Model):
     updated_at = models.DateTimeField(null=False, blank=False)
     the_geom = models.PointField(srid=4326, null=True, blank=True)
 
+    objects = SaveModeldiffQuerySet.as_manager()
+
     class Modeldiff:
         model_name = 'modeldiff.PersonGeoModel'
         fields = ('name', 'surname', 'birthdate', 'updated_at')
@@ -29,16 +35,60 @@ class PersonGeoModel(SaveGeomodeldiffMixin, models.Model):
         geom_precision = 8
 
 
+class PersonSnapshotModel(SaveGeomodeldiffMixin, models.Model):
+    name = models.CharField(max_length=50, null=True, blank=True)
+    birthdate = models.DateField(null=True, blank=True)
+    the_geom = models.PointField(srid=4326, null=True, blank=True)
+
+    class Modeldiff:
+        model_name = 'modeldiff.PersonSnapshotModel'
+        fields = ('name', 'birthdate')
+        geom_field = 'the_geom'
+        geom_precision = 8
+        snapshot = True
+
+
+class ParcelModel(SaveGeomodeldiffMixin, models.Model):
+    name = models.CharField(max_length=50, null=True, blank=True)
+    the_geom = models.PolygonField(srid=4326, null=True, blank=True)
+
+    class Modeldiff:
+        model_name = 'modeldiff.ParcelModel'
+        fields = ('name',)
+        geom_field = 'the_geom'
+        geom_precision = 6
+        geom_delta = True
+        geom_keyframe = 3
+
+
 class PersonPropertyModel(SaveModeldiffMixin, models.Model):
     person = models.ForeignKey(PersonModel, on_delete=models.CASCADE)
     address = models.CharField(max_length=50, null=True, blank=True)
 
+    objects = SaveModeldiffQuerySet.as_manager()
+
     class Modeldiff:
         model_name = 'modeldiff.PersonPropertyModel'
         fields = ('person', 'address')
         parent_field = 'person'
 
 
+class PropertyRoomModel(SaveModeldiffMixin, models.Model):
+    property = models.ForeignKey(PersonPropertyModel,
+                                 on_delete=models.CASCADE)
+    name = models.CharField(max_length=50, null=True, blank=True)
+    # not tracked
+    area = models.IntegerField(null=True, blank=True)
+    username = models.CharField(max_length=50, blank=True, default='')
+
+    objects = SaveModeldiffQuerySet.as_manager()
+
+    class Modeldiff:
+        model_name = 'modeldiff.PropertyRoomModel'
+        fields = ('property', 'name')
+        parent_field = 'property'
+
+
 class PersonPropertyForGeoModel(SaveModeldiffMixin, models.Model):
     person = models.ForeignKey(PersonGeoModel, on_delete=models.CASCADE)
     address = models.CharField(max_length=50, null=True, blank=True)
@@ -49,8 +99,14 @@ class PersonPropertyForGeoModel(SaveModeldiffMixin, models.Model):
         parent_field = 'person'
 
 
-for model in (PersonModel, PersonPropertyModel, PersonPropertyForGeoModel):
+class PartitionDiff(ModeldiffMixin, models.Model):
+    # a diff table of its own for the partitioning tests
+    pass
+
+
+for model in (PersonModel, PersonPropertyModel, PropertyRoomModel,
+              PersonPropertyForGeoModel):
     modeldiff_manager.register_modeldiff(model)
 
-for model in (PersonGeoModel,):
+for model in (PersonGeoModel, PersonSnapshotModel, ParcelModel):
     modeldiff_manager.register_geomodeldiff(model)
@@ -0,0 +1,197 @@
+from django.core.management import call_command
+from django.test import TestCase
+from datetime import date, datetime, timezone
+from io import StringIO
+from unittest import mock
+
+import json
+import multiprocessing
+import os
+import queue
+
+from core.models import (PersonModel, PersonGeoModel, PersonPropertyModel,
+                         PropertyRoomModel)
+from modeldiff import apply
+from modeldiff.apply import (apply_diffs, get_partition, get_result,
+                             partition_batches, pending_querysets, put_task,
+                             run_worker)
+from modeldiff.models import Geomodeldiff, Modeldiff
+
+
+def remote_diff(diff_class, model_name, model_id, action, new_values=None,
+                old_values=None):
+    return diff_class.objects.create(
+        key='remote', applied=False, model_name=model_name,
+        model_id=model_id, action=action,
+        new_data=json.dumps(new_values) if new_values else '',
+        old_data=json.dumps(old_values) if old_values else '')
+
+
+class ApplyTests(TestCase):
+
+    def test_add_update_delete(self):
+        remote_diff(Modeldiff, 'modeldiff.PersonModel', 10, 'add',
+                    {'name': 'Foo', 'surname': 'Doe',
+                     'birthdate': '2007-12-05',
+                     'updated_at': '2015-01-07 22:00:10.292032+0000'})
+        remote_diff(Modeldiff, 'modeldiff.PersonPropertyModel', 20,
+                    'add', {'person': 10, 'address': 'Carme 15'})
+        remote_diff(Modeldiff, 'modeldiff.PersonModel', 10, 'update',
+                    {'name': 'Bar'})
+        remote_diff(Modeldiff, 'modeldiff.PersonPropertyModel', 20,
+                    'delete', old_values={'person': 10})
+
+        stats = apply_diffs(pending_querysets('remote'), batch_size=3)
+
+        self.assertEqual(stats, {'add': 2, 'update': 1, 'delete': 1,
+                                 'missing': 0})
+        person = PersonModel.objects.get(pk=10)
+        self.assertEqual(person.name, 'Bar')
+        self.assertEqual(person.surname, 'Doe')
+        self.assertEqual(person.birthdate, date(2007, 12, 5))
+        self.assertEqual(person.updated_at,
+                         datetime(2015, 1, 7, 22, 0, 10, 292032,
+                                  timezone.utc))
+        self.assertFalse(PersonPropertyModel.objects.exists())
+
+        # no new diffs, all marked as applied
+        self.assertEqual(Modeldiff.objects.count(), 4)
+        self.assertFalse(Modeldiff.objects.filter(applied=False).exists())
+
+    def test_delete_cascade(self):
+        person = PersonModel.objects.create(
+            name='Foo', updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+        prop = PersonPropertyModel.objects.create(person=person,
+                                                  address='Carme 15')
+        PropertyRoomModel.objects.create(property=prop, name='Bath')
+        Modeldiff.objects.all().delete()
+        remote_diff(Modeldiff, 'modeldiff.PersonModel', person.pk, 'delete',
+                    old_values={'name': 'Foo'})
+
+        stats = apply_diffs(pending_querysets('remote'))
+
+        self.assertEqual(stats['delete'], 1)
+        self.assertFalse(PersonPropertyModel.objects.exists())
+        self.assertFalse(PropertyRoomModel.objects.exists())
+        # the replica wrote the diffs of the cascade, none are written here
+        self.assertEqual(Modeldiff.objects.count(), 1)
+
+    def test_geo_and_missing(self):
+        remote_diff(Geomodeldiff, 'modeldiff.PersonGeoModel', 3, 'add',
+                    {'name': 'Foo',
+                     'updated_at': '2015-01-07 22:00:10.292032+0000',
+                     'the_geom': 'POINT (1.00000000 2.00000000)'})
+        remote_diff(Geomodeldiff, 'modeldiff.PersonGeoModel', 4,
+                    'update', {'name': 'Bar'})
+
+        stats = apply_diffs()
+
+        self.assertEqual(stats['add'], 1)
+        self.assertEqual(stats['missing'], 1)
+        person = PersonGeoModel.objects.get(pk=3)
+        self.assertEqual(person.the_geom.coords, (1, 2))
+        self.assertEqual(person.the_geom.srid, 4326)
+        self.assertEqual(Geomodeldiff.objects.count(), 2)
+
+    def test_command(self):
+        remote_diff(Modeldiff, 'modeldiff.PersonModel', 10, 'add',
+                    {'name': 'Foo',
+                     'updated_at': '2015-01-07 22:00:10.292032+0000'})
+        out = StringIO()
+
+        call_command('modeldiff_apply', key='remote', stdout=out)
+
+        self.assertIn('added: 1, updated: 0, deleted: 0, missing: 0',
+                      out.getvalue())
+        self.assertTrue(PersonModel.objects.filter(pk=10).exists())
+
+
+class ParallelApplyTests(TestCase):
+
+    def test_partition_batches_keep_object_order(self):
+        diffs = []
+        for i in range(200):
+            diffs.append(Modeldiff(id=i + 1,
+                                   model_name='modeldiff.PersonModel',
+                                   model_id=i % 20))
+
+        batches = list(partition_batches(diffs, 4, 10))
+
+        partitions = {}
+        for partition, batch in batches:
+            self.assertLessEqual(len(batch), 10)
+            partitions.setdefault(partition, []).extend(
+                pk for index, pk in batch)
+        self.assertEqual(sum(len(ids) for ids in partitions.values()), 200)
+        for partition, ids in partitions.items():
+            # every object in a single partition, its diffs in order
+            self.assertEqual(ids, sorted(ids))
+            for pk in ids:
+                self.assertEqual(get_partition(diffs[pk - 1], 4), partition)
+
+    def test_partition_is_stable(self):
+        diff = Modeldiff(model_name='modeldiff.PersonModel', model_id=7)
+        # crc32, not hash(), which changes between processes
+        self.assertEqual(get_partition(diff, 8), 1)
+        diff.unique_id = 'abc'
+        self.assertEqual(get_partition(diff, 8),
+                         get_partition(Modeldiff(
+                             model_name='modeldiff.PersonModel',
+                             model_id=8, unique_id='abc'), 8))
+
+    def test_run_worker(self):
+        add = remote_diff(
+            Modeldiff, 'modeldiff.PersonModel', 10, 'add',
+            {'name': 'Foo',
+             'updated_at': '2015-01-07 22:00:10.292032+0000'})
+        update = remote_diff(
+            Modeldiff, 'modeldiff.PersonModel', 10, 'update',
+            {'name': 'Bar'})
+        tasks = queue.Queue()
+        results = queue.Queue()
+        tasks.put([(0, add.pk)])
+        tasks.put([(0, update.pk)])
+        tasks.put(None)
+
+        run_worker(tasks, results)
+
+        stats, error = results.get()
+        self.assertIsNone(error)
+        self.assertEqual(stats['add'], 1)
+        self.assertEqual(stats['update'], 1)
+        self.assertEqual(PersonModel.objects.get(pk=10).name, 'Bar')
+        self.assertFalse(Modeldiff.objects.filter(applied=False).exists())
+
+    def test_run_worker_stops_after_error(self):
+        bad = remote_diff(
+            Modeldiff, 'modeldiff.Unknown', 1, 'add', {'name': 'Foo'})
+        add = remote_diff(
+            Modeldiff, 'modeldiff.PersonModel', 10, 'add',
+            {'name': 'Foo',
+             'updated_at': '2015-01-07 22:00:10.292032+0000'})
+        tasks = queue.Queue()
+        results = queue.Queue()
+        tasks.put([(0, bad.pk)])
+        tasks.put([(0, add.pk)])
+        tasks.put(None)
+
+        run_worker(tasks, results)
+
+        stats, error = results.get()
+        self.assertIn('unknown model_name', error)
+        self.assertFalse(PersonModel.objects.exists())
+        self.assertEqual(Modeldiff.objects.filter(applied=False).count(), 2)
+
+    @mock.patch.object(apply, 'POLL_INTERVAL', 0.05)
+    def test_dead_worker(self):
+        context = multiprocessing.get_context('fork')
+        process = context.Process(target=os._exit, args=(3,))
+        process.start()
+        process.join()
+        tasks = context.Queue(maxsize=1)
+        tasks.put([(0, 1)])
+
+        self.assertFalse(put_task(tasks, process, [(0, 2)]))
+        stats, error = get_result(context.Queue(), process)
+        self.assertEqual(stats, {})
+        self.assertIn('exited with code 3', error)
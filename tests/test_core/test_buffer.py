@@ -0,0 +1,171 @@
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from unittest import mock
+from datetime import datetime, timezone
+
+from core.models import PersonModel, PersonPropertyModel, PropertyRoomModel
+from modeldiff.buffer import BufferDiffsMiddleware, buffer_diffs
+from modeldiff.models import Modeldiff
+
+
+class BufferModeldiffTests(TestCase):
+
+    def create_person(self, name):
+        return PersonModel.objects.create(
+            name=name, updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+
+    def test_diffs_written_at_the_end(self):
+        with buffer_diffs():
+            for name in ('Foo', 'Bar', 'John'):
+                self.create_person(name)
+            self.assertEqual(Modeldiff.objects.count(), 0)
+
+        diffs = Modeldiff.objects.order_by('id')
+        self.assertEqual(len(diffs), 3)
+        for diff, person in zip(diffs, PersonModel.objects.order_by('id')):
+            self.assertEqual(diff.action, 'add')
+            self.assertEqual(diff.model_id, person.pk)
+
+    def test_single_insert_for_the_buffer(self):
+        # savepoint, two objects, one insert for all the diffs, release
+        with self.assertNumQueries(5):
+            with buffer_diffs():
+                self.create_person('Foo')
+                self.create_person('Bar')
+
+    def test_diffs_discarded_on_rollback(self):
+        with self.assertRaises(ValueError):
+            with buffer_diffs():
+                self.create_person('Foo')
+                raise ValueError()
+
+        self.assertEqual(Modeldiff.objects.count(), 0)
+        self.assertEqual(PersonModel.objects.count(), 0)
+
+        with buffer_diffs():
+            self.create_person('Bar')
+        self.assertEqual(Modeldiff.objects.count(), 1)
+
+    def test_diffs_discarded_on_savepoint_rollback(self):
+        with buffer_diffs():
+            person = self.create_person('Foo')
+            try:
+                with transaction.atomic():
+                    PersonPropertyModel.objects.create(person=person,
+                                                       address='Carme 15')
+                    raise ValueError()
+            except ValueError:
+                pass
+
+        self.assertEqual(
+            list(Modeldiff.objects.values_list('model_name', 'action')),
+            [('modeldiff.PersonModel', 'add')])
+
+    def test_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with buffer_diffs(on_commit=True):
+                self.create_person('Foo')
+            self.assertEqual(Modeldiff.objects.count(), 0)
+
+        self.assertEqual(Modeldiff.objects.count(), 1)
+
+    def test_decorator(self):
+        @buffer_diffs()
+        def create_people():
+            self.create_person('Foo')
+            self.create_person('Bar')
+            return Modeldiff.objects.count()
+
+        self.assertEqual(create_people(), 0)
+        self.assertEqual(Modeldiff.objects.count(), 2)
+
+    def parent_diffs(self):
+        return list(Modeldiff.objects.filter(
+            model_name='modeldiff.PersonModel').order_by('id').values_list(
+            'action', flat=True))
+
+    def test_parent_saved_once(self):
+        person = self.create_person('Foo')
+        properties = PersonPropertyModel.objects.bulk_create([
+            PersonPropertyModel(person=person, address='Carme %d' % i)
+            for i in range(3)])
+        Modeldiff.objects.all().delete()
+
+        with buffer_diffs():
+            for prop in properties:
+                prop.address += ' bis'
+                prop.save()
+            PersonPropertyModel.objects.create(person=person,
+                                               address='Carme 15')
+            properties[0].delete()
+            self.assertEqual(self.parent_diffs(), [])
+
+        self.assertEqual(self.parent_diffs(), ['update'])
+        self.assertEqual(Modeldiff.objects.filter(
+            model_name='modeldiff.PersonPropertyModel').count(), 5)
+
+    def test_deleted_parent_not_saved(self):
+        person = self.create_person('Foo')
+        Modeldiff.objects.all().delete()
+
+        with buffer_diffs():
+            PersonPropertyModel.objects.create(person=person,
+                                               address='Carme 15')
+            person.delete()
+
+        self.assertEqual(self.parent_diffs(), ['delete'])
+        self.assertFalse(PersonModel.objects.exists())
+
+    def test_parent_chain(self):
+        person = self.create_person('Foo')
+        prop = PersonPropertyModel.objects.create(person=person,
+                                                  address='Carme 15')
+        Modeldiff.objects.all().delete()
+
+        with mock.patch.object(PersonModel, 'save', autospec=True,
+                               side_effect=PersonModel.save) as person_save:
+            with buffer_diffs():
+                for name in ('Kitchen', 'Bath'):
+                    PropertyRoomModel.objects.create(property=prop,
+                                                     name=name)
+                prop.address = 'Carme 16'
+                prop.save()
+        self.assertEqual(person_save.call_count, 1)
+
+        self.assertEqual(
+            list(Modeldiff.objects.order_by('id').values_list(
+                'model_name', 'action')),
+            [('modeldiff.PropertyRoomModel', 'add'),
+             ('modeldiff.PropertyRoomModel', 'add'),
+             ('modeldiff.PersonPropertyModel', 'update'),
+             ('modeldiff.PersonPropertyModel', 'update'),
+             ('modeldiff.PersonModel', 'update')])
+        touch = Modeldiff.objects.filter(
+            model_name='modeldiff.PersonPropertyModel').order_by('id')[1]
+        self.assertEqual(touch.new_data, '{}')
+
+    def test_parents_on_commit(self):
+        person = self.create_person('Foo')
+        Modeldiff.objects.all().delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with buffer_diffs(on_commit=True):
+                PersonPropertyModel.objects.create(person=person,
+                                                   address='Carme 15')
+            self.assertEqual(Modeldiff.objects.count(), 0)
+
+        self.assertEqual(self.parent_diffs(), ['update'])
+
+    def test_middleware(self):
+        person = self.create_person('Foo')
+        Modeldiff.objects.all().delete()
+
+        def view(request):
+            for i in range(3):
+                PersonPropertyModel.objects.create(person=person,
+                                                   address='Carme %d' % i)
+            return HttpResponse()
+
+        BufferDiffsMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(self.parent_diffs(), ['update'])
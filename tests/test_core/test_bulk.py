@@ -0,0 +1,199 @@
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Upper
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from datetime import date, datetime, timezone
+
+import json
+
+from core.models import (PersonModel, PersonGeoModel, PersonPropertyModel,
+                         PropertyRoomModel)
+from modeldiff.models import Geomodeldiff, Modeldiff
+
+
+class BulkModeldiffTests(TestCase):
+
+    def setUp(self):
+        self.updated_at = datetime(2015, 1, 7, 22, 0, 10, 292032,
+                                   timezone.utc)
+
+    def create_people(self, count=3):
+        return PersonModel.objects.bulk_create([
+            PersonModel(name='Foo %d' % i, surname='Doe',
+                        birthdate=date(2007, 12, 5),
+                        updated_at=self.updated_at)
+            for i in range(count)])
+
+    def test_bulk_create(self):
+        with self.assertNumQueries(2):
+            people = self.create_people()
+
+        diffs = Modeldiff.objects.order_by('id')
+        self.assertEqual(len(diffs), 3)
+        for person, diff in zip(people, diffs):
+            self.assertEqual(diff.action, 'add')
+            self.assertEqual(diff.model_name, 'modeldiff.PersonModel')
+            self.assertEqual(diff.model_id, person.pk)
+            self.assertEqual(diff.old_data, '')
+            self.assertEqual(json.loads(diff.new_data),
+                             {'name': person.name, 'surname': 'Doe',
+                              'birthdate': '2007-12-05',
+                              'updated_at': '2015-01-07 22:00:10.292032+0000'
+                              })
+
+    def test_bulk_update(self):
+        people = self.create_people()
+        Modeldiff.objects.all().delete()
+
+        for person in people:
+            person.surname = 'Roe'
+            person.name = 'ignored'
+
+        PersonModel.objects.bulk_update(people, ['surname'])
+
+        diffs = Modeldiff.objects.order_by('id')
+        self.assertEqual(len(diffs), 3)
+        for person, diff in zip(people, diffs):
+            self.assertEqual(diff.action, 'update')
+            self.assertEqual(diff.model_id, person.pk)
+            self.assertEqual(json.loads(diff.new_data), {'surname': 'Roe'})
+            self.assertEqual(json.loads(diff.old_data)['surname'], 'Doe')
+
+    def test_bulk_update_attname(self):
+        people = self.create_people(2)
+        prop = self.create_properties(people[:1], 1)[0]
+        Modeldiff.objects.all().delete()
+
+        prop.person = people[1]
+        PersonPropertyModel.objects.bulk_update([prop], ['person_id'])
+
+        diff = Modeldiff.objects.get(
+            model_name='modeldiff.PersonPropertyModel')
+        self.assertEqual(json.loads(diff.new_data), {'person': people[1].pk})
+
+    def test_bulk_create_conflicts_rejected(self):
+        person = PersonModel(name='Foo', updated_at=self.updated_at)
+        for option in ('ignore_conflicts', 'update_conflicts'):
+            with self.assertRaises(ValueError):
+                PersonModel.objects.bulk_create([person], **{option: True})
+
+        self.assertFalse(PersonModel.objects.exists())
+        self.assertFalse(Modeldiff.objects.exists())
+
+    def test_update(self):
+        self.create_people()
+        Modeldiff.objects.all().delete()
+
+        PersonModel.objects.filter(name='Foo 1').update(surname=Upper('name'))
+
+        diff = Modeldiff.objects.get()
+        self.assertEqual(diff.action, 'update')
+        self.assertEqual(json.loads(diff.new_data), {'surname': 'FOO 1'})
+
+    def test_update_with_expression_on_many_rows(self):
+        self.create_people()
+        Modeldiff.objects.all().delete()
+
+        rows = PersonModel.objects.update(name=F('surname'))
+
+        self.assertEqual(rows, 3)
+        self.assertEqual(Modeldiff.objects.count(), 3)
+        for diff in Modeldiff.objects.all():
+            self.assertEqual(json.loads(diff.new_data), {'name': 'Doe'})
+
+    def test_bulk_create_touches_parent_once(self):
+        person = self.create_people(1)[0]
+        Modeldiff.objects.all().delete()
+
+        PersonPropertyModel.objects.bulk_create([
+            PersonPropertyModel(person=person, address='Carme %d' % i)
+            for i in range(5)])
+
+        self.assertEqual(
+            Modeldiff.objects.filter(
+                model_name='modeldiff.PersonPropertyModel').count(), 5)
+        parent_diffs = Modeldiff.objects.filter(
+            model_name='modeldiff.PersonModel')
+        self.assertEqual(len(parent_diffs), 1)
+        self.assertEqual(parent_diffs[0].action, 'update')
+
+    def create_properties(self, people, count):
+        return PersonPropertyModel.objects.bulk_create([
+            PersonPropertyModel(person=person, address='Carme %d' % i)
+            for person in people for i in range(count)])
+
+    def test_delete_touches_parents_once(self):
+        people = self.create_people(2)
+        self.create_properties(people, 3)
+        Modeldiff.objects.all().delete()
+
+        PersonPropertyModel.objects.all().delete()
+
+        diffs = Modeldiff.objects.filter(
+            model_name='modeldiff.PersonPropertyModel')
+        self.assertEqual(len(diffs), 6)
+        self.assertEqual(set(diff.action for diff in diffs), {'delete'})
+        self.assertEqual(json.loads(diffs[0].old_data)['address'], 'Carme 0')
+        parent_diffs = Modeldiff.objects.filter(
+            model_name='modeldiff.PersonModel').order_by('model_id')
+        self.assertEqual([(diff.action, diff.model_id)
+                          for diff in parent_diffs],
+                         [('update', people[0].pk), ('update', people[1].pk)])
+
+    def test_delete_queries(self):
+        def count_queries(people):
+            self.create_properties(people, 2)
+            pks = [person.pk for person in people]
+            with CaptureQueriesContext(connection) as queries:
+                PersonModel.objects.filter(pk__in=pks).delete()
+            return len(queries)
+
+        self.assertEqual(count_queries(self.create_people(2)),
+                         count_queries(self.create_people(10)))
+
+    def test_delete_queries_with_username(self):
+        prop = self.create_properties(self.create_people(1), 1)[0]
+
+        def count_queries(count):
+            PropertyRoomModel.objects.bulk_create([
+                PropertyRoomModel(property=prop, name='Room %d' % i,
+                                  username='sync')
+                for i in range(count)])
+            with CaptureQueriesContext(connection) as queries:
+                PropertyRoomModel.objects.all().delete()
+            return len(queries)
+
+        self.assertEqual(count_queries(2), count_queries(10))
+        diffs = Modeldiff.objects.filter(
+            model_name='modeldiff.PropertyRoomModel', action='delete')
+        self.assertEqual(set(diff.username for diff in diffs), {'sync'})
+
+    def test_cascade_skips_deleted_parent(self):
+        person = self.create_people(1)[0]
+        self.create_properties([person], 3)
+        person_id = person.pk
+        Modeldiff.objects.all().delete()
+
+        person.delete()
+
+        self.assertTrue(Modeldiff.objects.filter(
+            model_name='modeldiff.PersonModel', action='delete',
+            model_id=person_id).exists())
+        self.assertEqual(
+            Modeldiff.objects.filter(
+                model_name='modeldiff.PersonPropertyModel',
+                action='delete').count(), 3)
+        self.assertFalse(Modeldiff.objects.filter(action='update').exists())
+
+    def test_geo_bulk_create(self):
+        people = PersonGeoModel.objects.bulk_create([
+            PersonGeoModel(name='Foo', updated_at=self.updated_at,
+                           the_geom='POINT (1 2)'),
+            PersonGeoModel(name='Bar', updated_at=self.updated_at)])
+
+        diffs = Geomodeldiff.objects.order_by('id')
+        self.assertEqual(diffs[0].model_id, people[0].pk)
+        self.assertEqual(json.loads(diffs[0].new_data)['the_geom'],
+                         'POINT (1.00000000 2.00000000)')
+        self.assertNotIn('the_geom', json.loads(diffs[1].new_data))
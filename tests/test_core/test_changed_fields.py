@@ -0,0 +1,67 @@
+from django.core.management import call_command
+from django.test import TestCase
+from datetime import date, datetime, timezone
+from io import StringIO
+
+from core.models import PersonModel, PersonGeoModel
+from modeldiff.models import Geomodeldiff, Modeldiff
+
+
+class ChangedFieldsTests(TestCase):
+
+    def setUp(self):
+        self.person = PersonModel.objects.create(
+            name='Foo', surname='Doe', birthdate=date(2007, 12, 5),
+            updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+
+    def test_changed_fields(self):
+        self.person.surname = 'Roe'
+        self.person.save()
+        person_id = self.person.id
+        self.person.delete()
+
+        diffs = Modeldiff.objects.order_by('id')
+        fields = ['name', 'surname', 'birthdate', 'updated_at']
+        self.assertEqual(diffs[0].changed_fields, fields)
+        self.assertEqual(diffs[1].changed_fields, ['surname'])
+        self.assertEqual(diffs[2].changed_fields, fields)
+
+        self.assertEqual(
+            list(Modeldiff.objects.touching('surname').values_list(
+                'action', 'model_id')),
+            [('add', person_id), ('update', person_id),
+             ('delete', person_id)])
+        self.assertEqual(
+            list(Modeldiff.objects.touching('name').values_list(
+                'action', flat=True)), ['add', 'delete'])
+
+    def test_touching_does_not_match_values(self):
+        self.person.name = 'surname'
+        self.person.save()
+
+        self.assertEqual(
+            Modeldiff.objects.touching('surname').filter(
+                action='update').count(), 0)
+
+    def test_backfill(self):
+        PersonGeoModel.objects.create(
+            name='Foo', updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc),
+            the_geom='POINT (0 0)')
+        self.person.name = 'Bar'
+        self.person.save()
+        Modeldiff.objects.update(changed_fields=None)
+        Geomodeldiff.objects.update(changed_fields=None)
+
+        out = StringIO()
+        call_command('modeldiff_backfill_changed_fields', chunk_size=1,
+                     stdout=out)
+
+        self.assertIn('Modeldiff: 2 diffs updated', out.getvalue())
+        self.assertIn('Geomodeldiff: 1 diffs updated', out.getvalue())
+        self.assertEqual(
+            list(Modeldiff.objects.order_by('id').values_list(
+                'changed_fields', flat=True)),
+            [['name', 'surname', 'birthdate', 'updated_at'], ['name']])
+        self.assertEqual(Geomodeldiff.objects.get().changed_fields,
+                         ['name', 'surname', 'birthdate', 'updated_at',
+                          'the_geom'])
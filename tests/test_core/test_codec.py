@@ -0,0 +1,149 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from datetime import datetime, timezone
+from io import StringIO
+from unittest import skipUnless
+
+import importlib
+import json
+import os
+import tempfile
+
+from core.models import ParcelModel, PersonModel
+from modeldiff import codec
+from modeldiff.export import diff_to_row
+from modeldiff.models import Geomodeldiff, Modeldiff
+from test_core.test_geodelta import circle
+
+
+def installed(module):
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        return False
+    return True
+
+
+class CodecTests(TestCase):
+
+    values = {'name': 'Ramón', 'surname': None, 'path': 'a/b',
+              'birthdate': '2007-12-05', 'person': 7}
+
+    def assertCodec(self, name):
+        dumps, loads = codec.get_codec(name)
+        data = dumps(self.values)
+        self.assertEqual(list(json.loads(data).items()),
+                         list(self.values.items()))
+        self.assertEqual(loads(json.dumps(self.values)), self.values)
+
+    def test_json(self):
+        self.assertCodec('json')
+
+    @skipUnless(installed('orjson'), 'orjson is not installed')
+    def test_orjson(self):
+        self.assertCodec('orjson')
+
+    @skipUnless(installed('ujson'), 'ujson is not installed')
+    def test_ujson(self):
+        self.assertCodec('ujson')
+
+    @override_settings(MODELDIFF_JSON_CODEC='json')
+    def test_diff_values(self):
+        person = PersonModel.objects.create(
+            name='Foo', updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+        person.name = 'Bar'
+        person.save()
+
+        diffs = Modeldiff.objects.order_by('id')
+        self.assertEqual(diffs[0].old_values, {})
+        self.assertEqual(diffs[0].new_values['name'], 'Foo')
+        self.assertEqual(diffs[1].old_values['name'], 'Foo')
+        self.assertEqual(diffs[1].new_values, {'name': 'Bar'})
+
+
+class CompressionTests(TestCase):
+
+    text = json.dumps({'the_geom': circle(100).wkt})
+
+    def assertCompression(self, name):
+        with override_settings(MODELDIFF_COMPRESSION=name):
+            data = codec.compress(self.text)
+        self.assertTrue(data.startswith(codec.get_compression(name).prefix))
+        self.assertLess(len(data), len(self.text))
+        # decompressed whatever the current setting
+        self.assertEqual(codec.decompress(data), self.text)
+        self.assertEqual(codec.loads(data), json.loads(self.text))
+
+    def test_zlib(self):
+        self.assertCompression('zlib')
+
+    @skipUnless(installed('zstandard'), 'zstandard is not installed')
+    def test_zstd(self):
+        self.assertCompression('zstd')
+
+    @override_settings(MODELDIFF_COMPRESSION='zlib')
+    def test_short_data_not_compressed(self):
+        self.assertEqual(codec.dumps({'name': 'Foo'}), '{"name": "Foo"}')
+        self.assertEqual(codec.decompress('{}'), '{}')
+
+    @override_settings(MODELDIFF_COMPRESSION='lzma')
+    def test_unknown_compression(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, 'lzma'):
+            codec.compress(self.text)
+
+    def test_diffs(self):
+        with override_settings(MODELDIFF_COMPRESSION='zlib'):
+            parcel = ParcelModel.objects.create(name='Foo',
+                                                the_geom=circle(100))
+        diff = Geomodeldiff.objects.get()
+
+        self.assertTrue(diff.new_data.startswith('z:'))
+        self.assertEqual(diff.new_values['name'], 'Foo')
+        self.assertTrue(parcel.the_geom.equals_exact(
+            ParcelModel.objects.get().the_geom, 1e-6))
+        row = diff_to_row(diff, ['new_data'])
+        self.assertEqual(json.loads(row['new_data']), diff.new_values)
+
+    def test_recompress_command(self):
+        ParcelModel.objects.create(name='Foo', the_geom=circle(100))
+        diff = Geomodeldiff.objects.get()
+        out = StringIO()
+
+        with override_settings(MODELDIFF_COMPRESSION='zlib'):
+            call_command('modeldiff_recompress', stdout=out)
+        compressed = Geomodeldiff.objects.get()
+        call_command('modeldiff_recompress', stdout=out)
+
+        self.assertTrue(compressed.new_data.startswith('z:'))
+        self.assertEqual(compressed.new_values, diff.new_values)
+        saved = len(diff.new_data) - len(compressed.new_data)
+        self.assertIn('Geomodeldiff: 1 diffs updated, %d bytes saved' % saved,
+                      out.getvalue())
+        self.assertIn('Geomodeldiff: 1 diffs updated, %d bytes saved' %
+                      -saved, out.getvalue())
+        self.assertEqual(Geomodeldiff.objects.get().new_data, diff.new_data)
+
+    @skipUnless(installed('zstandard'), 'zstandard is not installed')
+    def test_train_dictionary(self):
+        PersonModel.objects.bulk_create([
+            PersonModel(name='Foo %d' % i, surname='Doe',
+                        updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+            for i in range(500)])
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        self.addCleanup(codec._compressions.clear)
+
+        call_command('modeldiff_train_dictionary', 'modeldiff.PersonModel',
+                     path, size=4096, stdout=StringIO())
+
+        codec._compressions.clear()
+        text = Modeldiff.objects.first().new_data
+        with override_settings(
+                MODELDIFF_COMPRESSION='zstd', MODELDIFF_COMPRESSION_MIN_SIZE=0,
+                MODELDIFF_COMPRESSION_DICTIONARIES={
+                    'modeldiff.PersonModel': path}):
+            data = codec.compress(text, 'modeldiff.PersonModel')
+            self.assertLess(len(data), len(text) / 2)
+            self.assertEqual(codec.decompress(data), text)
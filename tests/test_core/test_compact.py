@@ -0,0 +1,125 @@
+from django.core.management import call_command
+from django.test import TestCase
+from datetime import datetime, timezone
+from io import StringIO
+
+import json
+
+from core.models import PersonModel
+from modeldiff.apply import apply_diffs, pending_querysets
+from modeldiff.compact import compact_history, squash, squash_diffs
+from modeldiff.models import Modeldiff
+
+
+class CompactTests(TestCase):
+
+    def setUp(self):
+        self.person = PersonModel.objects.create(
+            name='Foo', surname='Doe',
+            updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+
+    def update(self, **values):
+        for name, value in values.items():
+            setattr(self.person, name, value)
+        self.person.save()
+
+    def test_add_and_updates(self):
+        self.update(name='Bar')
+        self.update(name='John', surname='Roe')
+
+        diffs = squash(Modeldiff.objects.order_by('id'))
+
+        self.assertEqual(len(diffs), 1)
+        self.assertEqual(diffs[0].action, 'add')
+        self.assertEqual(diffs[0].old_data, '')
+        self.assertEqual(diffs[0].new_values['name'], 'John')
+        self.assertEqual(diffs[0].new_values['surname'], 'Roe')
+        self.assertEqual(diffs[0].pk, Modeldiff.objects.last().pk)
+
+    def test_updates(self):
+        self.update(name='Bar')
+        self.update(name='John', surname='Roe')
+
+        diffs = squash(Modeldiff.objects.filter(action='update').order_by(
+            'id'))
+
+        self.assertEqual(len(diffs), 1)
+        self.assertEqual(diffs[0].action, 'update')
+        self.assertEqual(diffs[0].old_values['name'], 'Foo')
+        self.assertEqual(diffs[0].old_values['surname'], 'Doe')
+        self.assertEqual(diffs[0].new_values,
+                         {'name': 'John', 'surname': 'Roe'})
+        self.assertEqual(diffs[0].changed_fields, ['name', 'surname'])
+
+    def test_updates_and_delete(self):
+        self.update(name='Bar')
+        self.person.delete()
+
+        diffs = squash(Modeldiff.objects.exclude(action='add').order_by(
+            'id'))
+
+        self.assertEqual(len(diffs), 1)
+        self.assertEqual(diffs[0].action, 'delete')
+        self.assertEqual(diffs[0].old_values['name'], 'Foo')
+        self.assertEqual(diffs[0].new_data, '')
+
+    def test_keys_not_squashed(self):
+        self.update(name='Bar')
+        Modeldiff.objects.filter(action='update').update(key='remote')
+
+        self.assertEqual(len(squash(Modeldiff.objects.order_by('id'))), 2)
+
+    def test_compact_history(self):
+        self.update(name='Bar')
+        self.update(name='John')
+        other = PersonModel.objects.create(
+            name='Other', updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+        other.delete()
+        last_id = Modeldiff.objects.filter(model_id=self.person.pk).last().id
+
+        stats = compact_history(Modeldiff.objects.all())
+
+        self.assertEqual(stats, {'objects': 2, 'deleted': 4})
+        diff = Modeldiff.objects.get()
+        self.assertEqual(diff.id, last_id)
+        self.assertEqual(diff.action, 'add')
+        self.assertEqual(diff.new_values['name'], 'John')
+
+    def test_squash_diffs_keeps_order(self):
+        other = PersonModel.objects.create(
+            name='Other', updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+        self.update(name='Bar')
+
+        diffs = squash_diffs(list(Modeldiff.objects.order_by('id')))
+
+        self.assertEqual([(diff.model_id, diff.action) for diff in diffs],
+                         [(other.pk, 'add'), (self.person.pk, 'add')])
+
+    def test_apply_compacted(self):
+        for action, name in (('add', 'Foo'), ('update', 'Bar'),
+                             ('update', 'John')):
+            Modeldiff.objects.create(
+                key='remote', applied=False,
+                model_name='modeldiff.PersonModel', model_id=10,
+                action=action, new_data=json.dumps(
+                    {'name': name,
+                     'updated_at': '2015-01-07 22:00:10.292032+0000'}))
+
+        stats = apply_diffs(pending_querysets('remote'), compact=True)
+
+        self.assertEqual(stats['add'], 1)
+        self.assertEqual(stats['update'], 0)
+        self.assertEqual(PersonModel.objects.get(pk=10).name, 'John')
+        self.assertFalse(Modeldiff.objects.filter(applied=False).exists())
+
+    def test_command(self):
+        self.update(name='Bar')
+        out = StringIO()
+
+        call_command('modeldiff_compact',
+                     before_id=Modeldiff.objects.last().id, stdout=out)
+
+        self.assertIn('Modeldiff: 0 objects compacted', out.getvalue())
+        call_command('modeldiff_compact', stdout=out)
+        self.assertIn('Modeldiff: 1 objects compacted, 1 diffs deleted',
+                      out.getvalue())
@@ -0,0 +1,98 @@
+from django.contrib.gis.geos import GEOSGeometry, Point
+from django.core.management import call_command
+from django.test import TestCase
+from datetime import datetime, timezone
+from io import StringIO
+
+import csv
+import json
+import os
+import tempfile
+
+from core.models import PersonModel, PersonGeoModel
+from modeldiff.export import ExportState, export_diffs
+from modeldiff.models import Geomodeldiff, Modeldiff
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        for name in ('Foo', 'Bar', 'John'):
+            PersonModel.objects.create(
+                name=name, updated_at=datetime(2015, 1, 7,
+                                               tzinfo=timezone.utc))
+
+    def test_jsonl(self):
+        out = StringIO()
+        checkpoints = []
+
+        count, last_id = export_diffs(Modeldiff.objects.all(), out,
+                                      chunk_size=2,
+                                      checkpoint=checkpoints.append)
+
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        ids = list(Modeldiff.objects.order_by('id').values_list('id',
+                                                                flat=True))
+        self.assertEqual(count, 3)
+        self.assertEqual(last_id, ids[-1])
+        self.assertEqual(checkpoints, [ids[1], ids[2]])
+        self.assertEqual([row['id'] for row in rows], ids)
+        self.assertEqual(json.loads(rows[0]['new_data'])['name'], 'Foo')
+        self.assertEqual(rows[0]['changed_fields'],
+                         ['name', 'surname', 'birthdate', 'updated_at'])
+
+    def test_resume(self):
+        first = Modeldiff.objects.order_by('id').first()
+        out = StringIO()
+
+        count, last_id = export_diffs(Modeldiff.objects.all(), out,
+                                      after_id=first.id)
+
+        self.assertEqual(count, 2)
+        self.assertNotIn('"Foo"', out.getvalue())
+
+    def test_csv_geometry(self):
+        PersonGeoModel.objects.create(
+            name='Foo', updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc),
+            the_geom=Point(1, 2, srid=4326))
+        out = StringIO()
+
+        export_diffs(Geomodeldiff.objects.all(), out, format='csv')
+        export_diffs(Geomodeldiff.objects.all(), out, format='csv',
+                     geom_format='wkb', header=False)
+
+        rows = list(csv.DictReader(StringIO(out.getvalue())))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['the_geom'], 'POINT (1 2)')
+        self.assertEqual(GEOSGeometry(rows[1]['the_geom']).coords, (1, 2))
+        self.assertEqual(json.loads(rows[0]['changed_fields'])[0], 'name')
+
+    def test_command_state_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            state_file = os.path.join(directory, 'state.json')
+            output = os.path.join(directory, 'diffs.jsonl')
+
+            call_command('modeldiff_export', state_file=state_file,
+                         output=output, stderr=StringIO())
+            PersonModel.objects.create(
+                name='Other',
+                updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+            call_command('modeldiff_export', state_file=state_file,
+                         output=output, stderr=StringIO())
+
+            with open(output) as f:
+                rows = [json.loads(line) for line in f]
+            state = ExportState(state_file)
+
+        self.assertEqual([row['id'] for row in rows],
+                         list(Modeldiff.objects.order_by('id').values_list(
+                             'id', flat=True)))
+        self.assertEqual(state.get('modeldiff'), rows[-1]['id'])
+
+    def test_command_stdout(self):
+        out = StringIO()
+
+        call_command('modeldiff_export', format='csv', stdout=out,
+                     stderr=StringIO())
+
+        self.assertEqual(len(out.getvalue().splitlines()), 4)
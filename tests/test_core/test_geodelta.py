@@ -0,0 +1,135 @@
+from django.contrib.gis.geos import LineString, MultiPolygon, Point, Polygon
+from django.test import SimpleTestCase, TestCase
+
+import json
+import math
+
+from core.models import ParcelModel
+from modeldiff.apply import apply_diffs
+from modeldiff.geodelta import apply_delta, make_delta, rebuild_geometry
+from modeldiff.models import Geomodeldiff
+
+
+def circle(vertices=1000, radius=1.0):
+    coords = [(round(radius * math.cos(2 * math.pi * i / vertices), 6),
+               round(radius * math.sin(2 * math.pi * i / vertices), 6))
+              for i in range(vertices)]
+    coords.append(coords[0])
+    return Polygon(coords, srid=4326)
+
+
+def move_vertex(polygon, index, dx):
+    coords = list(polygon.exterior_ring.coords)
+    coords[index] = (coords[index][0] + dx, coords[index][1])
+    return Polygon(coords, srid=polygon.srid)
+
+
+class DeltaTests(SimpleTestCase):
+
+    def test_vertex_edit(self):
+        old = circle()
+        new = move_vertex(old, 10, 0.5)
+
+        delta = make_delta(old, new, 6)
+
+        self.assertEqual(len(delta['ops']), 1)
+        self.assertEqual(delta['ops'][0][:3], [1, 10, 11])
+        self.assertTrue(apply_delta(old, delta).equals_exact(new, 1e-9))
+
+    def test_insert_vertices(self):
+        old = LineString([(float(i), 0.0) for i in range(100)], srid=4326)
+        coords = list(old.coords)
+        coords[50:50] = [(50.5, 1.0), (50.7, 1.0)]
+        new = LineString(coords, srid=4326)
+
+        delta = make_delta(old, new, 6)
+
+        self.assertEqual(delta['ops'], [[1, 50, 50, [[50.5, 1.0],
+                                                     [50.7, 1.0]]]])
+        self.assertEqual(apply_delta(old, delta).coords, new.coords)
+
+    def test_multipolygon_rings(self):
+        square = Polygon(((0, 0), (0, 1), (1, 1), (1, 0), (0, 0)))
+        old = MultiPolygon(square, circle(), srid=4326)
+        new = MultiPolygon(square, move_vertex(circle(), 3, 1), srid=4326)
+
+        delta = make_delta(old, new, 6)
+
+        self.assertEqual([op[0] for op in delta['ops']], [4])
+        self.assertTrue(apply_delta(old, delta).equals_exact(new, 1e-9))
+
+    def test_no_delta(self):
+        old = circle()
+        # different structure
+        self.assertIsNone(make_delta(old, MultiPolygon(old, srid=4326)))
+        self.assertIsNone(make_delta(Point(1, 2), Point(2, 2)))
+        # not smaller than the geometry
+        self.assertIsNone(make_delta(old, circle(radius=2.0)))
+        # below the precision
+        self.assertEqual(make_delta(old, move_vertex(old, 10, 1e-9), 6),
+                         {'ops': []})
+
+
+class DeltaDiffTests(TestCase):
+
+    def test_save_and_rebuild(self):
+        geom = circle()
+        parcel = ParcelModel.objects.create(name='Foo', the_geom=geom)
+        versions = [geom]
+        for i in range(4):
+            geom = move_vertex(geom, 100 + i, 0.25)
+            parcel.the_geom = geom
+            parcel.save()
+            versions.append(geom)
+
+        diffs = list(Geomodeldiff.objects.order_by('id'))
+        values = [diff.new_values['the_geom'] for diff in diffs]
+        # keyframes: the add and every 3 diffs
+        self.assertEqual([isinstance(value, dict) for value in values],
+                         [False, True, True, False, True])
+        self.assertEqual([diff.the_geom is not None for diff in diffs],
+                         [True, False, False, True, False])
+        self.assertNotIn('the_geom', json.loads(diffs[1].old_data))
+
+        for diff, version in zip(diffs, versions):
+            self.assertTrue(rebuild_geometry(diff, 'the_geom', 4326)
+                            .equals_exact(version, 1e-9))
+
+    def test_clear_geometry(self):
+        parcel = ParcelModel.objects.create(name='Foo', the_geom=circle())
+        parcel.the_geom = None
+        parcel.save()
+
+        diff = Geomodeldiff.objects.last()
+        self.assertEqual(diff.new_values, {'the_geom': None})
+        self.assertIsNone(rebuild_geometry(diff, 'the_geom', 4326))
+        # replayed on a copy that still has the geometry
+        ParcelModel.objects.filter(pk=parcel.pk).update(the_geom=circle())
+        Geomodeldiff.objects.filter(id=diff.id).update(applied=False)
+        apply_diffs()
+        self.assertIsNone(ParcelModel.objects.get(pk=parcel.pk).the_geom)
+
+    def test_attribute_change(self):
+        parcel = ParcelModel.objects.create(name='Foo', the_geom=circle())
+        parcel.name = 'Bar'
+        parcel.save()
+
+        diff = Geomodeldiff.objects.last()
+        self.assertEqual(diff.new_values, {'name': 'Bar'})
+        self.assertEqual(diff.old_values, {'name': 'Foo'})
+        self.assertIsNone(diff.the_geom)
+
+    def test_apply(self):
+        parcel = ParcelModel.objects.create(name='Foo', the_geom=circle())
+        geom = move_vertex(circle(), 7, 0.25)
+        parcel.the_geom = geom
+        parcel.save()
+        diffs = Geomodeldiff.objects.order_by('id')
+        self.assertIsInstance(diffs[1].new_values['the_geom'], dict)
+        ParcelModel.objects.filter(pk=parcel.pk).update(the_geom=circle())
+        Geomodeldiff.objects.filter(id=diffs[1].id).update(applied=False)
+
+        apply_diffs()
+
+        parcel = ParcelModel.objects.get(pk=parcel.pk)
+        self.assertTrue(parcel.the_geom.equals_exact(geom, 1e-9))
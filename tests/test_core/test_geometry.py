@@ -0,0 +1,137 @@
+from django.contrib.gis.geos import GEOSGeometry, LineString, Point
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from unittest import mock, skipUnless
+
+import json
+
+from core.models import PersonGeoModel, PersonSnapshotModel
+from modeldiff import models as modeldiff_models
+from modeldiff.models import Geomodeldiff, get_envelope
+
+
+class GeometryDiffTests(TestCase):
+
+    def setUp(self):
+        self.person = PersonGeoModel.objects.create(
+            name='Foo', updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc),
+            the_geom=Point(1, 2, srid=4326))
+
+    def last_new_values(self):
+        return json.loads(Geomodeldiff.objects.last().new_data)
+
+    def test_unchanged_geometry_written_once(self):
+        person = PersonSnapshotModel.objects.create(
+            name='Foo', the_geom=Point(1, 2, srid=4326))
+        person = PersonSnapshotModel.objects.get(pk=person.pk)
+        person.name = 'Bar'
+
+        with mock.patch.object(modeldiff_models, 'write_geom',
+                               wraps=modeldiff_models.write_geom) as write:
+            person.save()
+
+        # only the old geometry, for old_data
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(self.last_new_values(), {'name': 'Bar'})
+        old_values = json.loads(Geomodeldiff.objects.last().old_data)
+        self.assertEqual(old_values['the_geom'],
+                         'POINT (1.00000000 2.00000000)')
+
+    def test_change_below_precision(self):
+        self.person.the_geom = Point(1 + 1e-12, 2, srid=4326)
+        self.person.save()
+
+        self.assertNotIn('the_geom', self.last_new_values())
+
+    def test_changed_geometry(self):
+        self.person.the_geom = Point(3, 4, srid=4326)
+        self.person.save()
+
+        self.assertEqual(self.last_new_values()['the_geom'],
+                         'POINT (3.00000000 4.00000000)')
+
+    def test_wkb_format(self):
+        with mock.patch.object(PersonGeoModel.Modeldiff, 'geom_format',
+                               'wkb', create=True):
+            self.person.the_geom = Point(3, 4, srid=4326)
+            self.person.save()
+
+        geom = GEOSGeometry(self.last_new_values()['the_geom'])
+        self.assertEqual(geom.coords, (3, 4))
+        old_values = json.loads(Geomodeldiff.objects.last().old_data)
+        self.assertEqual(GEOSGeometry(old_values['the_geom']).coords, (1, 2))
+
+
+class EnvelopeTests(TestCase):
+
+    def setUp(self):
+        self.person = PersonGeoModel.objects.create(
+            name='Foo', updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc),
+            the_geom=Point(1, 2, srid=4326))
+
+    def test_get_envelope(self):
+        self.assertIsNone(get_envelope(None))
+        self.assertEqual(get_envelope(Point(1, 2)).coords, (1, 2))
+        self.assertEqual(get_envelope(Point(1, 2), Point(1, 5)).coords,
+                         ((1, 2), (1, 5)))
+        envelope = get_envelope(LineString((0, 0), (2, 1)), Point(-1, 3),
+                                None)
+        self.assertEqual(envelope.extent, (-1, 0, 2, 3))
+
+    def test_diff_envelopes(self):
+        self.person.the_geom = Point(3, 4, srid=4326)
+        self.person.save()
+        self.person.delete()
+
+        envelopes = [diff.envelope.extent for diff in
+                     Geomodeldiff.objects.order_by('id')]
+        # the update covers the old and the new position
+        self.assertEqual(envelopes, [(1, 2, 1, 2), (1, 2, 3, 4),
+                                     (3, 4, 3, 4)])
+
+    def test_delete_without_geometry(self):
+        with mock.patch.object(PersonGeoModel.Modeldiff, 'delete_geom',
+                               False, create=True):
+            self.person.delete()
+
+        diff = Geomodeldiff.objects.last()
+        self.assertIsNone(diff.the_geom)
+        self.assertEqual(diff.envelope.coords, (1, 2))
+
+    def test_backfill(self):
+        self.person.the_geom = Point(3, 4, srid=4326)
+        self.person.save()
+        Geomodeldiff.objects.update(envelope=None)
+
+        out = StringIO()
+        call_command('modeldiff_backfill_envelope', chunk_size=1, stdout=out)
+
+        self.assertIn('Geomodeldiff: 2 diffs updated', out.getvalue())
+        self.assertEqual([diff.envelope.extent for diff in
+                          Geomodeldiff.objects.order_by('id')],
+                         [(1, 2, 1, 2), (1, 2, 3, 4)])
+
+    @skipUnless('intersects' in getattr(connection.ops, 'gis_operators', {}),
+                'needs a spatial database')
+    def test_changes_in_bbox(self):
+        other = PersonGeoModel.objects.create(
+            name='Bar', updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc),
+            the_geom=Point(10, 10, srid=4326))
+        self.person.the_geom = Point(3, 4, srid=4326)
+        self.person.save()
+        other.delete()
+
+        diffs = Geomodeldiff.objects.changes_in_bbox((0, 0, 2, 3))
+        self.assertEqual([diff.action for diff in diffs], ['add', 'update'])
+        diffs = Geomodeldiff.objects.changes_in_bbox((9, 9, 11, 11))
+        self.assertEqual([diff.action for diff in diffs], ['add', 'delete'])
+
+        since = Geomodeldiff.objects.get(action='update').date_created
+        diffs = Geomodeldiff.objects.changes_intersecting(
+            Point(3, 4, srid=4326).buffer(1), since=since)
+        self.assertEqual([diff.action for diff in diffs], ['update'])
+        self.assertFalse(Geomodeldiff.objects.changes_in_bbox(
+            (0, 0, 2, 3), since=since + timedelta(days=1)).exists())
@@ -0,0 +1,209 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from io import StringIO
+from unittest import mock
+
+import json
+
+from core.models import ParcelModel, PersonModel
+from modeldiff.history import as_of, get_full_old_values, model_as_of
+from modeldiff.models import ModeldiffSnapshot, Modeldiff
+from test_core.test_geodelta import circle, move_vertex
+
+
+class AsOfTests(TestCase):
+
+    def setUp(self):
+        self.person = PersonModel.objects.create(
+            name='Foo', surname='Doe',
+            updated_at=datetime(2015, 1, 7, tzinfo=dt_timezone.utc))
+        self.times = [timezone.now()]
+
+    def update(self, **values):
+        for name, value in values.items():
+            setattr(self.person, name, value)
+        self.person.save()
+        self.times.append(timezone.now())
+
+    def test_as_of(self):
+        self.update(name='Bar')
+        self.update(surname='Roe')
+        pk = self.person.pk
+        self.person.delete()
+
+        self.assertIsNone(as_of(PersonModel, pk,
+                                datetime(2000, 1, 1, tzinfo=dt_timezone.utc)))
+        names = [(person.name, person.surname) for person in
+                 (as_of(PersonModel, pk, time) for time in self.times)]
+        self.assertEqual(names, [('Foo', 'Doe'), ('Bar', 'Doe'),
+                                 ('Bar', 'Roe')])
+        self.assertEqual(as_of(PersonModel, pk, self.times[0]).updated_at,
+                         datetime(2015, 1, 7, tzinfo=dt_timezone.utc))
+        self.assertIsNone(as_of(PersonModel, pk))
+
+    def test_without_add(self):
+        self.update(name='Bar')
+        Modeldiff.objects.filter(action='add').delete()
+
+        person = as_of(PersonModel, self.person.pk, self.times[0])
+        self.assertIsNone(person)
+        person = as_of(PersonModel, self.person.pk)
+        self.assertEqual((person.name, person.surname), ('Bar', 'Doe'))
+
+    def test_snapshots(self):
+        with mock.patch.object(PersonModel.Modeldiff, 'checkpoint_interval',
+                               2, create=True):
+            for i in range(5):
+                self.update(name='Foo%d' % i)
+
+            self.assertEqual(as_of(PersonModel, self.person.pk).name, 'Foo4')
+            self.assertEqual(ModeldiffSnapshot.objects.count(), 3)
+            # the history before the snapshots is not needed anymore
+            Modeldiff.objects.exclude(
+                id=Modeldiff.objects.last().id).delete()
+            with self.assertNumQueries(2):
+                person = as_of(PersonModel, self.person.pk)
+            self.assertEqual(person.name, 'Foo4')
+            self.assertEqual(as_of(PersonModel, self.person.pk,
+                                   self.times[3]).name, 'Foo2')
+
+    def test_checkpoint_command(self):
+        with mock.patch.object(PersonModel.Modeldiff, 'checkpoint_interval',
+                               2, create=True):
+            self.update(name='Bar')
+            out = StringIO()
+            call_command('modeldiff_checkpoint', stdout=out)
+
+        self.assertIn('Modeldiff: 1 objects, 1 snapshots stored',
+                      out.getvalue())
+        snapshot = ModeldiffSnapshot.objects.get()
+        self.assertEqual(snapshot.diff_id, Modeldiff.objects.last().id)
+
+
+class GeometryAsOfTests(TestCase):
+
+    def test_geometry_deltas(self):
+        geom = circle()
+        parcel = ParcelModel.objects.create(name='Foo', the_geom=geom)
+        versions = [(timezone.now(), geom)]
+        for i in range(4):
+            geom = move_vertex(geom, 100 + i, 0.25)
+            parcel.the_geom = geom
+            parcel.save()
+            versions.append((timezone.now(), geom))
+
+        for time, version in versions:
+            self.assertTrue(as_of(ParcelModel, parcel.pk, time).the_geom
+                            .equals_exact(version, 1e-9))
+
+
+class MinimalOldDataTests(TestCase):
+
+    def setUp(self):
+        self.person = PersonModel.objects.create(
+            name='Foo', surname='Doe',
+            updated_at=datetime(2015, 1, 7, tzinfo=dt_timezone.utc))
+
+    def rename(self):
+        self.person.name = 'Bar'
+        self.person.save()
+        self.person.surname = 'Roe'
+        self.person.save()
+        return Modeldiff.objects.filter(action='update').order_by('id')
+
+    def test_minimal_old_data(self):
+        with mock.patch.object(PersonModel.Modeldiff, 'minimal_old_data',
+                               True, create=True):
+            diffs = self.rename()
+
+        self.assertEqual([diff.old_values for diff in diffs],
+                         [{'name': 'Foo'}, {'surname': 'Doe'}])
+        self.assertEqual(get_full_old_values(PersonModel, diffs[1]),
+                         {'name': 'Bar', 'surname': 'Doe', 'birthdate': None,
+                          'updated_at': '2015-01-07 00:00:00.000000+0000'})
+        self.assertEqual(as_of(PersonModel, self.person.pk).surname, 'Roe')
+
+    def test_minimize_command(self):
+        diffs = self.rename()
+        size = sum(len(diff.old_data) for diff in diffs)
+        out = StringIO()
+
+        call_command('modeldiff_minimize_old_data', dry_run=True,
+                     model_name='modeldiff.PersonModel', stdout=out)
+        self.assertEqual(len(diffs.all()[0].old_values), 4)
+        call_command('modeldiff_minimize_old_data',
+                     model_name='modeldiff.PersonModel', stdout=out)
+
+        self.assertEqual([diff.old_values for diff in diffs.all()],
+                         [{'name': 'Foo'}, {'surname': 'Doe'}])
+        saved = size - sum(len(diff.old_data) for diff in diffs.all())
+        self.assertEqual(out.getvalue().count(
+            'Modeldiff: 2 diffs updated, %d bytes saved' % saved), 2)
+        self.assertIn('Geomodeldiff: 0 diffs updated', out.getvalue())
+
+
+def create_people():
+    """
+    Three people, the first one renamed and the second one deleted after
+    the returned date. Return their ids and the date
+    """
+    people = [PersonModel.objects.create(
+        name=name, updated_at=datetime(2015, 1, 7, tzinfo=dt_timezone.utc))
+        for name in ('Foo', 'Bar', 'Baz')]
+    ids = [person.pk for person in people]
+    date = timezone.now()
+    people[0].name = 'John'
+    people[0].save()
+    people[1].delete()
+    PersonModel.objects.create(
+        name='Late', updated_at=datetime(2015, 1, 7, tzinfo=dt_timezone.utc))
+    return ids, date
+
+
+class ModelAsOfTests(TestCase):
+
+    def test_model_as_of(self):
+        ids, date = create_people()
+
+        self.assertEqual([(person.pk, person.name) for person in
+                          model_as_of(PersonModel, date, chunk_size=2)],
+                         [(ids[0], 'Foo'), (ids[1], 'Bar'), (ids[2], 'Baz')])
+        self.assertEqual([person.name for person in
+                          model_as_of(PersonModel)], ['John', 'Baz', 'Late'])
+
+    def test_command_output(self):
+        ids, date = create_people()
+        out = StringIO()
+
+        call_command('modeldiff_as_of', 'modeldiff.PersonModel',
+                     date.isoformat(), stdout=out, stderr=StringIO())
+
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['name'] for row in rows], ['Foo', 'Bar', 'Baz'])
+        self.assertEqual(sorted(rows[0]), ['birthdate', 'id', 'name',
+                                           'surname', 'updated_at'])
+
+
+class ModelAsOfTableTests(TransactionTestCase):
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS person_as_of')
+
+    def test_command_table(self):
+        ids, date = create_people()
+        err = StringIO()
+
+        call_command('modeldiff_as_of', 'modeldiff.PersonModel',
+                     date.isoformat(), table='person_as_of', stderr=err)
+
+        self.assertIn('modeldiff.PersonModel: 3 objects', err.getvalue())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id, name FROM person_as_of ORDER BY id')
+            self.assertEqual(cursor.fetchall(),
+                             [(ids[0], 'Foo'), (ids[1], 'Bar'),
+                              (ids[2], 'Baz')])
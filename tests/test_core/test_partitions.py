@@ -0,0 +1,105 @@
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase
+from django.utils import timezone
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import skipUnless
+
+from core.models import PartitionDiff
+from modeldiff.partitions import (add_months, convert_to_partitioned,
+                                  create_partitions, detach_partitions,
+                                  is_partitioned, month_start,
+                                  parse_bound, partition_name)
+
+
+class BoundTests(SimpleTestCase):
+
+    def test_parse_bound(self):
+        self.assertEqual(
+            parse_bound("FOR VALUES FROM ('2026-10-01 00:00:00+00') "
+                        "TO ('2026-11-01 00:00:00+00')"),
+            (date(2026, 10, 1), date(2026, 11, 1)))
+        self.assertEqual(
+            parse_bound("FOR VALUES FROM (MINVALUE) "
+                        "TO ('2026-11-01 00:00:00+00')"),
+            (None, date(2026, 11, 1)))
+        self.assertIsNone(parse_bound('DEFAULT'))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Partitioning needs PostgreSQL')
+class PartitionTests(TransactionTestCase):
+
+    def setUp(self):
+        self.table = PartitionDiff._meta.db_table
+        self.first = month_start(timezone.now().date())
+        start = add_months(self.first, 1)
+        self.next_month = datetime(start.year, start.month, 2,
+                                   tzinfo=dt_timezone.utc)
+        now = timezone.now()
+        for date_created in (now - timedelta(400), now):
+            self.create_diff(date_created)
+
+    def tearDown(self):
+        # back to a plain table, the partitions are dropped with it
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE %s CASCADE' %
+                           connection.ops.quote_name(self.table))
+        with connection.schema_editor() as editor:
+            editor.create_model(PartitionDiff)
+
+    def create_diff(self, date_created):
+        return PartitionDiff.objects.create(
+            model_name='modeldiff.PersonModel', action='add',
+            date_created=date_created)
+
+    def count(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM %s' %
+                           connection.ops.quote_name(name))
+            return cursor.fetchone()[0]
+
+    def test_convert(self):
+        last = PartitionDiff.objects.order_by('id').last()
+
+        convert_to_partitioned(PartitionDiff, months=2)
+
+        self.assertTrue(is_partitioned(PartitionDiff))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT contype, pg_get_constraintdef(oid) "
+                           "FROM pg_constraint WHERE conrelid = %s::regclass "
+                           "AND contype IN ('p', 'c')",
+                           ['%s_pold' % self.table])
+            # the pre-built unique index is the primary key, the CHECK
+            # constraint is replaced by the partition bound
+            self.assertEqual(cursor.fetchall(),
+                             [('p', 'PRIMARY KEY (id, date_created)')])
+        # the rows of the current month stay in the old table
+        self.assertEqual(self.count('%s_pold' % self.table), 2)
+        diff = self.create_diff(self.next_month)
+        self.assertGreater(diff.id, last.id)
+        self.assertEqual(self.count(partition_name(
+            self.table, add_months(self.first, 1))), 1)
+        self.assertEqual(PartitionDiff.objects.count(), 3)
+
+    def test_create(self):
+        convert_to_partitioned(PartitionDiff, months=1)
+
+        created = create_partitions(PartitionDiff, months=3)
+
+        self.assertEqual(created, [
+            partition_name(self.table, add_months(self.first, 2)),
+            partition_name(self.table, add_months(self.first, 3))])
+        self.assertEqual(create_partitions(PartitionDiff, months=3),
+                         [])
+
+    def test_detach(self):
+        convert_to_partitioned(PartitionDiff, months=2)
+        self.create_diff(self.next_month)
+
+        self.assertEqual(detach_partitions(PartitionDiff,
+                                           self.first),
+                         [])
+        detached = detach_partitions(PartitionDiff,
+                                     add_months(self.first, 1), drop=True)
+
+        self.assertEqual(detached, ['%s_pold' % self.table])
+        self.assertEqual(PartitionDiff.objects.count(), 1)
@@ -0,0 +1,47 @@
+from django.db import connection
+from django.test import TestCase
+from datetime import datetime, timezone
+
+from core.models import PersonModel
+from modeldiff.models import Modeldiff
+
+
+class ModeldiffQuerySetTests(TestCase):
+
+    def setUp(self):
+        self.person = PersonModel.objects.create(
+            name='Foo', updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+        self.person.name = 'Bar'
+        self.person.save()
+        PersonModel.objects.create(
+            name='John', updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor == 'postgresql':
+            # tiny tables are faster to scan
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        self.assertIn(index_name, queryset.explain())
+
+    def test_history_for(self):
+        history = Modeldiff.objects.history_for(self.person)
+        self.assertEqual([diff.action for diff in history], ['add', 'update'])
+        self.assertUsesIndex(history, 'modeldiff_modeldiff_history')
+
+    def test_pending(self):
+        Modeldiff.objects.filter(model_id=self.person.pk).update(
+            key='remote', applied=False)
+
+        pending = Modeldiff.objects.pending('remote')
+        self.assertEqual([diff.action for diff in pending], ['add', 'update'])
+        self.assertUsesIndex(pending, 'modeldiff_modeldiff_pending')
+
+    def test_changes_since(self):
+        first = Modeldiff.objects.order_by('id')[0]
+
+        changes = Modeldiff.objects.changes_since(first.id)
+        self.assertEqual(len(changes), 2)
+
+        changes = Modeldiff.objects.changes_since(first.id, key='core')
+        self.assertEqual(len(changes), 2)
+        self.assertUsesIndex(changes, 'modeldiff_modeldiff_key_id')
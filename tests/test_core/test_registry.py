@@ -0,0 +1,88 @@
+from django.contrib.gis.db import models
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+from django.test.utils import isolate_apps
+
+from core.models import ParcelModel, PersonModel, PersonPropertyModel
+from modeldiff.registry import Registry, registry
+
+
+class RegistryTests(SimpleTestCase):
+
+    def test_populated(self):
+        tracked = registry.get(PersonPropertyModel)
+
+        self.assertEqual(tracked.model_name, 'modeldiff.PersonPropertyModel')
+        self.assertEqual(tracked.fields, ('person', 'address'))
+        self.assertEqual(tracked.parent_field, 'person')
+        self.assertIsNone(tracked.geom_field)
+        self.assertIs(registry.get_model('modeldiff.PersonModel'),
+                      PersonModel)
+        self.assertIsNone(registry.get_model('unknown.Model'))
+
+    def test_model_names(self):
+        names = [name for name, label in registry.model_names()]
+        geo_names = [name for name, label in registry.model_names(geo=True)]
+
+        self.assertIn('modeldiff.PersonModel', names)
+        self.assertNotIn('modeldiff.ParcelModel', names)
+        self.assertIn(ParcelModel.Modeldiff.model_name, geo_names)
+
+    @isolate_apps('core')
+    def test_invalid_options(self):
+        class Base(models.Model):
+            name = models.CharField(max_length=50)
+            point = models.PointField()
+            parent = models.ForeignKey(PersonModel, models.CASCADE)
+
+            class Meta:
+                abstract = True
+                app_label = 'core'
+
+        cases = (
+            ({'fields': ('name',)}, 'model_name is required'),
+            ({'model_name': 'a.B', 'fields': ('surname',)},
+             'fields: surname is not a field'),
+            ({'model_name': 'a.B', 'fields': (), 'geom_field': 'name'},
+             'geom_field name is not a geometry field'),
+            ({'model_name': 'a.B', 'fields': (), 'geom_field': 'point'},
+             'geom_precision is required'),
+            ({'model_name': 'a.B', 'fields': (), 'parent_field': 'name'},
+             'parent_field name is not a foreign key'),
+        )
+        for i, (options, message) in enumerate(cases):
+            model = type('Invalid%d' % i, (Base,), {
+                '__module__': __name__,
+                'Modeldiff': type('Modeldiff', (), options)})
+            with self.assertRaisesMessage(ImproperlyConfigured, message):
+                Registry().register(model)
+
+    @isolate_apps('core')
+    def test_duplicate_model_name(self):
+        options = {'model_name': 'a.B', 'fields': ('name',)}
+
+        class First(models.Model):
+            name = models.CharField(max_length=50)
+            Modeldiff = type('Modeldiff', (), options)
+
+            class Meta:
+                app_label = 'core'
+
+        class Second(models.Model):
+            name = models.CharField(max_length=50)
+            Modeldiff = type('Modeldiff', (), options)
+
+            class Meta:
+                app_label = 'core'
+
+        class Proxy(First):
+            class Meta:
+                app_label = 'core'
+                proxy = True
+
+        test_registry = Registry()
+        test_registry.populate([First, Proxy])
+        self.assertIs(test_registry.get_model('a.B'), First)
+        with self.assertRaisesMessage(ImproperlyConfigured,
+                                      'model_name a.B is already used'):
+            test_registry.register(Second)
@@ -0,0 +1,89 @@
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from datetime import date, datetime, timedelta, timezone
+from io import StringIO
+
+import gzip
+import json
+import os
+import tempfile
+
+from core.models import PersonModel, PersonPropertyModel
+from modeldiff.models import Modeldiff
+from modeldiff.partitions import add_months, partition_name
+from modeldiff.retention import DiffArchive, expired_querysets, prune
+
+
+@override_settings(MODELDIFF_RETENTION={'default': 30,
+                                        'modeldiff.PersonModel': 365})
+class RetentionTests(TestCase):
+
+    def setUp(self):
+        person = PersonModel.objects.create(
+            name='Foo', updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+        PersonPropertyModel.objects.create(person=person, address='Carme 15')
+        now = datetime.now(timezone.utc)
+        # every diff is 100 days old but the last ones
+        Modeldiff.objects.update(date_created=now - timedelta(100))
+        person.name = 'Bar'
+        person.save()
+
+    def test_expired_querysets(self):
+        expired = [diff for queryset in expired_querysets(Modeldiff)
+                   for diff in queryset]
+
+        self.assertEqual([diff.model_name for diff in expired],
+                         ['modeldiff.PersonPropertyModel'])
+
+    def test_prune(self):
+        deleted = [prune(queryset, chunk_size=1)
+                   for queryset in expired_querysets(Modeldiff)]
+
+        self.assertEqual(deleted, [0, 1])
+        self.assertEqual(Modeldiff.objects.filter(
+            model_name='modeldiff.PersonPropertyModel').count(), 0)
+        self.assertEqual(Modeldiff.objects.filter(
+            model_name='modeldiff.PersonModel').count(), 3)
+
+    @override_settings(MODELDIFF_RETENTION={'modeldiff.PersonModel': None})
+    def test_keep_forever(self):
+        self.assertEqual(expired_querysets(Modeldiff), [])
+
+    def test_archive(self):
+        diff = Modeldiff.objects.get(
+            model_name='modeldiff.PersonPropertyModel')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'archive.jsonl.gz')
+            with DiffArchive(path) as archive:
+                for queryset in expired_querysets(Modeldiff):
+                    prune(queryset, archive=archive)
+
+            with gzip.open(path, 'rt') as f:
+                lines = [json.loads(line) for line in f]
+
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]['id'], diff.id)
+        self.assertEqual(lines[0]['action'], 'add')
+        self.assertEqual(json.loads(lines[0]['new_data'])['address'],
+                         'Carme 15')
+        self.assertEqual(lines[0]['date_created'],
+                         diff.date_created.isoformat())
+
+    def test_command(self):
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('modeldiff_prune', archive_dir=directory, stdout=out)
+            self.assertEqual(len(os.listdir(directory)), 2)
+
+        self.assertIn('Modeldiff: 1 diffs deleted', out.getvalue())
+        self.assertIn('Geomodeldiff: 0 diffs deleted', out.getvalue())
+
+
+class PartitionNameTests(TestCase):
+
+    def test_months(self):
+        self.assertEqual(add_months(date(2015, 11, 1), 1), date(2015, 12, 1))
+        self.assertEqual(add_months(date(2015, 11, 1), 2), date(2016, 1, 1))
+        self.assertEqual(partition_name('modeldiff_modeldiff',
+                                        date(2016, 1, 1)),
+                         'modeldiff_modeldiff_p201601')
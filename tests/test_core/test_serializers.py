@@ -0,0 +1,73 @@
+from django.contrib.gis.db import models
+from django.test import SimpleTestCase
+from django.test.utils import isolate_apps
+from datetime import date, datetime, timedelta, timezone
+
+from core.models import PersonModel, PersonPropertyModel
+from modeldiff.serializers import (FieldSerializer, get_serializer,
+                                   serialize_date, serialize_datetime,
+                                   serialize_value)
+
+
+class SerializerTests(SimpleTestCase):
+
+    def test_datetime_same_as_strftime(self):
+        values = [
+            datetime(2015, 1, 7, 22, 0, 10, 292032),
+            datetime(2015, 1, 7, 22, 0, 10, 0, timezone.utc),
+            datetime(2015, 1, 7, 22, 0, 10, 5,
+                     timezone(timedelta(hours=5, minutes=30))),
+            datetime(2015, 1, 7, 22, 0, 10, 5,
+                     timezone(-timedelta(hours=3, seconds=12))),
+            datetime(999, 1, 7, 22, 0, 10),
+            date(2007, 12, 5),
+            None,
+            '2015-01-07',
+        ]
+        for value in values:
+            self.assertEqual(serialize_datetime(value),
+                             serialize_value(value))
+
+    def test_date_same_as_strftime(self):
+        values = [
+            date(2007, 12, 5),
+            date(999, 12, 5),
+            datetime(2015, 1, 7, 22, 0, 10, 292032, timezone.utc),
+            None,
+        ]
+        for value in values:
+            self.assertEqual(serialize_date(value), serialize_value(value))
+
+    def test_serializer(self):
+        person = PersonModel(
+            name='Foo', surname=None, birthdate=date(2007, 12, 5),
+            updated_at=datetime(2015, 1, 7, 22, 0, 10, 292032, timezone.utc))
+
+        self.assertEqual(get_serializer(PersonModel)(person),
+                         {'name': 'Foo', 'surname': None,
+                          'birthdate': '2007-12-05',
+                          'updated_at': '2015-01-07 22:00:10.292032+0000'})
+
+    def test_foreign_key_uses_attname(self):
+        person_property = PersonPropertyModel(person_id=7, address='Carme')
+
+        # SimpleTestCase fails on any database query
+        values = get_serializer(PersonPropertyModel)(person_property)
+        self.assertEqual(values, {'person': 7, 'address': 'Carme'})
+
+    @isolate_apps('core')
+    def test_no_fields(self):
+        class Parcel(models.Model):
+            point = models.PointField()
+
+            class Meta:
+                app_label = 'core'
+
+            class Modeldiff:
+                model_name = 'a.Parcel'
+                fields = ()
+                geom_field = 'point'
+                geom_precision = 6
+
+        self.assertEqual(FieldSerializer(Parcel)(Parcel(point='POINT (0 0)')),
+                         {})
@@ -0,0 +1,97 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from datetime import date, datetime, timezone
+from unittest import mock
+
+import json
+
+from core.models import PersonModel, PersonSnapshotModel
+from modeldiff.models import Geomodeldiff, Modeldiff
+
+
+class SnapshotModeldiffTests(TestCase):
+
+    def setUp(self):
+        PersonSnapshotModel.objects.create(
+            name='Foo', birthdate=date(2007, 12, 5), the_geom='POINT (0 0)')
+
+    def assertNoSelect(self, context):
+        for query in context.captured_queries:
+            self.assertFalse(query['sql'].startswith('SELECT'), query['sql'])
+
+    def test_save_without_original_select(self):
+        person = PersonSnapshotModel.objects.get()
+        person.name = 'Bar'
+        person.the_geom = 'POINT (1 1)'
+
+        with CaptureQueriesContext(connection) as context:
+            person.save()
+        self.assertNoSelect(context)
+
+        diff = Geomodeldiff.objects.order_by('-id')[0]
+        self.assertEqual(diff.action, 'update')
+        self.assertEqual(json.loads(diff.old_data),
+                         {'name': 'Foo', 'birthdate': '2007-12-05',
+                          'the_geom': 'POINT (0.00000000 0.00000000)'})
+        self.assertEqual(json.loads(diff.new_data),
+                         {'name': 'Bar',
+                          'the_geom': 'POINT (1.00000000 1.00000000)'})
+
+    def test_snapshot_is_refreshed_after_save(self):
+        person = PersonSnapshotModel.objects.get()
+        person.name = 'Bar'
+        person.save()
+        person.name = 'John'
+
+        with CaptureQueriesContext(connection) as context:
+            person.save()
+        self.assertNoSelect(context)
+
+        diff = Geomodeldiff.objects.order_by('-id')[0]
+        self.assertEqual(json.loads(diff.old_data)['name'], 'Bar')
+        self.assertEqual(json.loads(diff.new_data), {'name': 'John'})
+
+    def test_deferred_fields_fall_back_to_database(self):
+        person = PersonSnapshotModel.objects.only('id').get()
+        self.assertFalse(hasattr(person, '_modeldiff_snapshot'))
+
+        person.name = 'Bar'
+        person.save()
+
+        diff = Geomodeldiff.objects.order_by('-id')[0]
+        self.assertEqual(json.loads(diff.old_data)['name'], 'Foo')
+        self.assertEqual(json.loads(diff.new_data), {'name': 'Bar'})
+
+    def test_partial_refresh_drops_snapshot(self):
+        person = PersonSnapshotModel.objects.get()
+        person.refresh_from_db(fields=['name'])
+        self.assertFalse(hasattr(person, '_modeldiff_snapshot'))
+
+    def test_update_fields_only_refresh_their_values(self):
+        person = PersonSnapshotModel.objects.get()
+        person.name = 'Bar'
+        person.birthdate = date(2010, 1, 1)
+        person.save(update_fields=['name'])
+        # birthdate was not written, the next save records it
+        person.save()
+
+        diff = Geomodeldiff.objects.order_by('-id')[0]
+        self.assertEqual(json.loads(diff.new_data),
+                         {'birthdate': '2010-01-01'})
+        self.assertEqual(json.loads(diff.old_data)['birthdate'],
+                         '2007-12-05')
+
+    def test_bulk_operations_invalidate_snapshots(self):
+        with mock.patch.object(PersonModel.Modeldiff, 'snapshot', True,
+                               create=True):
+            PersonModel.objects.create(
+                name='Foo',
+                updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+            person = PersonModel.objects.get()
+            PersonModel.objects.update(name='Bar')
+            person.name = 'John'
+            person.save()
+
+        diff = Modeldiff.objects.order_by('-id')[0]
+        self.assertEqual(json.loads(diff.old_data)['name'], 'Bar')
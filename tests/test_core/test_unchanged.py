@@ -0,0 +1,140 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from datetime import date, datetime, timezone
+from unittest import mock
+
+import json
+
+from core.models import (PersonGeoModel, PersonModel, PersonPropertyModel,
+                         PropertyRoomModel)
+from modeldiff import models as modeldiff_models
+from modeldiff.models import Geomodeldiff, Modeldiff
+
+
+def skip_unchanged(model, value=True):
+    return mock.patch.object(model.Modeldiff, 'skip_unchanged', value,
+                             create=True)
+
+
+class UnchangedTests(TestCase):
+
+    def setUp(self):
+        self.person = PersonModel.objects.create(
+            name='Foo', surname='Doe', birthdate=date(2007, 12, 5),
+            updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+        Modeldiff.objects.all().delete()
+        self.stats = mock.patch.dict(modeldiff_models.unchanged_stats,
+                                     {'diffs': 0, 'saves': 0})
+        self.stats.start()
+        self.addCleanup(self.stats.stop)
+
+    def test_unchanged_diff_written_by_default(self):
+        self.person.save()
+
+        self.assertEqual(Modeldiff.objects.get().new_data, '{}')
+
+    def test_skip_diff(self):
+        with skip_unchanged(PersonModel):
+            # original object, update
+            with self.assertNumQueries(2):
+                self.person.save()
+            self.person.name = 'Bar'
+            self.person.save()
+
+        self.assertEqual(Modeldiff.objects.get().changed_fields, ['name'])
+        self.assertEqual(modeldiff_models.unchanged_stats,
+                         {'diffs': 1, 'saves': 0})
+
+    def test_skip_save(self):
+        with skip_unchanged(PersonModel, 'save'):
+            # original object only
+            with self.assertNumQueries(1):
+                self.person.save()
+
+        self.assertFalse(Modeldiff.objects.exists())
+        self.assertEqual(modeldiff_models.unchanged_stats,
+                         {'diffs': 1, 'saves': 1})
+
+    def test_untracked_change_saved(self):
+        prop = PersonPropertyModel.objects.create(person=self.person,
+                                                  address='Carme 15')
+        room = PropertyRoomModel.objects.create(property=prop, name='Bath')
+        Modeldiff.objects.all().delete()
+
+        with skip_unchanged(PropertyRoomModel, 'save'):
+            room.area = 12
+            room.save()
+            room.save(update_fields=['area'])
+            room.name = 'Kitchen'
+            room.save(update_fields=['area'])
+
+        self.assertEqual(PropertyRoomModel.objects.get().area, 12)
+        self.assertEqual(PropertyRoomModel.objects.get().name, 'Bath')
+        self.assertFalse(Modeldiff.objects.exists())
+        self.assertEqual(modeldiff_models.unchanged_stats,
+                         {'diffs': 3, 'saves': 2})
+
+    def test_parent_touch_not_skipped(self):
+        with skip_unchanged(PersonModel, 'save'):
+            PersonPropertyModel.objects.create(person=self.person,
+                                               address='Carme 15')
+
+        diff = Modeldiff.objects.get(model_name='modeldiff.PersonModel')
+        self.assertEqual((diff.action, diff.new_data), ('update', '{}'))
+
+    def test_geometry_unchanged(self):
+        person = PersonGeoModel.objects.create(
+            name='Foo', the_geom='POINT (1 2)',
+            updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+        person = PersonGeoModel.objects.get(pk=person.pk)
+        person.the_geom = 'POINT (1.000000001 2)'
+        with skip_unchanged(PersonGeoModel):
+            person.save()
+
+        self.assertEqual(Geomodeldiff.objects.count(), 1)
+
+
+class UpdateFieldsTests(TestCase):
+
+    def setUp(self):
+        self.person = PersonModel.objects.create(
+            name='Foo', surname='Doe',
+            updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+
+    def test_only_update_fields_loaded(self):
+        self.person.name = 'Bar'
+        self.person.surname = 'Roe'
+        with CaptureQueriesContext(connection) as queries:
+            self.person.save(update_fields=['name'])
+
+        select = queries[0]['sql']
+        self.assertIn('"name"', select)
+        self.assertNotIn('"surname"', select)
+        diff = Modeldiff.objects.last()
+        self.assertEqual(json.loads(diff.new_data), {'name': 'Bar'})
+        # surname was not written, its unsaved value is not recorded
+        self.assertEqual(json.loads(diff.old_data), {'name': 'Foo'})
+
+    def test_empty_update_fields(self):
+        PersonPropertyModel.objects.create(person=self.person,
+                                           address='Carme 15')
+        prop = PersonPropertyModel.objects.get()
+        Modeldiff.objects.all().delete()
+
+        prop.address = 'Carme 16'
+        with self.assertNumQueries(0):
+            prop.save(update_fields=[])
+
+        self.assertFalse(Modeldiff.objects.exists())
+        self.assertEqual(PersonPropertyModel.objects.get().address,
+                         'Carme 15')
+
+    def test_change_outside_update_fields(self):
+        self.person.surname = 'Roe'
+        with skip_unchanged(PersonModel, 'save'):
+            with self.assertNumQueries(1):
+                self.person.save(update_fields=['name'])
+
+        self.assertEqual(Modeldiff.objects.count(), 1)
+        self.assertEqual(PersonModel.objects.get().surname, 'Doe')
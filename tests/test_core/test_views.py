@@ -0,0 +1,128 @@
+from django.contrib.auth.models import Permission, User
+from django.contrib.gis.geos import Point
+from django.test import TestCase
+from django.urls import reverse
+from datetime import datetime, timezone
+
+import gzip
+import json
+
+from core.models import PersonModel, PersonGeoModel
+from modeldiff.compact import compact_history
+from modeldiff.models import Modeldiff
+
+
+class ChangesViewTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('sync', password='sync')
+        user.user_permissions.add(
+            Permission.objects.get(codename='view_modeldiff'),
+            Permission.objects.get(codename='view_geomodeldiff'))
+        self.client.force_login(user)
+        for name in ('Foo', 'Bar', 'John'):
+            PersonModel.objects.create(
+                name=name,
+                updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+        self.ids = list(Modeldiff.objects.order_by('id').values_list(
+            'id', flat=True))
+
+    def get_rows(self, response):
+        content = b''.join(response.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_keyset_pages(self):
+        url = reverse('modeldiff:changes')
+
+        response = self.client.get(url, {'limit': 2})
+        rows = self.get_rows(response)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([row['id'] for row in rows], self.ids[:2])
+
+        response = self.client.get(url, {'since': rows[-1]['id'],
+                                         'limit': 2})
+        rows = self.get_rows(response)
+        self.assertEqual([row['id'] for row in rows], self.ids[2:])
+        self.assertEqual(json.loads(rows[0]['new_data'])['name'], 'John')
+
+        response = self.client.get(url, {'since': rows[-1]['id']})
+        self.assertEqual(self.get_rows(response), [])
+
+    def test_key(self):
+        Modeldiff.objects.filter(id=self.ids[0]).update(key='remote')
+
+        response = self.client.get(reverse('modeldiff:changes'),
+                                   {'key': 'remote'})
+
+        self.assertEqual([row['id'] for row in self.get_rows(response)],
+                         self.ids[:1])
+
+    def test_etag(self):
+        url = reverse('modeldiff:changes')
+        response = self.client.get(url, {'since': self.ids[-1]})
+        etag = response['ETag']
+
+        with self.assertNumQueries(5):
+            # session, user, 2 for the permissions and the page state
+            response = self.client.get(url, {'since': self.ids[-1]},
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        PersonModel.objects.create(
+            name='Other', updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+        response = self.client.get(url, {'since': self.ids[-1]},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.get_rows(response)), 1)
+
+    def test_etag_rewritten_diffs(self):
+        url = reverse('modeldiff:changes')
+        etag = self.client.get(url)['ETag']
+
+        Modeldiff.objects.filter(id=self.ids[0]).update(applied=False)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        person = PersonModel.objects.get(name='John')
+        person.name = 'Other'
+        person.save()
+        etag = self.client.get(url)['ETag']
+        # the add and update of John squashed in the update, same last id
+        compact_history(Modeldiff.objects.all())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.get_rows(response)), 3)
+
+    def test_gzip(self):
+        response = self.client.get(reverse('modeldiff:changes'),
+                                   HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        content = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(len(content.splitlines()), 3)
+
+    def test_geometry(self):
+        PersonGeoModel.objects.create(
+            name='Foo', updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc),
+            the_geom=Point(1, 2, srid=4326))
+
+        response = self.client.get(reverse('modeldiff:geochanges'))
+
+        self.assertEqual(self.get_rows(response)[0]['the_geom'],
+                         'POINT (1 2)')
+
+    def test_bad_request(self):
+        response = self.client.get(reverse('modeldiff:changes'),
+                                   {'since': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_out_of_range(self):
+        for params in ({'limit': -5}, {'limit': 0}, {'since': -1}):
+            response = self.client.get(reverse('modeldiff:changes'), params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_permission(self):
+        self.client.logout()
+        response = self.client.get(reverse('modeldiff:changes'))
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,104 @@
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase, override_settings
+from datetime import datetime, timezone
+from unittest import mock
+
+from core.models import PersonModel
+from modeldiff import writer
+from modeldiff.models import Modeldiff
+from modeldiff.writer import AsyncDiffWriter
+
+
+class AsyncDiffWriterTests(TransactionTestCase):
+
+    def setUp(self):
+        writer._writer = None
+
+    def tearDown(self):
+        writer._writer.stop()
+        writer._writer = None
+
+    @override_settings(MODELDIFF_ASYNC_WRITER={'batch_size': 10})
+    def test_diffs_written_by_the_worker(self):
+        for name in ('Foo', 'Bar', 'John'):
+            PersonModel.objects.create(
+                name=name,
+                updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+
+        diff_writer = writer.get_writer()
+        diff_writer.flush()
+
+        self.assertEqual(Modeldiff.objects.filter(action='add').count(), 3)
+        metrics = diff_writer.get_metrics()
+        self.assertEqual(metrics['queued'], 3)
+        self.assertEqual(metrics['written'], 3)
+        self.assertEqual(metrics['queue_depth'], 0)
+
+
+class AsyncDiffWriterQueueTests(TestCase):
+
+    def test_full_queue_drops_diffs(self):
+        diff_writer = AsyncDiffWriter(max_queue_size=1, block_timeout=0)
+        # no worker, nothing is taken from the queue
+        diff_writer.start = lambda: None
+
+        diff_writer.put([Modeldiff(), Modeldiff(), Modeldiff()])
+
+        metrics = diff_writer.get_metrics()
+        self.assertEqual(metrics['queued'], 1)
+        self.assertEqual(metrics['blocked'], 2)
+        self.assertEqual(metrics['dropped'], 2)
+        self.assertEqual(metrics['queue_depth'], 1)
+
+    @override_settings(MODELDIFF_ASYNC_WRITER={'batch_size': 10})
+    def test_rolled_back_diffs_are_not_queued(self):
+        writer._writer = None
+        PersonModel.objects.create(
+            name='Foo', updated_at=datetime(2015, 1, 7, tzinfo=timezone.utc))
+
+        # TestCase never commits
+        self.assertEqual(writer.get_writer().get_metrics()['queued'], 0)
+        writer._writer = None
+
+
+class AsyncDiffWriterRetryTests(TransactionTestCase):
+    # write() runs in autocommit like the worker: close_old_connections()
+    # drops the connection of a TestCase transaction
+
+    def flaky_bulk_create(self, failures):
+        bulk_create = Modeldiff.objects.bulk_create
+        calls = []
+
+        def flaky(diffs):
+            calls.append(len(diffs))
+            if len(calls) <= failures:
+                raise DatabaseError('server closed the connection')
+            return bulk_create(diffs)
+        return mock.patch.object(Modeldiff.objects, 'bulk_create', flaky)
+
+    def new_diffs(self, count):
+        return [Modeldiff(model_name='modeldiff.PersonModel', action='add',
+                          new_data='{}') for i in range(count)]
+
+    def test_failed_batch_retried(self):
+        diff_writer = AsyncDiffWriter(retry_delay=0)
+
+        with self.flaky_bulk_create(2):
+            diff_writer.write(self.new_diffs(2))
+
+        self.assertEqual(Modeldiff.objects.count(), 2)
+        metrics = diff_writer.get_metrics()
+        self.assertEqual(metrics['retried'], 4)
+        self.assertEqual(metrics['written'], 2)
+        self.assertEqual(metrics['failed'], 0)
+
+    def test_failed_batch_dropped_after_retries(self):
+        diff_writer = AsyncDiffWriter(retries=1, retry_delay=0)
+
+        with self.flaky_bulk_create(2), self.assertLogs('modeldiff.writer'):
+            diff_writer.write(self.new_diffs(2))
+
+        self.assertFalse(Modeldiff.objects.exists())
+        metrics = diff_writer.get_metrics()
+        self.assertEqual(metrics['retried'], 2)
+        self.assertEqual(metrics['failed'], 2)